@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark NwbData.add_stimulus_timeseries against the previous iterrows/mask implementation.
+
+Builds a synthetic oddball-like session (several trials, thousands of stimulus presentations,
+some overlapping) and checks that both implementations produce identical frame-wise features
+before timing them.
+
+Usage:
+    python code/benchmarks/bench_add_stimulus_timeseries.py --trials 4 --stimuli 3000 --rate 200
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from nwb_io.load import NwbData
+
+FEATURES = ('orientation', 'contrast', 'x_position', 'y_position', 'delay',
+            'diameter', 'spatial_frequency', 'temporal_frequency')
+
+
+def legacy_add_stimulus_timeseries(dFoverF_data, stim_df, features=FEATURES):
+    stim_df = stim_df.copy()
+    stim_df['trial'] = stim_df['trial'].astype(int)
+
+    for trial_id, trial_data in dFoverF_data.items():
+        t = trial_data['time']
+        stim_ts = {feat: np.full_like(t, np.nan, dtype=float) for feat in features}
+
+        trial_stimuli = stim_df[stim_df['trial'] == trial_id]
+
+        for _, row in trial_stimuli.iterrows():
+            stim_mask = (t >= row['start_time']) & (t <= row['stop_time'])
+            for feat in features:
+                stim_ts[feat][stim_mask] = row[feat]
+
+        dFoverF_data[trial_id]['stim_ts'] = stim_ts
+
+    return dFoverF_data
+
+
+def make_session(n_trials, n_stimuli, rate, seed=0):
+    rng = np.random.default_rng(seed)
+    dff_data = {}
+    rows = []
+    offset = 0.0
+    for trial_id in range(1, n_trials + 1):
+        # 343 ms gratings with ~1 s delays, plus occasional overlapping presentations
+        durations = np.full(n_stimuli, 0.343)
+        gaps = rng.choice([1.0, 0.0, -0.1], size=n_stimuli, p=[0.9, 0.05, 0.05])
+        starts = offset + 0.5 + np.concatenate([[0.0], np.cumsum(durations + gaps)[:-1]])
+        stops = starts + durations
+        t = np.arange(offset, stops[-1] + 1.0, 1.0 / rate)
+        dff_data[trial_id] = {'time': t}
+
+        for start, stop in zip(starts, stops):
+            row = {'start_time': start, 'stop_time': stop, 'trial': trial_id}
+            row.update({feat: rng.choice([0.0, 45.0, 90.0]) for feat in FEATURES})
+            rows.append(row)
+        offset = t[-1] + 10.0
+    return dff_data, pd.DataFrame(rows)
+
+
+def copy_session(dff_data):
+    return {trial_id: {'time': trial_data['time']} for trial_id, trial_data in dff_data.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark add_stimulus_timeseries')
+    parser.add_argument('--trials', type=int, default=4, help='Number of trials')
+    parser.add_argument('--stimuli', type=int, default=3000, help='Stimulus presentations per trial')
+    parser.add_argument('--rate', type=float, default=200.0, help='Frame rate (Hz)')
+    parser.add_argument('--repeats', type=int, default=3, help='Timing repeats for the vectorized path')
+    args = parser.parse_args()
+
+    dff_data, stim_df = make_session(args.trials, args.stimuli, args.rate)
+    n_frames = sum(len(d['time']) for d in dff_data.values())
+    print(f"{args.trials} trials, {len(stim_df)} stimuli, {n_frames} frames, {len(FEATURES)} features")
+
+    tic = time.perf_counter()
+    legacy = legacy_add_stimulus_timeseries(copy_session(dff_data), stim_df)
+    legacy_s = time.perf_counter() - tic
+
+    nwb = NwbData(None)
+    vectorized_s = np.inf
+    for _ in range(args.repeats):
+        tic = time.perf_counter()
+        vectorized = nwb.add_stimulus_timeseries(copy_session(dff_data), stim_df, features=FEATURES)
+        vectorized_s = min(vectorized_s, time.perf_counter() - tic)
+
+    for trial_id in dff_data:
+        for feat in FEATURES:
+            np.testing.assert_array_equal(legacy[trial_id]['stim_ts'][feat], vectorized[trial_id]['stim_ts'][feat])
+
+    print(f"iterrows masks: {legacy_s:8.3f} s")
+    print(f"vectorized    : {vectorized_s:8.3f} s")
+    print(f"speedup       : {legacy_s / vectorized_s:8.1f}x (outputs identical)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Benchmark the start-up cost of the nwb_io package and the data-access CLIs.
+
+Every case runs in a fresh interpreter, so the numbers include the module search over
+sys.path that makes each import expensive on a network filesystem. For each case the
+script reports the median wall time and which heavy dependencies ended up imported.
+
+Usage:
+    python code/benchmarks/bench_import_time.py --repeats 5
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+CODE_DIR = Path(__file__).resolve().parents[1]
+HEAVY_MODULES = ('numpy', 'pandas', 'h5py', 'pynwb', 'matplotlib', 'seaborn')
+
+# Statements run with code/ on sys.path
+IMPORT_CASES = {
+    'import nwb_io': 'import nwb_io',
+    'from nwb_io import NwbData': 'from nwb_io import NwbData',
+    'from nwb_io.export import ExportedSession': 'from nwb_io.export import ExportedSession',
+}
+
+# Scripts run with --help
+CLI_CASES = {
+    'nwb_io.export --help': ['-m', 'nwb_io.export', '--help'],
+    'validate_nwb_slap2.py --help': [str(CODE_DIR / 'data-access' / 'validate_nwb_slap2.py'), '--help'],
+}
+
+_REPORT = "; import sys; print(','.join(m for m in {mods!r} if m in sys.modules))"
+
+
+def _time_command(args, repeats):
+    times = []
+    for _ in range(repeats):
+        tic = time.perf_counter()
+        subprocess.run([sys.executable] + args, cwd=CODE_DIR, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - tic)
+    return statistics.median(times)
+
+
+def _loaded_modules(statement):
+    out = subprocess.run([sys.executable, '-c', statement + _REPORT.format(mods=HEAVY_MODULES)],
+                         cwd=CODE_DIR, check=True, capture_output=True, text=True)
+    return out.stdout.strip() or '-'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark nwb_io import and CLI start-up time')
+    parser.add_argument('--repeats', type=int, default=5, help='Runs per case (median is reported)')
+    args = parser.parse_args()
+
+    baseline = _time_command(['-c', 'pass'], args.repeats)
+    print(f"{'case':45s} {'median (ms)':>12s} {'- python':>10s}  heavy modules loaded")
+    print(f"{'python -c pass':45s} {baseline * 1000:12.1f} {0.0:10.1f}")
+
+    for name, statement in IMPORT_CASES.items():
+        t = _time_command(['-c', statement], args.repeats)
+        print(f"{name:45s} {t * 1000:12.1f} {(t - baseline) * 1000:10.1f}  {_loaded_modules(statement)}")
+
+    for name, cli_args in CLI_CASES.items():
+        t = _time_command(cli_args, args.repeats)
+        print(f"{name:45s} {t * 1000:12.1f} {(t - baseline) * 1000:10.1f}")
+
+
+if __name__ == "__main__":
+    main()
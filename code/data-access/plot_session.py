@@ -1,102 +1,123 @@
-import harp
+"""
+Plot the streams of a Harp behavior session: photodiode with its detected flips, wheel encoder,
+running speed, digital outputs, and display latencies when the stimulus onsets are known.
+
+The script puts the ``code/`` folder of its checkout on ``sys.path`` to import ``nwb_io``, so it
+runs from any working directory. It analyzes the ``.harp`` folder set under ``__main__`` (edit
+it first) and writes the plots to its ``stream_plots`` subfolder::
+
+    python code/data-access/plot_session.py
+
+From a notebook or script with ``code/data-access`` on its path, call
+``analyze_session(Path(...))`` instead.
+"""
+
+import sys
 from pathlib import Path
 import matplotlib.pyplot as plt
 import numpy as np
-import requests, yaml, io
-
-def _get_yml_from_who_am_i(who_am_i: int, release: str = "main") -> io.BytesIO:
-    try:
-        device = _get_who_am_i_list()[who_am_i]
-    except KeyError as e:
-        raise KeyError(f"WhoAmI {who_am_i} not found in whoami.yml") from e
-
-    repository_url = device.get("repositoryUrl", None)
-
-    if repository_url is None:
-        raise ValueError("Device's repositoryUrl not found in whoami.yml")
-    else:  # attempt to get the device.yml from the repository
-        _repo_hint_paths = [
-            "{repository_url}/{release}/device.yml",
-            "{repository_url}/{release}/software/bonsai/device.yml",
-        ]
-
-        yml = None
-        for hint in _repo_hint_paths:
-            url = hint.format(repository_url=repository_url, release=release)
-            if "github.com" in url:
-                url = url.replace("github.com", "raw.githubusercontent.com")
-            response = requests.get(url, allow_redirects=True, timeout=5)
-            if response.status_code == 200:
-                yml = io.BytesIO(response.content)
-                break
-        if yml is None:
-            raise FileNotFoundError("device.yml not found in any repository")
-        else:
-            return yml
-
-def _get_who_am_i_list(url: str = "https://raw.githubusercontent.com/harp-tech/protocol/main/whoami.yml"):
-    response = requests.get(url, allow_redirects=True, timeout=5)
-    content = response.content.decode("utf-8")
-    content = yaml.safe_load(content)
-    devices = content["devices"]
-    return devices
-
-
-def fetch_yml(harp_path):
-    with open(harp_path / 'Behavior_0.bin',mode='rb') as reg_0:
-        who_am_i = int(harp.read(reg_0).values[0][0])
-        yml_bytes = _get_yml_from_who_am_i(who_am_i)
-    yaml_content = yml_bytes.getvalue()
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from nwb_io.decimate import axis_max_points, decimate_trace
+from nwb_io.harp_bin import HarpDevice, HarpRegister
+from nwb_io.harp_registry import default_registry
+from nwb_io.overlays import add_events
+from nwb_io.photodiode import detect_flips, match_onsets
+from nwb_io.wheel import running_speed
+
+
+def fetch_yml(harp_path, registry=None):
+    # device.yml of the device that recorded harp_path, resolved through the local device registry
+    # (see nwb_io.harp_registry), so only the first session of a device goes to GitHub
+    registry = registry or default_registry()
+    who_am_i = int(HarpRegister(harp_path / 'Behavior_0.bin').read()[1][0, 0])
+    yaml_content = registry.device_yml(who_am_i)
     with open(harp_path / "device.yml", "wb") as f:
         f.write(yaml_content)
     return harp_path / "device.yml"
 
 
-def analyze_session(harp_path):
+def plot_stream(ax, t, y, max_points='axis'):
+    # Line of a stream reduced to max_points samples; 'axis' sizes it from the pixel width of ax
+    # once saved (see nwb_io.decimate.axis_max_points)
+    if max_points == 'axis':
+        max_points = axis_max_points(ax)
+    return ax.plot(*decimate_trace(t, y, max_points))
+
+
+def analyze_session(harp_path, max_points='axis', onsets=None, max_latency=0.1, cm_per_count=None):
+    # Streams longer than max_points samples are plotted as their min/max envelope, by default
+    # two samples per pixel column of the axis (None plots every sample).
+    # With the expected stimulus onsets (seconds, Harp clock), the photodiode flips are matched to them
+    # and the display latency of every stimulus (at most max_latency) is plotted.
+    # The running speed is plotted in cm/s with the wheel calibration cm_per_count (see nwb_io.wheel),
+    # else in encoder counts/s.
     print(f"analyzing session at harp path {harp_path}")
     if not (harp_path / "device.yml").exists():
-        print("device.yml not found, fetching from the web")
+        print("device.yml not found, fetching it from the device registry")
         deviceyml_path = fetch_yml(harp_path)
         print(f"device.yml made at {deviceyml_path}")
 
-    reader = harp.create_reader(harp_path)
+    # Register files are memory-mapped and decoded to plain arrays, see nwb_io.harp_bin
+    device = HarpDevice(harp_path)
     print("made reader with the following registers:")
-    for r in reader.registers.keys():
+    for r in device.registers.keys():
         print(r)
 
     plots_dir = harp_path / "stream_plots"
     plots_dir.mkdir(exist_ok=True)
 
-    analogData = reader.AnalogData.read()
-    analog_times = analogData.index.to_numpy()
-    analog_times = analog_times - analog_times[0]
-    photodiode_arr = analogData["AnalogInput0"].to_numpy()
-    wheel_arr = analogData["Encoder"].to_numpy()
+    analog_times, analog = device.register('AnalogData').channels(['AnalogInput0', 'Encoder'])
+    photodiode_arr = analog['AnalogInput0']
+    wheel_arr = analog['Encoder']
+
+    flip_times, _ = detect_flips(photodiode_arr, analog_times)
+    print(f"{len(flip_times)} photodiode flips detected")
+    if onsets is not None:
+        _, latency = match_onsets(flip_times, onsets, max_latency)
+        print(f"{np.isfinite(latency).sum()}/{len(latency)} stimulus onsets matched to a flip, "
+              f"median display latency {np.nanmedian(latency) * 1000:.1f} ms")
+        fig, ax = plt.subplots()
+        ax.hist(latency[np.isfinite(latency)] * 1000, bins=50)
+        ax.set_xlabel('Display latency (ms)')
+        fig.savefig(plots_dir / 'display_latency.png')
+
+    t_start = analog_times[0]
+    flip_times = flip_times - t_start
+    analog_times = analog_times - t_start
 
     fig, ax = plt.subplots()
-    ax.plot(analog_times,photodiode_arr)
+    plot_stream(ax, analog_times, photodiode_arr, max_points)
+    add_events(ax, flip_times, colors='tab:red', linewidth=0.5, alpha=0.5)
     fig.savefig(plots_dir / 'photodiode.png')
 
     fig, ax = plt.subplots()
-    ax.plot(analog_times,wheel_arr)
+    plot_stream(ax, analog_times, wheel_arr, max_points)
     fig.savefig(plots_dir / 'wheel.png')
 
-    PulseDO0 = reader.PulseDO0.read()
+    # Streamed block by block from the register file, see nwb_io.wheel
+    encoder_blocks = ((t - t_start, ch['Encoder']) for t, ch in device.register('AnalogData').blocks(['Encoder']))
+    speed_times, speed = running_speed(encoder_blocks, cm_per_count or 1.0)
+    fig, ax = plt.subplots()
+    plot_stream(ax, speed_times, speed, max_points)
+    ax.set_ylabel('Running speed (cm/s)' if cm_per_count else 'Running speed (counts/s)')
+    fig.savefig(plots_dir / 'running_speed.png')
+
+    PulseDO0 = device.register('PulseDO0')
     print(PulseDO0)
-    do0_arr = PulseDO0["PulseDO0"].to_numpy()
-    do0_times = PulseDO0.index.to_numpy()
+    do0_times, do0_arr = PulseDO0.channel('PulseDO0')
     fig, ax = plt.subplots()
-    ax.plot(do0_times, do0_arr)
+    plot_stream(ax, do0_times, do0_arr, max_points)
     fig.savefig(plots_dir / 'do0.png')
 
-    PulseDO1 = reader.PulseDO1.read()
+    PulseDO1 = device.register('PulseDO1')
     print(PulseDO1)
-    do1_arr = PulseDO1["PulseDO1"].to_numpy()
-    do1_times = PulseDO1.index.to_numpy()
+    do1_times, do1_arr = PulseDO1.channel('PulseDO1')
     fig, ax = plt.subplots()
-    ax.plot(do1_times, do1_arr)
+    plot_stream(ax, do1_times, do1_arr, max_points)
     fig.savefig(plots_dir / 'do1.png')
 
 
-harp_path = Path(r"\\allen\aind\scratch\OpenScope\Slap2\Data\787727\20250320025428\BonsaiData\20241009_366122_Behavior.harp")
-analyze_session(harp_path)
\ No newline at end of file
+if __name__ == "__main__":
+    harp_path = Path(r"\\allen\aind\scratch\OpenScope\Slap2\Data\787727\20250320025428\BonsaiData\20241009_366122_Behavior.harp")
+    analyze_session(harp_path)
\ No newline at end of file
@@ -7,33 +7,68 @@ This script reads a SLAP2 NWB file and creates validation plots similar to those
 created by the original load_slap2.py script, but directly from the NWB file
 using pynwb instead of the original SLAP2 code.
 
+Plotting happens in two phases: the arrays each figure needs are first read from the
+NWB file in the main process, then the figures are rendered in a pool of worker
+processes with the Agg backend and the object-oriented Figure API (no pyplot state).
+
 Author: GitHub Copilot (based on original SLAP2 code by Jerome Lecoq)
 """
 
+import contextlib
+import csv
+import hashlib
+import json
+import multiprocessing
+import multiprocessing.connection
 import os
+import signal
 import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import cache, partial
 from pathlib import Path
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-from matplotlib import colors as mcolors
 import argparse
-from matplotlib.colors import LinearSegmentedColormap
 
-# Import PyNWB modules
-from pynwb import NWBHDF5IO
-from pynwb.ophys import TwoPhotonSeries, OpticalChannel, ImageSegmentation, Fluorescence, DfOverF, RoiResponseSeries
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from nwb_io.batch import resolve_paths
+from nwb_io.cache import SessionCache, file_fingerprint
+from nwb_io.decimate import DEFAULT_MAX_POINTS, minmax_envelope
+from nwb_io.frames import FRAME_MODES, read_frame
+from nwb_io.imports import lazy_import
+from nwb_io.index import SessionIndex
+from nwb_io.masks import SparseRoiMasks
+from nwb_io.overlays import add_events, add_intervals
+from nwb_io.profiling import PROFILE_TOOLS, Profiler, function_profile
+from nwb_io.qc import TraceStats, roi_areas, stimulus_counts, summarize, timing_summary
+from nwb_io.raster import cached_trace_raster
+
+# Plotting and NWB modules are only imported once a plot is drawn, so --help stays fast
+pd = lazy_import('pandas')
+sns = lazy_import('seaborn')
+mcolors = lazy_import('matplotlib.colors')
+mcm = lazy_import('matplotlib.cm')
+
+# Version of the figure output, recorded with every rendered figure: bump it with any change that
+# alters what a figure looks like, so that the figures of earlier runs are drawn again
+RENDER_VERSION = 2
+
+# Stimulus table columns that are not parameters to label on the trace figures
+_UNLABELLED_COLUMNS = ('start_time', 'stop_time', 'id', 'tags', 'trial')
+# Stimulus parameter labels drawn per trial figure at most; a label is one matplotlib Text
+_MAX_STIMULUS_LABELS = 200
+
 
 def load_nwb_file(nwb_path):
     """
     Load an NWB file
-    
+
     Parameters
     ----------
     nwb_path : str
         Path to the NWB file
-        
+
     Returns
     -------
     nwbfile : NWBFile
@@ -41,65 +76,737 @@ def load_nwb_file(nwb_path):
     io : NWBHDF5IO
         The I/O object for the NWB file (needed to close the file properly)
     """
+    from pynwb import NWBHDF5IO
+
     io = NWBHDF5IO(nwb_path, 'r')
     nwbfile = io.read()
     return nwbfile, io
 
 
-def validate_nwb(nwb_path, output_dir=None):
+# NWB path of the stimulus table, recorded as an input of the figures drawn from it
+_STIMULUS_TABLE = 'intervals/stimulus_presentations'
+# 'heatmap': seaborn heatmap of the (min/max decimated) traces; 'raster': binned, optionally
+# z-scored ROI x time image drawn with imshow, cached between runs
+TRACE_MODES = ('heatmap', 'raster')
+# 'stages': per-stage wall time, bytes read and peak RSS written to PROFILE_TRACE; the profiling
+# tools also dump a function-level profile of the main process
+PROFILE_MODES = ('stages',) + PROFILE_TOOLS
+PROFILE_TRACE = 'profile.json'
+_PROFILE_DUMPS = {'cprofile': 'profile.prof', 'pyinstrument': 'profile.html'}
+
+
+class FigureJob:
+    """
+    One figure to render: ``render(**kwargs)`` builds a Figure that is saved to ``path``.
+
+    ``inputs`` lists the NWB objects the figure is drawn from. Arrays that are expensive to read
+    can be left to ``load``, a callable returning extra kwargs that is only called once the
+    figure is known to need rendering. ``render`` must be a module-level function and the
+    kwargs plain arrays, DataFrames and scalars, so that the job can be sent to a worker process.
+    """
+
+    __slots__ = ('path', 'render', 'inputs', 'load', 'kwargs')
+
+    def __init__(self, path, render, inputs=(), load=None, **kwargs):
+        self.path = path
+        self.render = render
+        self.inputs = list(inputs)
+        self.load = load
+        self.kwargs = kwargs
+
+    def resolved(self):
+        """This job with ``load`` called and its result merged into the kwargs."""
+        if self.load is None:
+            return self
+        return FigureJob(self.path, self.render, self.inputs, **self.kwargs, **self.load())
+
+
+class FigureResult:
+    """Outcome of rendering one FigureJob; ``error`` holds the traceback on failure."""
+
+    __slots__ = ('path', 'elapsed', 'error')
+
+    def __init__(self, path, elapsed=0.0, error=None):
+        self.path = path
+        self.elapsed = elapsed
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        status = 'ok' if self.ok else 'error'
+        return f"FigureResult(path={str(self.path)!r}, status={status}, elapsed={self.elapsed:.2f}s)"
+
+
+def _new_figure(**kwargs):
+    # Figure on its own Agg canvas; it is never registered with pyplot, so there is nothing to close
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(**kwargs)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def _init_render_worker():
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def _render_job(job):
+    tic = time.perf_counter()
+    try:
+        fig = job.render(**job.kwargs)
+        fig.savefig(job.path, dpi=150, bbox_inches='tight')
+        return FigureResult(job.path, elapsed=time.perf_counter() - tic)
+    except Exception:
+        return FigureResult(job.path, elapsed=time.perf_counter() - tic, error=traceback.format_exc())
+
+
+def render_figures(jobs, workers=None):
+    """
+    Render an iterable of FigureJobs, yielding a FigureResult as each figure is saved.
+
+    With more than one worker the figures are rendered in a process pool. ``jobs`` is consumed
+    lazily and at most two jobs per worker are in flight, so only the arrays of figures about to
+    be rendered are held in memory. ``workers=1`` renders in this process.
+    """
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1:
+        for job in jobs:
+            yield _render_job(job.resolved())
+        return
+
+    pending = iter(jobs)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_render_worker) as pool:
+        running = set()
+        for job in pending:
+            running.add(pool.submit(_render_job, job.resolved()))
+            if len(running) >= 2 * workers:
+                break
+
+        while running:
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+                job = next(pending, None)
+                if job is not None:
+                    running.add(pool.submit(_render_job, job.resolved()))
+
+
+def _render_all(jobs, workers=1, manifest=None):
+    # Render jobs, printing a warning for every figure that failed. With a manifest, figures it
+    # reports as up to date are skipped before their arrays are loaded, and results are recorded.
+    inputs = {}
+
+    def stale_jobs():
+        for job in jobs:
+            if manifest is not None and manifest.is_current(job):
+                manifest.skipped += 1
+                continue
+            inputs[job.path] = job.inputs
+            yield job
+
+    results = []
+    for result in render_figures(stale_jobs(), workers=workers):
+        if not result.ok:
+            print(f"Warning: Could not render {result.path}:\n{result.error}")
+        if manifest is not None:
+            manifest.record(result, inputs.pop(result.path))
+        results.append(result)
+    return results
+
+
+def print_figure_timings(results, output_dir, wall_time):
+    """Print the render time of every figure, slowest first, after the totals."""
+    print(f"Rendered {sum(r.ok for r in results)}/{len(results)} figures in {wall_time:.2f}s "
+          f"({sum(r.elapsed for r in results):.2f}s of render time)")
+    for result in sorted(results, key=lambda r: r.elapsed, reverse=True):
+        status = '' if result.ok else '  FAILED'
+        print(f"  {result.elapsed:7.2f}s  {os.path.relpath(result.path, output_dir)}{status}")
+
+
+def script_version(**options):
+    """
+    Hash of ``RENDER_VERSION`` and the rendering ``options``; a change to either invalidates every
+    recorded figure, while edits to the script that leave the figures alone do not.
+    """
+    digest = hashlib.sha1(repr((RENDER_VERSION, sorted(options.items()))).encode())
+    return digest.hexdigest()
+
+
+class ValidationManifest:
+    """
+    Record of the figures in a validation directory and the inputs they were rendered from.
+
+    ``validation_manifest.json`` maps every figure, by its path relative to the output directory,
+    to the fingerprint of the NWB file, the NWB objects it was drawn from and the render version.
+    A figure is up to date when the file exists and all three match the current run; ``complete``
+    is set once a run has rendered every figure without error. ``stages`` lists the figures of
+    every stage, so that a stage whose figures are all up to date is skipped before its jobs are
+    built. ``session`` keeps the counts of ``session_summary`` and ``qc`` the ``SessionQC``
+    entries, so that they can be reported without opening the file again.
+    """
+
+    FILENAME = 'validation_manifest.json'
+
+    def __init__(self, output_dir, fingerprint, version, reset=False):
+        self.output_dir = output_dir
+        self.fingerprint = fingerprint
+        self.version = version
+        self.skipped = 0
+        self.path = os.path.join(output_dir, self.FILENAME)
+        self.reset()
+        if not reset and os.path.exists(self.path):
+            self._data = self.read(output_dir)
+
+    def reset(self):
+        """Forget every recorded figure, so that all of them are rendered again."""
+        self._data = {'complete': False, 'figures': {}, 'stages': {}}
+
+    @classmethod
+    def read(cls, output_dir):
+        """The manifest of ``output_dir`` as a plain dict, or None if there is none."""
+        path = os.path.join(output_dir, cls.FILENAME)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    @property
+    def session(self):
+        return self._data.get('session')
+
+    @session.setter
+    def session(self, summary):
+        self._data['session'] = summary
+
+    @property
+    def qc(self):
+        return self._data.get('qc')
+
+    @qc.setter
+    def qc(self, entries):
+        self._data['qc'] = entries
+
+    def _key(self, path):
+        return os.path.relpath(path, self.output_dir)
+
+    def is_current(self, job):
+        entry = self._data['figures'].get(self._key(job.path))
+        return (entry is not None and os.path.exists(job.path) and entry['fingerprint'] == self.fingerprint
+                and entry['version'] == self.version and entry['inputs'] == job.inputs)
+
+    def _is_recorded(self, key):
+        entry = self._data['figures'].get(key)
+        return (entry is not None and entry['fingerprint'] == self.fingerprint and entry['version'] == self.version
+                and os.path.exists(os.path.join(self.output_dir, key)))
+
+    def is_complete(self):
+        """Whether a previous run with the same file and script rendered every figure, all still on disk."""
+        return self._data['complete'] and all(self._is_recorded(key) for key in self._data['figures'])
+
+    def is_stage_current(self, stage):
+        """Whether every figure of ``stage``, as listed by ``record_stage``, is up to date."""
+        keys = self._data.setdefault('stages', {}).get(stage)
+        return keys is not None and all(self._is_recorded(key) for key in keys)
+
+    def stage_figures(self, stage):
+        return len(self._data['stages'][stage])
+
+    def record_stage(self, stage, paths):
+        """List the figures of ``stage``; saved with the next figure or ``save``."""
+        self._data.setdefault('stages', {})[stage] = [self._key(path) for path in paths]
+
+    def record(self, result, inputs):
+        key = self._key(result.path)
+        if result.ok:
+            self._data['figures'][key] = {'fingerprint': self.fingerprint, 'inputs': inputs,
+                                          'version': self.version}
+        else:
+            self._data['figures'].pop(key, None)
+        self._data['complete'] = False
+        self.save()
+
+    def save(self, complete=False):
+        self._data['complete'] = complete
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._data, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+
+def _json_floats(values, decimals=4):
+    # Rounded list of floats with None in place of NaN/inf, for JSON
+    values = np.asarray(values, dtype=float)
+    return np.where(np.isfinite(values), np.round(values, decimals), None).tolist()
+
+
+class SessionQC:
+    """
+    Numeric QC metrics of a session, gathered from the arrays read to draw the figures.
+
+    Trace statistics (per-ROI SNR and NaN fraction) are accumulated while the traces are read for
+    the trial figures, timestamp jitter comes from the same timestamps, ROI areas from the
+    rasterized masks and stimulus counts from the stimulus table, so nothing is read twice.
+    ``entries`` is plain JSON and is kept in the validation manifest: the metrics of figures
+    skipped as up to date are those of the run that rendered them. ``write`` saves the compact
+    ``qc_metrics.json`` record next to the figures.
+    """
+
+    FILENAME = 'qc_metrics.json'
+    # Scalars of the record's "headline", also reported in batch summaries
+    HEADLINE = ('median_snr', 'nan_fraction', 'median_dt_ms', 'max_dt_std_ms', 'missing_frames', 'median_roi_area')
+
+    def __init__(self, fingerprint, entries=None):
+        if entries is None or entries.get('fingerprint') != fingerprint:
+            entries = {'fingerprint': fingerprint, 'series': {}, 'planes': {}, 'stimuli': None}
+        self.entries = entries
+
+    def add_series(self, name, stats, timestamps):
+        result = stats.result()
+        self.entries['series'][name] = {'n_frames': int(result['n_frames']),
+                                        'snr': _json_floats(result['snr']),
+                                        'nan_fraction': _json_floats(result['nan_fraction'], 6),
+                                        'timing': timing_summary(timestamps)}
+
+    def add_plane(self, name, areas):
+        self.entries['planes'][name] = {'areas': np.asarray(areas).tolist()}
+
+    def set_stimuli(self, counts):
+        self.entries['stimuli'] = counts
+
+    def record(self, session=None):
+        """The per-session metrics: distributions over all ROIs and series, then per series and plane."""
+        series, planes = self.entries['series'], self.entries['planes']
+
+        def floats(values):
+            return np.array(values, dtype=float)
+
+        snr = [floats(s['snr']) for s in series.values()]
+        nan_fraction = [floats(s['nan_fraction']) for s in series.values()]
+        n_frames = np.array([s['n_frames'] for s in series.values()])
+        timing = [s['timing'] for s in series.values()]
+        areas = [np.array(p['areas']) for p in planes.values()]
+
+        # Overall NaN fraction, every ROI weighted by its number of frames
+        nan_total = sum(float(np.nansum(f) * n) for f, n in zip(nan_fraction, n_frames))
+        n_samples = sum(len(f) * n for f, n in zip(nan_fraction, n_frames))
+
+        snr_summary = summarize(np.concatenate(snr) if snr else [])
+        timing_stats = {
+            'median_dt_ms': summarize([t.get('median_dt_ms', np.nan) for t in timing]),
+            'dt_std_ms': summarize([t.get('dt_std_ms', np.nan) for t in timing]),
+            'n_gaps': sum(t.get('n_gaps', 0) for t in timing),
+            'missing_frames': sum(t.get('missing_frames', 0) for t in timing),
+        }
+        area_summary = summarize(np.concatenate(areas) if areas else [])
+        headline = {
+            'median_snr': snr_summary.get('median'),
+            'nan_fraction': nan_total / n_samples if n_samples else None,
+            'median_dt_ms': timing_stats['median_dt_ms'].get('median'),
+            'max_dt_std_ms': timing_stats['dt_std_ms'].get('max'),
+            'missing_frames': timing_stats['missing_frames'],
+            'median_roi_area': area_summary.get('median'),
+        }
+
+        return {
+            'identifier': (session or {}).get('identifier'),
+            'fingerprint': self.entries['fingerprint'],
+            'headline': headline,
+            'n_series': len(series),
+            'n_rois': int(sum(len(s) for s in snr)),
+            'snr': snr_summary,
+            'timing': timing_stats,
+            'roi_area': area_summary,
+            'stimuli': self.entries['stimuli'],
+            'series': {name: {'n_frames': s['n_frames'], 'n_rois': len(s['snr']), 'snr': summarize(floats(s['snr'])),
+                              'nan_fraction': float(np.nanmean(floats(s['nan_fraction']))) if s['snr'] else None,
+                              'timing': s['timing'], 'snr_per_roi': s['snr']}
+                       for name, s in sorted(series.items())},
+            'planes': {name: {'n_rois': len(p['areas']), 'area': summarize(p['areas']), 'areas': p['areas']}
+                       for name, p in sorted(planes.items())},
+        }
+
+    def write(self, output_dir, session=None):
+        path = os.path.join(output_dir, self.FILENAME)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.record(session), f, indent=1)
+        os.replace(path + '.tmp', path)
+        return path
+
+
+def validate_nwb(nwb_path, output_dir=None, workers=None, force=False, max_points=DEFAULT_MAX_POINTS,
+                 frame_mode='first', n_frames=None, trace_mode='heatmap', clim=None, zscore=True,
+                 raster_cache=None, profile=None):
     """
     Validate an NWB file by creating plots
-    
+
+    Figures already rendered from the same file by the same version of this script are kept,
+    see ``ValidationManifest``. QC metrics gathered along the way are written to
+    ``qc_metrics.json``, see ``SessionQC``.
+
     Parameters
     ----------
     nwb_path : str
         Path to the NWB file
     output_dir : str, optional
         Path to the output directory for plots
-        
+    workers : int, optional
+        Number of processes rendering figures (default: number of CPUs; 1 renders in this process)
+    force : bool, optional
+        Regenerate every figure, even those that are up to date
+    max_points : int, optional
+        Trace columns kept per trial figure; longer traces are drawn as a min/max envelope
+        (None keeps every frame)
+    frame_mode : {'first', 'mean', 'max'}, optional
+        Image shown for each summary ImageSeries: its first frame, or the mean or maximum
+        projection of its first ``n_frames`` frames (all frames if None)
+    n_frames : int, optional
+        Frames used by the 'mean' and 'max' projections
+    trace_mode : {'heatmap', 'raster'}, optional
+        Trial traces drawn as a seaborn heatmap, or as ROI x time rasters binned to ``max_points``
+        columns and drawn with imshow
+    clim : tuple of float, optional
+        Color limits of the rasters (default: (-3, 3) when z-scored, else (0, 2))
+    zscore : bool, optional
+        Z-score every ROI of the rasters over the whole series
+    raster_cache : str, optional
+        Directory caching the binned rasters, so that they are not read from the NWB file again
+        (default: "raster_cache" in the output directory)
+    profile : {'stages', 'cprofile', 'pyinstrument'}, optional
+        Write the wall time, bytes read and peak RSS of every stage (NWB open, metadata,
+        stimulus, summary images, traces, masks, and rendering) to ``profile.json`` as a summary
+        and a Chrome trace; 'cprofile' and 'pyinstrument' also dump a function-level profile of
+        the main process to ``profile.prof`` or ``profile.html``. Figures rendered by worker
+        processes only contribute their render time, so profile with ``workers=1`` to see them.
+
     Returns
     -------
     output_dir : str
         Path to the output directory where plots were saved
     """
+    if trace_mode not in TRACE_MODES:
+        raise ValueError(f"Unknown trace mode {trace_mode!r}; use one of {TRACE_MODES}")
+    if profile is not None and profile not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode {profile!r}; use one of {PROFILE_MODES}")
+
     # Set default output directory if not provided
     if output_dir is None:
         output_dir = os.path.join(os.path.dirname(nwb_path), 'validation')
-    
+
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
-    
-    # Load NWB file
-    nwbfile, io = load_nwb_file(nwb_path)
-    
+
+    profiler = Profiler(enabled=profile is not None)
+    dump = (function_profile(os.path.join(output_dir, _PROFILE_DUMPS[profile]), profile)
+            if profile in _PROFILE_DUMPS else contextlib.nullcontext())
     try:
+        with dump:
+            _validate_nwb(nwb_path, output_dir, workers, force, profiler, max_points=max_points,
+                          frame_mode=frame_mode, n_frames=n_frames, trace_mode=trace_mode, clim=clim,
+                          zscore=zscore, raster_cache=raster_cache)
+    finally:
+        if profiler.enabled:
+            profiler.print_summary()
+            trace_path = profiler.write(os.path.join(output_dir, PROFILE_TRACE), nwb_path=str(nwb_path),
+                                        workers=workers, profile=profile)
+            print(f"Profile written to {trace_path}")
+    return output_dir
+
+
+def _validate_nwb(nwb_path, output_dir, workers, force, profiler, max_points, frame_mode, n_frames, trace_mode,
+                  clim, zscore, raster_cache):
+    # Body of validate_nwb, every stage accounted to ``profiler``
+    # Figures recorded for this file and render version are not rendered again unless forced
+    with profiler.stage('manifest'):
+        fingerprint = file_fingerprint(nwb_path)
+        manifest = ValidationManifest(output_dir, fingerprint,
+                                      script_version(max_points=max_points, frame_mode=frame_mode, n_frames=n_frames,
+                                                     trace_mode=trace_mode, clim=clim, zscore=zscore),
+                                      reset=force)
+    if (manifest.qc or {}).get('fingerprint') != fingerprint:
+        # QC metrics are gathered while figures are drawn: without metrics for this file, draw them all
+        manifest.reset()
+    qc = SessionQC(fingerprint, manifest.qc)
+    if manifest.is_complete():
+        qc.write(output_dir, manifest.session)
+        print(f"Validation plots in {output_dir} are up to date")
+        return
+
+    # Load NWB file
+    with profiler.stage('open'):
+        nwbfile, io = load_nwb_file(nwb_path)
+
+    # Stage of every figure, to account its render time
+    figure_stages = {}
+
+    def staged(stage, build_jobs):
+        # Jobs of ``stage`` from ``build_jobs()``, which is not called when every figure of the stage
+        # is up to date. The work of building the jobs and of loading their arrays is accounted to ``stage``.
+        if manifest.is_stage_current(stage):
+            manifest.skipped += manifest.stage_figures(stage)
+            return
+        paths = []
+        for job in profiler.iterate(stage, build_jobs()):
+            if job.load is not None:
+                job.load = profiler.wrap(stage, job.load)
+            figure_stages[job.path] = stage
+            paths.append(job.path)
+            yield job
+        manifest.record_stage(stage, paths)
+
+    # Summary images are read once and shared with the mask overlays, if either needs them
+    frames = cache(partial(summary_frames, nwbfile, frame_mode, n_frames))
+
+    def jobs():
         # 1. Plot metadata and basic information
-        plot_metadata(nwbfile, output_dir)
-        
+        yield from staged('metadata', partial(metadata_jobs, nwbfile, output_dir))
+
         # 2. Plot stimulus information
-        plot_stimulus_info(nwbfile, output_dir)
-        
+        yield from staged('stimulus', partial(stimulus_info_jobs, nwbfile, output_dir, qc))
+
         # 3. Plot summary images
-        plot_summary_images(nwbfile, output_dir)
-        
+        yield from staged('summary_images',
+                          lambda: summary_image_jobs(nwbfile, output_dir, frame_mode, n_frames, frames()))
+
         # 4. Plot traces with stimulus overlays
-        plot_traces_with_stimuli(nwbfile, output_dir)
-        
+        if trace_mode == 'raster':
+            raster = partial(cached_trace_raster, SessionCache(raster_cache or os.path.join(output_dir, 'raster_cache')),
+                             nwb_path)
+            yield from staged('traces', partial(trace_jobs, nwbfile, output_dir, max_points, raster=raster,
+                                                clim=clim, zscore=zscore, qc=qc))
+        else:
+            yield from staged('traces', partial(trace_jobs, nwbfile, output_dir, max_points, qc=qc))
+
         # 5. Plot segmentation masks
-        plot_segmentation_masks(nwbfile, output_dir)
-        
-        print(f"Validation plots saved to {output_dir}")
+        yield from staged('masks',
+                          lambda: segmentation_mask_jobs(nwbfile, output_dir, frame_mode, n_frames, frames(), qc))
+
+    tic = time.perf_counter()
+    try:
+        with profiler.stage('metadata'):
+            manifest.session = session_summary(nwbfile)
+
+        # Arrays are read from the file as the pool asks for more jobs
+        results = _render_all(jobs(), workers=workers, manifest=manifest)
     finally:
         # Close the NWB file
         io.close()
-    
-    return output_dir
+
+    for result in results:
+        profiler.add(f"render/{figure_stages.get(result.path, 'other')}", result.elapsed)
+
+    with profiler.stage('manifest'):
+        manifest.qc = qc.entries
+        manifest.save(complete=all(r.ok for r in results))
+        qc.write(output_dir, manifest.session)
+    if manifest.skipped:
+        print(f"Skipped {manifest.skipped} up-to-date figures")
+    print_figure_timings(results, output_dir, time.perf_counter() - tic)
+    print(f"Validation plots saved to {output_dir}")
+
+
+def _batch_output_dirs(paths, output_root):
+    # One output directory per file: <output_root>/<stem>, or validation/<stem> next to the file.
+    # Stems are prefixed with the parent folder name when they are not unique.
+    stems = [path.stem for path in paths]
+    if len(set(stems)) < len(stems):
+        stems = [f'{path.parent.name}_{path.stem}' for path in paths]
+    return [os.path.join(output_root or os.path.join(path.parent, 'validation'), stem)
+            for path, stem in zip(paths, stems)]
+
+
+def _validate_child(nwb_path, output_dir, options, conn):
+    # Entry point of a batch worker process: output and tracebacks go to validation.log, and the
+    # last line of the traceback (None on success) is sent back to the parent. The process leads
+    # its own process group, which its render pool joins, so that a timeout kills them all.
+    if hasattr(os, 'setpgrp'):
+        os.setpgrp()
+    os.makedirs(output_dir, exist_ok=True)
+    error = None
+    with open(os.path.join(output_dir, 'validation.log'), 'w') as log, \
+            contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            validate_nwb(nwb_path, output_dir, **options)
+        except Exception:
+            print(traceback.format_exc())
+            error = traceback.format_exc().strip().splitlines()[-1]
+    conn.send(error)
+    conn.close()
+
+
+def _kill_child(process):
+    # Kill a batch worker with its render pool (its process group, see _validate_child)
+    if hasattr(os, 'killpg'):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass  # killed before it made its group
+    process.kill()
+
+
+def _batch_record(nwb_path, output_dir, status, elapsed, error=None):
+    # One summary row, with the counts and figure status of the file's validation manifest and
+    # the headline QC metrics
+    manifest = ValidationManifest.read(output_dir) or {}
+    session = manifest.get('session') or {}
+    if status == 'ok' and not manifest.get('complete'):
+        status = 'incomplete'
+    qc_path = os.path.join(output_dir, SessionQC.FILENAME)
+    headline = {}
+    if os.path.exists(qc_path):
+        with open(qc_path) as f:
+            headline = json.load(f).get('headline', {})
+    return {
+        'nwb_path': str(nwb_path),
+        'output_dir': output_dir,
+        'status': status,
+        'elapsed': round(elapsed, 3),
+        'n_trials': session.get('n_trials'),
+        'n_series': session.get('n_series'),
+        'n_rois': sum(session['n_rois'].values()) if 'n_rois' in session else None,
+        'n_stimuli': session.get('n_stimuli'),
+        'n_figures': len(manifest.get('figures', {})),
+        **{name: headline.get(name) for name in SessionQC.HEADLINE},
+        'error': error,
+    }
+
+
+def validate_batch(paths, output_root=None, jobs=None, timeout=None, workers=1, **options):
+    """
+    Validate many NWB files concurrently, each in its own process.
+
+    Parameters
+    ----------
+    paths : str or list
+        Directory, glob pattern, CSV manifest of NWB paths, or a list of any of these
+    output_root : str, optional
+        Directory holding one output folder per file (default: "validation/<name>" next to each file)
+    jobs : int, optional
+        Files validated at the same time (default: number of CPUs)
+    timeout : float, optional
+        Seconds after which the validation of a file is killed and reported as timed out
+    workers : int, optional
+        Processes rendering the figures of each file
+    **options
+        Other keyword arguments of ``validate_nwb`` (force, max_points, frame_mode, n_frames)
+
+    Returns
+    -------
+    records : list of dict
+        One summary row per file, in input order, with status ("ok", "incomplete", "error" or
+        "timeout"), elapsed seconds, trial, ROI, stimulus and figure counts, the headline QC
+        metrics (``SessionQC.HEADLINE``) and the error message
+    """
+    paths = resolve_paths(paths)
+    output_dirs = _batch_output_dirs(paths, output_root)
+    jobs = jobs or min(len(paths), os.cpu_count() or 1) or 1
+
+    records = [None] * len(paths)
+    pending = iter(range(len(paths)))
+    running = {}  # process sentinel -> (index, process, connection, start time)
+
+    def start(i):
+        recv_conn, send_conn = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(target=_validate_child,
+                                          args=(str(paths[i]), output_dirs[i], dict(options, workers=workers), send_conn))
+        process.start()
+        send_conn.close()
+        running[process.sentinel] = (i, process, recv_conn, time.perf_counter())
+
+    def finish(sentinel, status, error=None):
+        i, process, conn, started = running.pop(sentinel)
+        process.join()
+        conn.close()
+        records[i] = _batch_record(paths[i], output_dirs[i], status, time.perf_counter() - started, error)
+        print(f"[{sum(r is not None for r in records)}/{len(paths)}] {records[i]['status']:10s} "
+              f"{records[i]['elapsed']:8.1f}s  {paths[i]}")
+
+    for i in pending:
+        start(i)
+        if len(running) >= jobs:
+            break
+
+    try:
+        while running:
+            wait_for = None
+            if timeout is not None:
+                oldest = min(started for _, _, _, started in running.values())
+                wait_for = max(0.0, oldest + timeout - time.perf_counter())
+            ready = multiprocessing.connection.wait(list(running), timeout=wait_for)
+
+            for sentinel in list(running):
+                i, process, conn, started = running[sentinel]
+                if sentinel in ready:
+                    try:
+                        error = conn.recv()
+                    except EOFError:
+                        # Died before reporting, e.g. killed for lack of memory
+                        process.join()
+                        error = f"Process exited with code {process.exitcode}"
+                    finish(sentinel, 'ok' if error is None else 'error', error)
+                elif timeout is not None and time.perf_counter() - started >= timeout:
+                    _kill_child(process)
+                    finish(sentinel, 'timeout', f"Killed after {timeout:g}s")
+                else:
+                    continue
+
+                i = next(pending, None)
+                if i is not None:
+                    start(i)
+    finally:
+        # Workers are outside the terminal's process group: Ctrl-C does not reach them
+        for _, process, _, _ in running.values():
+            _kill_child(process)
+
+    return records
+
+
+def write_batch_summary(records, summary_path):
+    """Write batch records to ``summary_path`` as CSV (``.csv``) or JSON (any other suffix)."""
+    os.makedirs(os.path.dirname(os.path.abspath(summary_path)), exist_ok=True)
+    if str(summary_path).lower().endswith('.csv'):
+        with open(summary_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(records[0]) if records else ['nwb_path'])
+            writer.writeheader()
+            writer.writerows(records)
+    else:
+        summary = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'n_files': len(records),
+                   'n_ok': sum(r['status'] == 'ok' for r in records), 'files': records}
+        with open(summary_path, 'w') as f:
+            json.dump(summary, f, indent=1)
+    return summary_path
+
+
+def session_summary(nwbfile):
+    """
+    Counts describing a session: trials and series of the DfOverF index, ROIs per plane
+    segmentation and stimulus presentations.
+    """
+    index = SessionIndex.from_nwbfile(nwbfile)
+
+    n_rois = {}
+    ophys = nwbfile.processing.get('ophys')
+    if ophys is not None and 'ImageSegmentation' in ophys.data_interfaces:
+        for plane_name, plane_seg in ophys.data_interfaces['ImageSegmentation'].plane_segmentations.items():
+            n_rois[plane_name] = len(plane_seg.id)
+
+    n_stimuli = 0
+    if nwbfile.intervals is not None and 'stimulus_presentations' in nwbfile.intervals:
+        n_stimuli = len(nwbfile.intervals['stimulus_presentations'])
+
+    return {'identifier': nwbfile.identifier, 'n_trials': len(index.trial_ids()), 'n_series': len(index),
+            'n_rois': n_rois, 'n_stimuli': n_stimuli}
 
 
 def plot_metadata(nwbfile, output_dir):
     """
     Plot metadata from the NWB file
-    
+
     Parameters
     ----------
     nwbfile : NWBFile
@@ -107,10 +814,11 @@ def plot_metadata(nwbfile, output_dir):
     output_dir : str
         Path to the output directory for plots
     """
-    # Create figure for metadata
-    fig, ax = plt.subplots(figsize=(10, 6))
-    ax.axis('off')
-    
+    _render_all(metadata_jobs(nwbfile, output_dir))
+
+
+def metadata_jobs(nwbfile, output_dir):
+    """Yield the FigureJob of the metadata figure."""
     # Collect metadata
     metadata = [
         f"File ID: {nwbfile.identifier}",
@@ -120,14 +828,14 @@ def plot_metadata(nwbfile, output_dir):
         f"Lab: {nwbfile.lab}",
         f"Institution: {nwbfile.institution}",
     ]
-    
+
     # Add subject information if available
     if nwbfile.subject is not None:
         metadata.extend([
             f"Subject ID: {nwbfile.subject.subject_id}",
             f"Species: {nwbfile.subject.species}",
         ])
-        
+
         # Add optional subject fields if they exist
         if hasattr(nwbfile.subject, 'age') and nwbfile.subject.age is not None:
             metadata.append(f"Age: {nwbfile.subject.age}")
@@ -135,24 +843,29 @@ def plot_metadata(nwbfile, output_dir):
             metadata.append(f"Sex: {nwbfile.subject.sex}")
         if hasattr(nwbfile.subject, 'genotype') and nwbfile.subject.genotype is not None:
             metadata.append(f"Genotype: {nwbfile.subject.genotype}")
-    
+
     # Add notes if available
     if hasattr(nwbfile, 'notes') and nwbfile.notes is not None:
         metadata.append(f"Notes: {nwbfile.notes}")
-    
+
+    yield FigureJob(os.path.join(output_dir, 'metadata.png'), _render_metadata, ['general'], metadata=metadata)
+
+
+def _render_metadata(metadata):
+    fig = _new_figure(figsize=(10, 6))
+    ax = fig.subplots()
+    ax.axis('off')
+
     # Display metadata
     ax.text(0.05, 0.95, '\n'.join(metadata), va='top', fontsize=12, transform=ax.transAxes)
-    
-    # Save figure
-    plt.title("NWB File Metadata")
-    plt.savefig(os.path.join(output_dir, 'metadata.png'), dpi=150, bbox_inches='tight')
-    plt.close(fig)
+    ax.set_title("NWB File Metadata")
+    return fig
 
 
 def plot_stimulus_info(nwbfile, output_dir):
     """
     Plot stimulus information from the NWB file
-    
+
     Parameters
     ----------
     nwbfile : NWBFile
@@ -160,67 +873,118 @@ def plot_stimulus_info(nwbfile, output_dir):
     output_dir : str
         Path to the output directory for plots
     """
+    _render_all(stimulus_info_jobs(nwbfile, output_dir))
+
+
+def stimulus_info_jobs(nwbfile, output_dir, qc=None):
+    """
+    Yield the FigureJobs of the stimulus orientation, parameter and timing figures, and record the
+    presentation counts in ``qc`` (a SessionQC) if given.
+    """
     # Get stimulus presentations
     try:
         stim_table = nwbfile.intervals['stimulus_presentations']
         stim_df = stim_table.to_dataframe()
-        
-        # Plot orientations
-        if 'orientation' in stim_df.columns:
-            fig, ax = plt.subplots(figsize=(10, 6))
-            ax.plot(stim_df['start_time'], stim_df['orientation'], 'bo-', markersize=5)
-            ax.set_xlabel('Time (s)')
-            ax.set_ylabel('Orientation (degrees)')
-            ax.set_title('Stimulus Orientations')
-            ax.grid(True)
-            plt.savefig(os.path.join(output_dir, 'stimulus_orientations.png'), dpi=150, bbox_inches='tight')
-            plt.close(fig)
-        
-        # Plot other parameters if available
-        param_columns = [col for col in stim_df.columns if col not in 
-                        ['start_time', 'stop_time', 'trial', 'id', 'tags']]
-        
-        if param_columns:
-            fig, axs = plt.subplots(len(param_columns), 1, figsize=(10, 3*len(param_columns)), sharex=True)
-            if len(param_columns) == 1:
-                axs = [axs]  # Ensure axs is a list-like for consistency
-                
-            for i, param in enumerate(param_columns):
-                if param in stim_df.columns and not stim_df[param].isna().all():
-                    axs[i].plot(stim_df['start_time'], stim_df[param], 'o-', markersize=5)
-                    axs[i].set_ylabel(param)
-                    axs[i].grid(True)
-            
-            axs[-1].set_xlabel('Time (s)')
-            plt.suptitle('Stimulus Parameters')
-            plt.tight_layout()
-            plt.savefig(os.path.join(output_dir, 'stimulus_parameters.png'), dpi=150, bbox_inches='tight')
-            plt.close(fig)
-        
-        # Plot stimulus timing
-        fig, ax = plt.subplots(figsize=(10, 6))
-        for i, (start, stop) in enumerate(zip(stim_df['start_time'], stim_df['stop_time'])):
-            ax.axvspan(start, stop, alpha=0.3, color='gray')
-            ax.axvline(start, color='r', linestyle='-', linewidth=1, alpha=0.7)
-            ax.axvline(stop, color='b', linestyle='-', linewidth=1, alpha=0.7)
-        
-        ax.set_xlabel('Time (s)')
-        ax.set_ylabel('Stimulus')
-        ax.set_title('Stimulus Timing')
-        ax.set_ylim(0, 1)
-        ax.set_yticks([])
-        ax.grid(True, axis='x')
-        plt.savefig(os.path.join(output_dir, 'stimulus_timing.png'), dpi=150, bbox_inches='tight')
-        plt.close(fig)
-        
     except (KeyError, AttributeError) as e:
         print(f"Warning: Could not plot stimulus information: {e}")
+        return
+
+    # Plot orientations
+    if 'orientation' in stim_df.columns:
+        yield FigureJob(os.path.join(output_dir, 'stimulus_orientations.png'), _render_stimulus_orientations,
+                        [_STIMULUS_TABLE], start_time=stim_df['start_time'].to_numpy(), orientation=stim_df['orientation'].to_numpy())
+
+    # Plot other parameters if available
+    param_columns = [col for col in stim_df.columns if col not in
+                    ['start_time', 'stop_time', 'trial', 'id', 'tags']]
+
+    if qc is not None:
+        qc.set_stimuli(stimulus_counts(stim_df, param_columns))
+
+    if param_columns:
+        yield FigureJob(os.path.join(output_dir, 'stimulus_parameters.png'), _render_stimulus_parameters,
+                        [_STIMULUS_TABLE], stim_df=stim_df[['start_time'] + param_columns], param_columns=param_columns)
+
+    # Plot stimulus timing
+    yield FigureJob(os.path.join(output_dir, 'stimulus_timing.png'), _render_stimulus_timing,
+                    [_STIMULUS_TABLE], start_time=stim_df['start_time'].to_numpy(), stop_time=stim_df['stop_time'].to_numpy())
+
+
+def _render_stimulus_orientations(start_time, orientation):
+    fig = _new_figure(figsize=(10, 6))
+    ax = fig.subplots()
+    ax.plot(start_time, orientation, 'bo-', markersize=5)
+    ax.set_xlabel('Time (s)')
+    ax.set_ylabel('Orientation (degrees)')
+    ax.set_title('Stimulus Orientations')
+    ax.grid(True)
+    return fig
+
+
+def _render_stimulus_parameters(stim_df, param_columns):
+    fig = _new_figure(figsize=(10, 3*len(param_columns)))
+    axs = fig.subplots(len(param_columns), 1, sharex=True)
+    if len(param_columns) == 1:
+        axs = [axs]  # Ensure axs is a list-like for consistency
+
+    for i, param in enumerate(param_columns):
+        if param in stim_df.columns and not stim_df[param].isna().all():
+            axs[i].plot(stim_df['start_time'], stim_df[param], 'o-', markersize=5)
+            axs[i].set_ylabel(param)
+            axs[i].grid(True)
+
+    axs[-1].set_xlabel('Time (s)')
+    fig.suptitle('Stimulus Parameters')
+    fig.tight_layout()
+    return fig
+
+
+def _render_stimulus_timing(start_time, stop_time):
+    fig = _new_figure(figsize=(10, 6))
+    ax = fig.subplots()
+    # One collection each for the spans, onsets and offsets of all presentations
+    add_intervals(ax, start_time, stop_time, alpha=0.3, color='gray')
+    add_events(ax, start_time, colors='r', linestyle='-', linewidth=1, alpha=0.7, capstyle='projecting')
+    add_events(ax, stop_time, colors='b', linestyle='-', linewidth=1, alpha=0.7, capstyle='projecting')
+
+    ax.set_xlabel('Time (s)')
+    ax.set_ylabel('Stimulus')
+    ax.set_title('Stimulus Timing')
+    ax.set_ylim(0, 1)
+    ax.set_yticks([])
+    ax.grid(True, axis='x')
+    return fig
+
+
+def _summary_images(nwbfile):
+    # Every ImageSeries in acquisition, by name
+    return {name: acq for name, acq in nwbfile.acquisition.items() if 'ImageSeries' in str(type(acq))}
+
+
+def summary_frames(nwbfile, frame_mode='first', n_frames=None):
+    """
+    ``{name: (image shape, load)}`` for every ImageSeries in acquisition.
+
+    ``load()`` reads the image shown for the series with ``nwb_io.frames.read_frame``: its first
+    frame, or the mean or maximum projection of its first ``n_frames`` frames. The image is read
+    on first call only, so the summary grid and the ROI overlays of every plane share one read.
+    """
+    return {name: (tuple(img_series.data.shape[1:3]), cache(partial(read_frame, img_series.data, frame_mode, n_frames)))
+            for name, img_series in _summary_images(nwbfile).items()}
+
+
+def _frame_title(frame_mode, n_frames):
+    # Title suffix naming the projection shown for a summary image (none for the first frame)
+    if frame_mode == 'first':
+        return ''
+    frames = 'all frames' if n_frames is None else f'{n_frames} frames'
+    return f" ({'mean' if frame_mode == 'mean' else 'max'} of {frames})"
 
 
 def plot_summary_images(nwbfile, output_dir):
     """
     Plot summary images from the NWB file
-    
+
     Parameters
     ----------
     nwbfile : NWBFile
@@ -228,48 +992,57 @@ def plot_summary_images(nwbfile, output_dir):
     output_dir : str
         Path to the output directory for plots
     """
-    # Find all ImageSeries in acquisition
-    summary_images = {}
-    for name, acq in nwbfile.acquisition.items():
-        if 'ImageSeries' in str(type(acq)):
-            summary_images[name] = acq
-    
-    if summary_images:
-        # Create figure for summary images
-        num_images = len(summary_images)
-        fig_cols = min(3, num_images)
-        fig_rows = (num_images + fig_cols - 1) // fig_cols  # Ceiling division
-        
-        fig, axs = plt.subplots(fig_rows, fig_cols, figsize=(5*fig_cols, 4*fig_rows))
-        if num_images == 1:
-            axs = np.array([axs])  # Make axs indexable for single subplot
-        axs = axs.flatten()
-        
-        for i, (name, img_series) in enumerate(summary_images.items()):
-            if i < len(axs):
-                # Get the image data (expecting a 3D array with time as first dimension)
-                img_data = img_series.data[:][0]  # Take first time point
-                
-                # Display the image
-                axs[i].imshow(img_data, cmap='viridis')
-                axs[i].set_title(name)
-                axs[i].axis('off')
-        
-        # Hide unused subplots
-        for j in range(i + 1, len(axs)):
-            axs[j].axis('off')
-        
-        plt.tight_layout()
-        plt.savefig(os.path.join(output_dir, 'summary_images.png'), dpi=150, bbox_inches='tight')
-        plt.close(fig)
+    _render_all(summary_image_jobs(nwbfile, output_dir))
+
+
+def summary_image_jobs(nwbfile, output_dir, frame_mode='first', n_frames=None, frames=None):
+    """
+    Yield the FigureJob of the grid of summary images, one per ImageSeries in acquisition.
+
+    ``frame_mode`` and ``n_frames`` select the image shown for each series (see ``summary_frames``);
+    ``frames`` can pass in the result of ``summary_frames`` to share its reads.
+    """
+    if frames is None:
+        frames = summary_frames(nwbfile, frame_mode, n_frames)
+
+    if frames:
+        yield FigureJob(os.path.join(output_dir, 'summary_images.png'), _render_summary_images,
+                        [f'acquisition/{name}' for name in frames],
+                        load=lambda: {'summary_images': {name: load() for name, (_, load) in frames.items()}},
+                        title_suffix=_frame_title(frame_mode, n_frames))
     else:
         print("Warning: No summary images found in NWB file")
 
 
+def _render_summary_images(summary_images, title_suffix=''):
+    num_images = len(summary_images)
+    fig_cols = min(3, num_images)
+    fig_rows = (num_images + fig_cols - 1) // fig_cols  # Ceiling division
+
+    fig = _new_figure(figsize=(5*fig_cols, 4*fig_rows))
+    axs = fig.subplots(fig_rows, fig_cols)
+    if num_images == 1:
+        axs = np.array([axs])  # Make axs indexable for single subplot
+    axs = axs.flatten()
+
+    for i, (name, img_data) in enumerate(summary_images.items()):
+        if i < len(axs):
+            axs[i].imshow(img_data, cmap='viridis')
+            axs[i].set_title(name + title_suffix)
+            axs[i].axis('off')
+
+    # Hide unused subplots
+    for j in range(i + 1, len(axs)):
+        axs[j].axis('off')
+
+    fig.tight_layout()
+    return fig
+
+
 def plot_traces_with_stimuli(nwbfile, output_dir):
     """
     Plot traces with stimulus overlays from the NWB file
-    
+
     Parameters
     ----------
     nwbfile : NWBFile
@@ -277,20 +1050,37 @@ def plot_traces_with_stimuli(nwbfile, output_dir):
     output_dir : str
         Path to the output directory for plots
     """
+    _render_all(trace_jobs(nwbfile, output_dir))
+
+
+def trace_jobs(nwbfile, output_dir, max_points=DEFAULT_MAX_POINTS, raster=None, clim=None, zscore=True, qc=None):
+    """
+    Yield one FigureJob per trial with the traces of every DMD and the stimulus annotations.
+
+    Series with more than ``max_points`` frames are drawn as the min/max envelope of
+    ``max_points / 2`` bins so that every peak stays visible (None keeps every frame).
+
+    With ``raster``, a function ``raster(series, n_bins, zscore)`` returning the bin times and
+    ``(rois, n_bins)`` raster of a series such as ``nwb_io.raster.cached_trace_raster``, each DMD
+    is drawn as that raster binned to ``max_points`` columns, with color limits ``clim``.
+
+    With ``qc`` (a SessionQC), the trace statistics and timestamp jitter of every series are
+    recorded while its figure's data is read.
+
+    Annotation colors depend on the parameter values of the previous stimulus, so they are
+    resolved here, in trial order, and the render jobs are independent of each other.
+    """
     # Get stimulus presentations
     try:
         stim_table = nwbfile.intervals['stimulus_presentations']
         stim_df = stim_table.to_dataframe()
-        
+
         # Get ophys module
         ophys = nwbfile.processing.get('ophys')
         if ophys is None:
             print("Warning: No ophys module found in NWB file")
             return
-        
-        # Create colormap for stimulus parameters
-        base_colors = list(mcolors.TABLEAU_COLORS.values())
-        
+
         # Try to get DfOverF data first (preferred), fallback to Fluorescence
         if 'DfOverF' in ophys.data_interfaces:
             data_interface = ophys.data_interfaces['DfOverF']
@@ -301,150 +1091,332 @@ def plot_traces_with_stimuli(nwbfile, output_dir):
         else:
             print("Warning: No DfOverF or Fluorescence data found in NWB file")
             return
-        
+
         # Get ROI response series names (should be per trial)
         roi_series_names = list(data_interface.roi_response_series.keys())
-        
-        # Group series by trial and DMD (assuming naming convention like 'Trial{trial}_DMD{dmd}')
-        trials_dmd = {}
-        for name in roi_series_names:
-            parts = name.split('_')
-            trial_part = [p for p in parts if p.startswith('Trial')]
-            dmd_part = [p for p in parts if p.startswith('DMD')]
-            
-            if trial_part and dmd_part:
-                trial_num = int(trial_part[0].replace('Trial', ''))
-                dmd_num = int(dmd_part[0].replace('DMD', ''))
-                
-                if trial_num not in trials_dmd:
-                    trials_dmd[trial_num] = {}
-                
-                trials_dmd[trial_num][dmd_num] = name
-        
-        # Keep track of previous parameter values for visual cues
-        previous_values = {}
-        param_colors = {}
-        
-        # Plot traces for each trial
-        for trial_num, dmds in sorted(trials_dmd.items()):
-            # Create figure for this trial
-            fig = plt.figure(figsize=(10, 8))
-            
-            # For each DMD
-            for i, (dmd_num, series_name) in enumerate(sorted(dmds.items())):
-                # Get the ROI response series
-                roi_series = data_interface.roi_response_series[series_name]
-                
-                # Create subplot for this DMD
-                ax = plt.subplot(len(dmds), 1, i+1)
-                
-                # Get trace data and timestamps
-                trace_data = roi_series.data[:]  # Shape should be (time, ROI)
-                timestamps = roi_series.timestamps[:]
-                
-                # Get trial start and end times
-                trial_start = timestamps[0]
-                trial_end = timestamps[-1]
-                
-                # Get stimuli during this trial
-                trial_stims = stim_df[(stim_df['start_time'] >= trial_start) & 
-                                     (stim_df['start_time'] <= trial_end)]
-                
-                # Plot heatmap of traces
-                sns.heatmap(trace_data.T, ax=ax, cmap='Greens', 
-                           vmin=0, vmax=2)  # Same scale as in load_slap2.py
-                
-                # Get time tick positions and labels
-                num_timepoints = trace_data.shape[0]
-                num_ticks = 5
-                tick_indices = np.linspace(0, num_timepoints - 1, num_ticks, dtype=int)
-                tick_labels = [f"{timestamps[i]:.1f}" for i in tick_indices]
-                
-                # Set axis labels
-                if i == len(dmds) - 1:  # Bottom subplot
-                    ax.set_xlabel(f"Time (s) - trial_{trial_num}")
-                    ax.set_xticks(tick_indices)
-                    ax.set_xticklabels(tick_labels)
-                else:
-                    ax.set_xticklabels([])
-                    ax.set_xticks([])
-                
-                ax.set_ylabel(f"Synapse # - DMD {dmd_num}")
-                
-                # Draw vertical bars at stimulus times
-                for _, stim_row in trial_stims.iterrows():
-                    # Calculate position in the plot
-                    stim_time = stim_row['start_time']
-                    rel_time = stim_time - trial_start
-                    
-                    # Convert to x-index in the plot
-                    x_index = int(rel_time / (trial_end - trial_start) * (num_timepoints - 1))
-                    x_index = max(0, min(x_index, num_timepoints - 1))  # Ensure within bounds
-                    
-                    # Draw vertical line
-                    ax.axvline(x=x_index, color='red', linestyle='-', linewidth=0.5)
-                    
-                    # Only annotate in the top subplot for clarity
-                    if i == 0:
-                        # Format stimulus parameters
-                        y_offset = -1.5
-                        x_offset = 0
-                        prev_y_position = 1
-                        
-                        # Get parameters for this stimulus
-                        for param in stim_row.index:
-                            if param not in ['start_time', 'stop_time', 'id', 'tags', 'trial']:
-                                val = stim_row[param]
-                                if pd.notnull(val):  # Skip NaN values
-                                    # Format value
-                                    try:
-                                        formatted_val = f"{float(val):.1g}"
-                                    except:
-                                        formatted_val = str(val)
-                                    
-                                    # Get color for this parameter
-                                    if param not in param_colors:
-                                        param_colors[param] = base_colors[len(param_colors) % len(base_colors)]
-                                    
-                                    # Check if value has changed
-                                    has_changed = previous_values.get(param) != val
-                                    previous_values[param] = val
-                                    
-                                    # Set text properties
-                                    color = param_colors[param] if not has_changed else 'black'
-                                    weight = 'normal' if not has_changed else 'bold'
-                                    
-                                    # Adjust y position
-                                    adjusted_y_position = prev_y_position + y_offset
-                                    prev_y_position = adjusted_y_position
-                                    
-                                    # Add text
-                                    ax.text(x_index + x_offset, adjusted_y_position, 
-                                           f"{param}={formatted_val}",
-                                           rotation=45,
-                                           color=color,
-                                           fontsize=8,
-                                           fontweight=weight,
-                                           ha='left',
-                                           va='bottom',
-                                           clip_on=False)
-            
-            # Set overall title and layout
-            plt.suptitle(f"Trial {trial_num} - {trace_type}")
-            plt.tight_layout()
-            
-            # Save figure
-            plt.savefig(os.path.join(output_dir, f'trial_{trial_num}_traces.png'), dpi=150, bbox_inches='tight')
-            plt.close(fig)
-            
     except (KeyError, AttributeError) as e:
         print(f"Warning: Could not plot traces: {e}")
+        return
+
+    # Create colormap for stimulus parameters
+    base_colors = list(mcolors.TABLEAU_COLORS.values())
+
+    # Group series by trial and DMD (assuming naming convention like 'Trial{trial}_DMD{dmd}')
+    trials_dmd = {}
+    for name in roi_series_names:
+        parts = name.split('_')
+        trial_part = [p for p in parts if p.startswith('Trial')]
+        dmd_part = [p for p in parts if p.startswith('DMD')]
+
+        if trial_part and dmd_part:
+            trial_num = int(trial_part[0].replace('Trial', ''))
+            dmd_num = int(dmd_part[0].replace('DMD', ''))
+
+            if trial_num not in trials_dmd:
+                trials_dmd[trial_num] = {}
+
+            trials_dmd[trial_num][dmd_num] = name
+
+    # Keep track of previous parameter values for visual cues
+    previous_values = {}
+    param_colors = {}
+
+    # One figure for each trial, one panel for each DMD
+    for trial_num, dmds in sorted(trials_dmd.items()):
+        panels = []
+        roi_series_list = []
+        for i, (dmd_num, series_name) in enumerate(sorted(dmds.items())):
+            # Get the ROI response series
+            roi_series = data_interface.roi_response_series[series_name]
+            roi_series_list.append(roi_series)
+
+            # Get trial start and end times; the traces themselves are only read when rendering
+            trial_start = roi_series.timestamps[0]
+            trial_end = roi_series.timestamps[-1]
+            num_timepoints = roi_series.data.shape[0]
+
+            # Get stimuli during this trial
+            trial_stims = stim_df[(stim_df['start_time'] >= trial_start) &
+                                 (stim_df['start_time'] <= trial_end)]
+
+            # Position of every stimulus in the plot, as a frame index
+            rel_time = trial_stims['start_time'].to_numpy(dtype=float) - trial_start
+            stim_x = np.clip((rel_time / (trial_end - trial_start) * (num_timepoints - 1)).astype(int),
+                             0, num_timepoints - 1)
+
+            # Only annotate in the top subplot for clarity
+            labels = []
+            if i == 0:
+                labels = _stimulus_labels(trial_stims, stim_x, previous_values, param_colors, base_colors)
+
+            panels.append({'dmd_num': dmd_num, 'n_frames': num_timepoints, 'stim_x': stim_x, 'labels': labels})
+
+        path = os.path.join(output_dir, f'trial_{trial_num}_traces.png')
+        inputs = [_STIMULUS_TABLE] + [f'processing/ophys/{trace_type}/{dmds[dmd]}' for dmd in sorted(dmds)]
+        if raster is None:
+            yield FigureJob(path, _render_trial_traces, inputs,
+                            load=partial(_load_traces, roi_series_list, max_points, qc),
+                            trial_num=trial_num, trace_type=trace_type, panels=panels)
+        else:
+            yield FigureJob(path, _render_trial_rasters, inputs,
+                            load=partial(_load_rasters, raster, roi_series_list, max_points, zscore, qc),
+                            trial_num=trial_num, trace_type=trace_type, panels=panels,
+                            clim=clim or ((-3, 3) if zscore else (0, 2)), zscore=zscore)
+
+
+def _format_stimulus_value(val):
+    try:
+        return f"{float(val):.1g}"
+    except (TypeError, ValueError):
+        return str(val)
+
+
+def _stimulus_labels(trial_stims, stim_x, previous_values, param_colors, base_colors):
+    """
+    ``(x, y, text, color, weight)`` labels of the stimulus parameters of one trial: one label per
+    run of identical values of a parameter, at the run's first stimulus, in bold black when the
+    value changed from the stimulus before (carried across trials in ``previous_values``) and in
+    the parameter's color otherwise. The labels of every stimulus are stacked below each other,
+    one row per parameter that is set. Above ``_MAX_STIMULUS_LABELS`` labels the parameters that
+    change most often are left out.
+    """
+    params = [c for c in trial_stims.columns if c not in _UNLABELLED_COLUMNS]
+    values = trial_stims[params]
+    is_set = values.notna().to_numpy()
+    # Row of every set parameter in its stimulus' stack of labels
+    y = 1 - 1.5 * np.cumsum(is_set, axis=1)
+
+    runs = {}
+    for j, param in enumerate(params):
+        rows = np.flatnonzero(is_set[:, j])
+        if not len(rows):
+            continue
+        param_colors.setdefault(param, base_colors[len(param_colors) % len(base_colors)])
+        column = values[param].to_numpy()[rows]
+        previous = np.empty(len(column), dtype=object)
+        previous[0] = previous_values.get(param)
+        previous[1:] = column[:-1]
+        changed = column != previous
+        # A run starts where the value changes, and the trial's first value is always shown
+        start = changed.copy()
+        start[0] = True
+        runs[param] = (j, rows[start], column[start], changed[start])
+        previous_values[param] = column[-1]
+
+    kept, total = set(), 0
+    for param in sorted(runs, key=lambda p: len(runs[p][1])):
+        total += len(runs[param][1])
+        if total > _MAX_STIMULUS_LABELS:
+            print(f"Note: {len(runs) - len(kept)} frequently changing stimulus parameters are not labelled")
+            break
+        kept.add(param)
+
+    labels = []
+    for param in params:
+        if param not in kept:
+            continue
+        j, rows, vals, changed = runs[param]
+        labels.extend((int(stim_x[r]), float(y[r, j]), f"{param}={_format_stimulus_value(v)}",
+                       'black' if c else param_colors[param], 'bold' if c else 'normal')
+                      for r, v, c in zip(rows, vals, changed))
+    return labels
+
+
+def _load_traces(roi_series_list, max_points, qc=None):
+    # Trace data (time, ROI), timestamps and source frame of every column of each series of a trial
+    # figure. Series longer than max_points are reduced to a min/max envelope while being read,
+    # and the QC statistics are accumulated from the same blocks.
+    traces = []
+    for roi_series in roi_series_list:
+        stats = TraceStats()
+        if max_points:
+            frame_index, trace_data = minmax_envelope(roi_series.data, max(1, max_points // 2), on_block=stats.update)
+        else:
+            trace_data = roi_series.data[:]
+            frame_index = np.arange(len(trace_data))
+            stats.update(trace_data)
+        timestamps = roi_series.timestamps[:]
+        if qc is not None:
+            qc.add_series(roi_series.name, stats, timestamps)
+        traces.append((trace_data, timestamps[frame_index], frame_index))
+    return {'traces': traces}
+
+
+def _load_rasters(raster, roi_series_list, max_points, zscore, qc=None):
+    # (bin_times, raster) of each series of a trial figure, with the QC statistics of the series
+    rasters = []
+    for roi_series in roi_series_list:
+        stats = TraceStats()
+        timestamps = roi_series.timestamps[:]
+        rasters.append(raster(roi_series, max_points, zscore, timestamps=timestamps, stats=stats))
+        if qc is not None:
+            qc.add_series(roi_series.name, stats, timestamps)
+    return {'rasters': rasters}
+
+
+def _render_trial_traces(trial_num, trace_type, panels, traces):
+    fig = _new_figure(figsize=(10, 8))
+
+    # For each DMD
+    for i, (panel, (trace_data, timestamps, frame_index)) in enumerate(zip(panels, traces)):
+        # Create subplot for this DMD
+        ax = fig.add_subplot(len(panels), 1, i+1)
+
+        # Heatmap column holding each frame (the identity unless the traces were decimated)
+        def column(frame):
+            return int(np.searchsorted(frame_index, frame, side='right')) - 1
+
+        # Plot heatmap of traces
+        sns.heatmap(trace_data.T, ax=ax, cmap='Greens',
+                   vmin=0, vmax=2)  # Same scale as in load_slap2.py
+
+        # Get time tick positions and labels
+        num_timepoints = trace_data.shape[0]
+        num_ticks = 5
+        tick_indices = np.linspace(0, num_timepoints - 1, num_ticks, dtype=int)
+        tick_labels = [f"{timestamps[i]:.1f}" for i in tick_indices]
+
+        # Set axis labels
+        if i == len(panels) - 1:  # Bottom subplot
+            ax.set_xlabel(f"Time (s) - trial_{trial_num}")
+            ax.set_xticks(tick_indices)
+            ax.set_xticklabels(tick_labels)
+        else:
+            ax.set_xticklabels([])
+            ax.set_xticks([])
+
+        ax.set_ylabel(f"Synapse # - DMD {panel['dmd_num']}")
+
+        # Draw vertical bars at stimulus times
+        add_events(ax, [column(x_index) for x_index in panel['stim_x']], colors='red', linewidth=0.5,
+                   capstyle='projecting')
+
+        # Stimulus parameters (top subplot only)
+        for x, y, text, color, weight in panel['labels']:
+            ax.text(column(x), y, text,
+                   rotation=45,
+                   color=color,
+                   fontsize=8,
+                   fontweight=weight,
+                   ha='left',
+                   va='bottom',
+                   clip_on=False)
+
+    # Set overall title and layout
+    fig.suptitle(f"Trial {trial_num} - {trace_type}")
+    fig.tight_layout()
+    return fig
+
+
+def _render_trial_rasters(trial_num, trace_type, panels, rasters, clim, zscore):
+    fig = _new_figure(figsize=(10, 8))
+    cmap = 'RdBu_r' if zscore else 'Greens'
+
+    for i, (panel, (bin_times, raster)) in enumerate(zip(panels, rasters)):
+        ax = fig.add_subplot(len(panels), 1, i+1)
+
+        # Bins span the trial in frame units, so stimulus frames and label positions apply as they are
+        n_frames = panel['n_frames']
+        im = ax.imshow(raster, aspect='auto', interpolation='nearest', cmap=cmap, vmin=clim[0], vmax=clim[1],
+                       extent=(0, n_frames, raster.shape[0] - 0.5, -0.5))
+        ax.yaxis.get_major_locator().set_params(integer=True)
+        fig.colorbar(im, ax=ax, label='z-score' if zscore else trace_type, pad=0.01)
+
+        if i == len(panels) - 1:  # Bottom subplot
+            n_bins = len(bin_times)
+            tick_bins = np.linspace(0, n_bins - 1, 5, dtype=int)
+            ax.set_xlabel(f"Time (s) - trial_{trial_num}")
+            ax.set_xticks((tick_bins + 0.5) * n_frames / n_bins)
+            ax.set_xticklabels([f"{bin_times[b]:.1f}" for b in tick_bins])
+        else:
+            ax.set_xticks([])
+
+        ax.set_ylabel(f"Synapse # - DMD {panel['dmd_num']}")
+
+        # Black bars stay visible on the red end of the diverging colormap
+        add_events(ax, panel['stim_x'], colors='black' if zscore else 'red', linewidth=0.5, capstyle='projecting')
+
+        # Stimulus parameters (top subplot only)
+        for x, y, text, color, weight in panel['labels']:
+            ax.text(x, y, text, rotation=45, color=color, fontsize=8, fontweight=weight,
+                    ha='left', va='bottom', clip_on=False)
+
+    fig.suptitle(f"Trial {trial_num} - {trace_type}")
+    fig.tight_layout()
+    return fig
+
+
+def _sparse_pixel_masks(pixel_mask):
+    """
+    SparseRoiMasks of the ragged ``pixel_mask`` column of a PlaneSegmentation, read as one table.
+
+    Pixels are ``(x, y, weight)`` as in the NWB schema, and the image size is the largest
+    coordinate + 1.
+    """
+    return SparseRoiMasks.from_pixel_table(pixel_mask.target.data[:], pixel_mask.data[:])
+
+
+def _pixel_mask_shape(pixel_mask):
+    """``(H, W)`` of the masks ``_sparse_pixel_masks`` would build, from the pixel coordinates only."""
+    return _sparse_pixel_masks(pixel_mask).image_shape
+
+
+def _label_image(masks, positive=False):
+    """
+    ``(H, W)`` int32 image holding ROI index + 1 of the last ROI covering each pixel (0 = none).
+
+    With ``positive`` only the pixels of positive weight count, otherwise every stored pixel.
+    """
+    if not positive:
+        return masks.label_image()
+    keep = masks.weights > 0
+    labels = np.zeros(masks.image_shape[0] * masks.image_shape[1], dtype=np.int32)
+    np.maximum.at(labels, masks.indices[keep], masks.roi_ids()[keep].astype(np.int32) + 1)
+    return labels.reshape(masks.image_shape)
+
+
+def _roi_outlines(masks):
+    """
+    Outline pixels of every ROI of a SparseRoiMasks, as ``(y, x, roi_index)`` sorted by ROI.
+
+    Same as ``mask - binary_erosion(mask) > 0`` for each ROI on its own (4-neighbour erosion, zero
+    outside the image). A pixel is eroded when it and its four neighbours are nonzero pixels of the
+    same ROI, looked up among the sorted ``(roi, pixel)`` keys of the CSR masks, so overlapping ROIs
+    keep their full contours without a per-ROI image.
+    """
+    height, width = masks.image_shape
+    n_pixels = height * width
+    # Repeated pixels keep their last weight, as when rasterizing; keys sort by ROI, row, column
+    keys, last = np.unique((masks.roi_ids() * n_pixels + masks.indices)[::-1], return_index=True)
+    weights = masks.weights[::-1][last]
+    nonzero = weights != 0
+    nonzero_keys = keys[nonzero]
+    y, x = np.divmod(keys % n_pixels, width)
+
+    eroded = nonzero.copy()
+    for dy, dx in ((-1, 0), (1, 0), (0, -1), (0, 1)) if len(nonzero_keys) else ():
+        inside = (y + dy >= 0) & (y + dy < height) & (x + dx >= 0) & (x + dx < width)
+        neighbour = keys + dy * width + dx
+        pos = np.minimum(np.searchsorted(nonzero_keys, neighbour), len(nonzero_keys) - 1)
+        eroded &= inside & (nonzero_keys[pos] == neighbour)
+    outline = weights > eroded
+    return y[outline], x[outline], keys[outline] // n_pixels
+
+
+def _scatter_outlines(ax, y, x, roi, colors):
+    # One single-color scatter per ROI (split from the precomputed outline arrays) so that
+    # matplotlib keeps its marker fast path and the rendering matches per-ROI drawing
+    bounds = np.flatnonzero(np.diff(roi)) + 1
+    for roi_y, roi_x, roi_idx in zip(np.split(y, bounds), np.split(x, bounds), np.split(roi, bounds)):
+        if len(roi_idx):
+            r, g, b, a = colors[roi_idx[0] % len(colors)]
+            ax.scatter(roi_x, roi_y, s=0.5, color=(r, g, b), alpha=0.8)
 
 
 def plot_segmentation_masks(nwbfile, output_dir):
     """
     Plot segmentation masks from the NWB file
-    
+
     Parameters
     ----------
     nwbfile : NWBFile
@@ -452,32 +1424,44 @@ def plot_segmentation_masks(nwbfile, output_dir):
     output_dir : str
         Path to the output directory for plots
     """
+    _render_all(segmentation_mask_jobs(nwbfile, output_dir))
+
+
+def segmentation_mask_jobs(nwbfile, output_dir, frame_mode='first', n_frames=None, frames=None, qc=None):
+    """
+    Yield the FigureJobs of every plane segmentation: all ROIs, pages of individual masks,
+    ROI outlines, and outlines on each summary image of matching size (``frame_mode``,
+    ``n_frames`` and ``frames`` as in ``summary_image_jobs``). The ROI areas of every plane are
+    recorded in ``qc`` (a SessionQC) once its masks are rasterized.
+    """
+    if frames is None:
+        frames = summary_frames(nwbfile, frame_mode, n_frames)
+
     # Get ophys module
     ophys = nwbfile.processing.get('ophys')
     if ophys is None:
         print("Warning: No ophys module found in NWB file")
         return
-    
+
     # Check if ImageSegmentation exists
     if 'ImageSegmentation' not in ophys.data_interfaces:
         print("Warning: No ImageSegmentation found in NWB file")
         return
-    
+
     # Get ImageSegmentation interface
     img_seg = ophys.data_interfaces['ImageSegmentation']
-    
+
     # Create a folder for segmentation masks
     masks_dir = os.path.join(output_dir, 'segmentation_masks')
     os.makedirs(masks_dir, exist_ok=True)
-    
+
     # Process each plane's segmentation
     for plane_name, plane_seg in img_seg.plane_segmentations.items():
         print(f"Processing segmentation for plane: {plane_name}")
-        
-        # Get ROI IDs and image mask
+
+        # Get ROI IDs
         roi_ids = plane_seg.id.data[:]
-        roi_mask_list = []
-        
+
         # Check which fields are available for the ROIs
         available_fields = []
         if hasattr(plane_seg, 'image_mask') and plane_seg.image_mask is not None:
@@ -486,186 +1470,217 @@ def plot_segmentation_masks(nwbfile, output_dir):
             available_fields.append('pixel_mask')
         if hasattr(plane_seg, 'voxel_mask') and plane_seg.voxel_mask is not None:
             available_fields.append('voxel_mask')
-        
+
         if not available_fields:
             print(f"Warning: No mask data found for plane {plane_name}")
             continue
-        
-        # Create a combined mask for all ROIs in this plane
+
+        # Colors for visualization
+        colors = mcm.viridis(np.linspace(0, 1, len(roi_ids) + 1))
+
+        # The masks are rasterized on first use, once one of the plane's figures needs rendering
+        masks = cache(partial(_plane_masks, plane_seg, 'image_mask' in available_fields, colors,
+                              None if qc is None else partial(qc.add_plane, plane_name)))
         if 'image_mask' in available_fields:
-            # If image_mask is available, we can directly get the mask dimensions
-            first_mask = plane_seg.image_mask[0]
-            height, width = first_mask.shape
-            combined_mask = np.zeros((height, width), dtype=np.int32)
-            
-            # Collect all masks for individual visualizations
-            for i, roi_id in enumerate(roi_ids):
-                mask = plane_seg.image_mask[i]
-                roi_mask_list.append(mask)
-                # Add to combined mask with ROI index as the value
-                combined_mask[mask > 0] = i + 1  # +1 to avoid 0 (background)
-        
-        elif 'pixel_mask' in available_fields:
-            # For pixel masks, we need to determine the dimensions first
-            # by finding the maximum x and y coordinates
-            max_x = 0
-            max_y = 0
-            
-            # First pass: determine dimensions
-            for i in range(len(roi_ids)):
-                pixel_mask = plane_seg.pixel_mask[i]
-                for pixel in pixel_mask:
-                    y, x = int(pixel[0]), int(pixel[1])
-                    max_y = max(max_y, y)
-                    max_x = max(max_x, x)
-            
-            # Add 1 to get the correct dimensions (0-based indexing)
-            height, width = max_y + 1, max_x + 1
-            
-            # Create empty combined mask
-            combined_mask = np.zeros((height, width), dtype=np.int32)
-            
-            # Second pass: fill in the masks
-            for i, roi_id in enumerate(roi_ids):
-                pixel_mask = plane_seg.pixel_mask[i]
-                individual_mask = np.zeros((height, width), dtype=np.float32)
-                
-                for pixel in pixel_mask:
-                    y, x, value = int(pixel[0]), int(pixel[1]), pixel[2]
-                    individual_mask[y, x] = value
-                    combined_mask[y, x] = i + 1  # +1 to avoid 0 (background)
-                
-                roi_mask_list.append(individual_mask)
-        
-        # Create a colormap for visualization
-        colors = plt.cm.viridis(np.linspace(0, 1, len(roi_ids) + 1))
-        custom_cmap = LinearSegmentedColormap.from_list('custom_cmap', colors)
-        
+            height, width = plane_seg['image_mask'].data.shape[1:]
+        else:
+            # From the pixel table, without rasterizing the masks of up-to-date figures
+            height, width = _pixel_mask_shape(plane_seg['pixel_mask'])
+        inputs = [f'processing/ophys/ImageSegmentation/{plane_name}']
+
         # Plot combined masks
-        plt.figure(figsize=(10, 10))
-        plt.imshow(combined_mask, cmap=custom_cmap)
-        plt.colorbar(label='ROI Index')
-        plt.title(f'All ROIs - {plane_name} ({len(roi_ids)} ROIs)')
-        plt.axis('off')
-        plt.tight_layout()
-        plt.savefig(os.path.join(masks_dir, f'{plane_name}_all_masks.png'), dpi=150, bbox_inches='tight')
-        plt.close()
-        
+        yield FigureJob(os.path.join(masks_dir, f'{plane_name}_all_masks.png'), _render_all_masks, inputs,
+                        load=lambda masks=masks: {'combined_mask': masks()['combined_mask']},
+                        colors=colors, title=f'All ROIs - {plane_name} ({len(roi_ids)} ROIs)')
+
         # Plot individual masks - arrange in a grid
         rows_per_figure = 5
         cols_per_figure = 6
         masks_per_figure = rows_per_figure * cols_per_figure
-        
+
         # Calculate number of figures needed
-        num_figures = (len(roi_mask_list) + masks_per_figure - 1) // masks_per_figure
-        
+        num_figures = (len(roi_ids) + masks_per_figure - 1) // masks_per_figure
+
         for fig_idx in range(num_figures):
-            start_idx = fig_idx * masks_per_figure
-            end_idx = min(start_idx + masks_per_figure, len(roi_mask_list))
-            
-            fig, axs = plt.subplots(rows_per_figure, cols_per_figure, 
-                                   figsize=(15, 12), 
-                                   gridspec_kw={'wspace': 0.1, 'hspace': 0.1})
-            axs = axs.flatten()
-            
-            for i, mask_idx in enumerate(range(start_idx, end_idx)):
-                axs[i].imshow(roi_mask_list[mask_idx], cmap='viridis')
-                axs[i].set_title(f'ROI {roi_ids[mask_idx]}', fontsize=8)
-                axs[i].axis('off')
-            
-            # Hide unused subplots
-            for j in range(end_idx - start_idx, masks_per_figure):
-                axs[j].axis('off')
-                axs[j].set_visible(False)
-            
-            plt.suptitle(f'{plane_name} - ROI Masks (Page {fig_idx+1}/{num_figures})', fontsize=14)
-            plt.tight_layout()
-            plt.savefig(os.path.join(masks_dir, f'{plane_name}_masks_page{fig_idx+1}.png'), dpi=150, bbox_inches='tight')
-            plt.close()
-        
+            page = slice(fig_idx * masks_per_figure, min((fig_idx + 1) * masks_per_figure, len(roi_ids)))
+            yield FigureJob(os.path.join(masks_dir, f'{plane_name}_masks_page{fig_idx+1}.png'), _render_mask_page, inputs,
+                            load=partial(_load_mask_page, plane_seg, 'image_mask' in available_fields, masks, page),
+                            roi_ids=roi_ids[page], rows=rows_per_figure, cols=cols_per_figure,
+                            title=f'{plane_name} - ROI Masks (Page {fig_idx+1}/{num_figures})')
+
         # Create a visualization with ROI outlines overlaid on each other
-        plt.figure(figsize=(10, 10))
-        
-        # Create a colored visualization where ROIs are semi-transparent
-        overlay = np.zeros((height, width, 4))  # RGBA array
-        
-        for i, mask in enumerate(roi_mask_list):
-            # Get a distinct color for this ROI
-            color_idx = i % len(colors)
-            r, g, b, a = colors[color_idx]
-            
-            # Create a mask for this ROI with its color
-            roi_rgba = np.zeros((height, width, 4))
-            roi_rgba[mask > 0, 0] = r
-            roi_rgba[mask > 0, 1] = g
-            roi_rgba[mask > 0, 2] = b
-            roi_rgba[mask > 0, 3] = 0.3  # Semi-transparent
-            
-            # Add to overlay
-            overlay[roi_rgba[:, :, 3] > 0] = roi_rgba[roi_rgba[:, :, 3] > 0]
-            
-            # Draw outline
-            from scipy import ndimage
-            edges = mask - ndimage.binary_erosion(mask)
-            y_indices, x_indices = np.where(edges > 0)
-            plt.scatter(x_indices, y_indices, s=0.5, color=(r, g, b), alpha=0.8)
-        
-        plt.imshow(overlay)
-        plt.title(f'ROI Outlines - {plane_name} ({len(roi_ids)} ROIs)')
-        plt.axis('off')
-        plt.tight_layout()
-        plt.savefig(os.path.join(masks_dir, f'{plane_name}_roi_outlines.png'), dpi=150, bbox_inches='tight')
-        plt.close()
-        
+        yield FigureJob(os.path.join(masks_dir, f'{plane_name}_roi_outlines.png'), _render_outlines, inputs,
+                        load=lambda masks=masks: {'image': masks()['overlay'], 'outlines': masks()['outlines']},
+                        colors=colors, title=f'ROI Outlines - {plane_name} ({len(roi_ids)} ROIs)')
+
         # If summary images are available, plot ROI outlines on top of summary images
-        summary_images = {}
-        for name, acq in nwbfile.acquisition.items():
-            if 'ImageSeries' in str(type(acq)):
-                summary_images[name] = acq
-        
-        for img_name, img_series in summary_images.items():
-            try:
-                # Get the image data (expecting a 3D array with time as first dimension)
-                img_data = img_series.data[:][0]  # Take first time point
-                
-                if img_data.shape[:2] == (height, width):  # Check if dimensions match
-                    plt.figure(figsize=(10, 10))
-                    plt.imshow(img_data, cmap='gray')
-                    
-                    # Overlay ROI outlines
-                    for i, mask in enumerate(roi_mask_list):
-                        # Get a distinct color for this ROI
-                        color_idx = i % len(colors)
-                        r, g, b, a = colors[color_idx]
-                        
-                        # Draw outline
-                        from scipy import ndimage
-                        edges = mask - ndimage.binary_erosion(mask)
-                        y_indices, x_indices = np.where(edges > 0)
-                        plt.scatter(x_indices, y_indices, s=0.5, color=(r, g, b), alpha=0.8)
-                    
-                    plt.title(f'ROI Outlines on {img_name} - {plane_name}')
-                    plt.axis('off')
-                    plt.tight_layout()
-                    plt.savefig(os.path.join(masks_dir, f'{plane_name}_roi_on_{img_name}.png'), dpi=150, bbox_inches='tight')
-                    plt.close()
-            except Exception as e:
-                print(f"Warning: Could not overlay ROIs on {img_name}: {e}")
-    
+        for img_name, (img_shape, load_image) in frames.items():
+            if img_shape == (height, width):  # Check if dimensions match
+                yield FigureJob(os.path.join(masks_dir, f'{plane_name}_roi_on_{img_name}.png'), _render_outlines,
+                                inputs + [f'acquisition/{img_name}'],
+                                load=lambda masks=masks, load_image=load_image: {
+                                    'image': load_image(), 'outlines': masks()['outlines']},
+                                colors=colors, cmap='gray', outlines_first=False,
+                                title=f'ROI Outlines on {img_name}{_frame_title(frame_mode, n_frames)} - {plane_name}')
+
     print(f"Segmentation mask plots saved to {masks_dir}")
 
 
+def _plane_masks(plane_seg, use_image_mask, colors, record_areas=None):
+    """
+    Rasterize the figures of all ROIs of a plane segmentation from its sparse masks.
+
+    Returns the label image shown as the combined mask, the ROI outline pixels and the RGBA
+    overlay of semi-transparent ROI colors; no ``(n_rois, H, W)`` stack is built. The pixel area
+    of every ROI is passed to ``record_areas`` if given.
+    """
+    if use_image_mask:
+        masks = SparseRoiMasks.from_dense(plane_seg['image_mask'].data)
+    else:
+        masks = _sparse_pixel_masks(plane_seg['pixel_mask'])
+    height, width = masks.image_shape
+    if record_areas is not None:
+        record_areas(roi_areas(masks))
+
+    # ROI index + 1 of the last ROI covering each pixel (0 = background), for the color overlay
+    outline_labels = _label_image(masks, positive=True)
+
+    if use_image_mask:
+        combined_mask = outline_labels
+    else:
+        # Pixel-mask ROIs label every listed pixel, whatever its weight
+        combined_mask = _label_image(masks)
+
+    # Semi-transparent ROI colors, later ROIs on top
+    overlay = np.zeros((height, width, 4))  # RGBA array
+    labelled = outline_labels > 0
+    overlay[labelled, :3] = colors[(outline_labels[labelled] - 1) % len(colors), :3]
+    overlay[labelled, 3] = 0.3  # Semi-transparent
+
+    return {'masks': masks, 'combined_mask': combined_mask, 'outlines': _roi_outlines(masks), 'overlay': overlay}
+
+
+def _load_mask_page(plane_seg, use_image_mask, masks, page):
+    # Dense masks of one page of ROIs: read from image_mask, else rasterized from the sparse masks
+    if use_image_mask:
+        return {'masks': np.asarray(plane_seg['image_mask'].data[page])}
+    return {'masks': masks()['masks'].to_dense(np.arange(page.start, page.stop))}
+
+
+def _render_all_masks(combined_mask, colors, title):
+    custom_cmap = mcolors.LinearSegmentedColormap.from_list('custom_cmap', colors)
+    fig = _new_figure(figsize=(10, 10))
+    ax = fig.subplots()
+    im = ax.imshow(combined_mask, cmap=custom_cmap)
+    fig.colorbar(im, ax=ax, label='ROI Index')
+    ax.set_title(title)
+    ax.axis('off')
+    fig.tight_layout()
+    return fig
+
+
+def _render_mask_page(masks, roi_ids, rows, cols, title):
+    fig = _new_figure(figsize=(15, 12))
+    axs = fig.subplots(rows, cols, gridspec_kw={'wspace': 0.1, 'hspace': 0.1})
+    axs = axs.flatten()
+
+    for i, (mask, roi_id) in enumerate(zip(masks, roi_ids)):
+        axs[i].imshow(mask, cmap='viridis')
+        axs[i].set_title(f'ROI {roi_id}', fontsize=8)
+        axs[i].axis('off')
+
+    # Hide unused subplots
+    for j in range(len(masks), rows * cols):
+        axs[j].axis('off')
+        axs[j].set_visible(False)
+
+    fig.suptitle(title, fontsize=14)
+    fig.tight_layout()
+    return fig
+
+
+def _render_outlines(image, outlines, colors, title, cmap=None, outlines_first=True):
+    # ROI outlines drawn before (overlay image) or after (summary image) the image itself
+    fig = _new_figure(figsize=(10, 10))
+    ax = fig.subplots()
+    if outlines_first:
+        _scatter_outlines(ax, *outlines, colors)
+    ax.imshow(image, cmap=cmap)
+    if not outlines_first:
+        _scatter_outlines(ax, *outlines, colors)
+    ax.set_title(title)
+    ax.axis('off')
+    fig.tight_layout()
+    return fig
+
+
 def main():
     parser = argparse.ArgumentParser(description='Validate NWB file by creating plots')
-    parser.add_argument('--nwb', type=str, required=True, 
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--nwb', type=str,
                         help='Path to NWB file')
+    source.add_argument('--batch', type=str, nargs='+',
+                        help='Directory, glob pattern or CSV manifest (column "nwb_path", or the first column) '
+                             'of NWB files to validate concurrently')
     parser.add_argument('--output', type=str, default=None,
-                        help='Output directory for plots (default: "validation" folder next to NWB file)')
-    
+                        help='Output directory for plots (default: "validation" folder next to NWB file). '
+                             'In batch mode, one subfolder per file is created in it')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Processes rendering figures (default: number of CPUs, 1 per file in batch mode; '
+                             '1 renders in-process)')
+    parser.add_argument('--max-points', type=int, default=DEFAULT_MAX_POINTS,
+                        help='Trace columns kept per trial figure; longer traces are drawn as a '
+                             f'min/max envelope (default: {DEFAULT_MAX_POINTS}, 0 keeps every frame)')
+    parser.add_argument('--frame-mode', choices=FRAME_MODES, default='first',
+                        help='Image shown for each summary image series: its first frame, or the mean or '
+                             'maximum projection of its first --frame-count frames (default: first)')
+    parser.add_argument('--frame-count', type=int, default=None,
+                        help='Frames used by the mean and max projections (default: all)')
+    parser.add_argument('--trace-mode', choices=TRACE_MODES, default='heatmap',
+                        help='Trial traces drawn as a seaborn heatmap, or as binned ROI x time rasters drawn '
+                             'with imshow and cached for later runs (default: heatmap)')
+    parser.add_argument('--clim', type=float, nargs=2, default=None, metavar=('VMIN', 'VMAX'),
+                        help='Raster mode: color limits (default: -3 3 when z-scored, else 0 2)')
+    parser.add_argument('--zscore', action=argparse.BooleanOptionalAction, default=True,
+                        help='Raster mode: z-score every ROI over its whole series (default: on)')
+    parser.add_argument('--raster-cache', type=str, default=None,
+                        help='Raster mode: directory caching the binned rasters '
+                             '(default: "raster_cache" in the output directory)')
+    parser.add_argument('--profile', nargs='?', choices=PROFILE_MODES, const='stages', default=None,
+                        help='Write the wall time, bytes read and peak RSS of every validation stage to '
+                             f'{PROFILE_TRACE} in the output directory; "cprofile" or "pyinstrument" also dump a '
+                             'function-level profile of the main process (best with --workers 1)')
+    parser.add_argument('--force', action='store_true',
+                        help='Regenerate every figure, even those recorded as up to date in the manifest')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='Batch mode: files validated concurrently (default: number of CPUs)')
+    parser.add_argument('--timeout', type=float, default=None,
+                        help='Batch mode: seconds after which the validation of a file is killed')
+    parser.add_argument('--summary', type=str, default=None,
+                        help='Batch mode: summary file, .json or .csv '
+                             '(default: validation_summary.json in --output, or the current directory)')
+
     args = parser.parse_args()
-    
-    validate_nwb(args.nwb, args.output)
+
+    options = {'force': args.force, 'max_points': args.max_points,
+               'frame_mode': args.frame_mode, 'n_frames': args.frame_count,
+               'trace_mode': args.trace_mode, 'clim': tuple(args.clim) if args.clim else None,
+               'zscore': args.zscore, 'raster_cache': args.raster_cache, 'profile': args.profile}
+
+    if args.nwb is not None:
+        validate_nwb(args.nwb, args.output, workers=args.workers, **options)
+        return
+
+    records = validate_batch(args.batch, args.output, jobs=args.jobs, timeout=args.timeout,
+                             workers=args.workers or 1, **options)
+    summary_path = args.summary or os.path.join(args.output or '.', 'validation_summary.json')
+    write_batch_summary(records, summary_path)
+
+    n_ok = sum(r['status'] == 'ok' for r in records)
+    print(f"{n_ok}/{len(records)} files validated, summary written to {summary_path}")
+    if n_ok < len(records):
+        sys.exit(1)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
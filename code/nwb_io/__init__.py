@@ -0,0 +1,32 @@
+import importlib
+
+# Public names and the submodule defining them. Submodules (and numpy/pandas/pynwb behind them)
+# are only imported when one of these names is first used.
+_EXPORTS = {
+    'NwbData': 'load',
+    'SessionCache': 'cache',
+    'SessionIndex': 'index',
+    'SparseRoiMasks': 'masks',
+    'DffView': 'views',
+    'TimestampView': 'views',
+    'ExportedSession': 'export',
+    'export_session': 'export',
+    'iter_sessions': 'batch',
+    'lazy_import': 'imports',
+    'Profiler': 'profiling',
+    'DeviceRegistry': 'harp_registry',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'.{_EXPORTS[name]}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
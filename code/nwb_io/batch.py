@@ -0,0 +1,164 @@
+import csv
+import glob
+import os
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+from .load import NwbData
+
+
+class SessionResult:
+    """Outcome of running an extraction on one NWB file; ``error`` holds the traceback on failure."""
+
+    __slots__ = ('path', 'result', 'error', 'elapsed')
+
+    def __init__(self, path, result=None, error=None, elapsed=0.0):
+        self.path = path
+        self.result = result
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        status = 'ok' if self.ok else 'error'
+        return f"SessionResult(path={str(self.path)!r}, status={status}, elapsed={self.elapsed:.2f}s)"
+
+
+def read_path_manifest(csv_path):
+    """
+    NWB paths listed in a CSV manifest: the ``nwb_path`` (or ``path``) column if the file has
+    such a header, otherwise the first column. Relative paths are resolved against the
+    directory of the CSV file.
+    """
+    with open(csv_path, newline='') as f:
+        rows = [row for row in csv.reader(f) if row and any(cell.strip() for cell in row)]
+    if not rows:
+        return []
+
+    header = [cell.strip().lower() for cell in rows[0]]
+    column = next((header.index(name) for name in ('nwb_path', 'path') if name in header), None)
+    if column is not None or not header[0].endswith('.nwb'):
+        rows = rows[1:]
+    column = column or 0
+
+    base = Path(csv_path).parent
+    return [base / row[column].strip() for row in rows if len(row) > column and row[column].strip()]
+
+
+def resolve_paths(paths):
+    """
+    Expand a glob pattern, a directory, a CSV manifest (see ``read_path_manifest``) or a list
+    of any of these into a list of NWB paths.
+    """
+    if isinstance(paths, (str, Path)):
+        paths = [paths]
+
+    resolved = []
+    for p in paths:
+        p = str(p)
+        if os.path.isdir(p):
+            resolved.extend(sorted(Path(p).glob('*.nwb')))
+        elif glob.has_magic(p):
+            resolved.extend(Path(m) for m in sorted(glob.glob(p, recursive=True)))
+        elif p.lower().endswith('.csv'):
+            resolved.extend(read_path_manifest(p))
+        else:
+            resolved.append(Path(p))
+    return resolved
+
+
+def _run_session(path, extract, cache, kwargs):
+    tic = time.perf_counter()
+    try:
+        with NwbData(path, cache=cache) as nwb:
+            result = extract(nwb, **kwargs)
+        return SessionResult(path, result=result, elapsed=time.perf_counter() - tic)
+    except Exception:
+        return SessionResult(path, error=traceback.format_exc(), elapsed=time.perf_counter() - tic)
+
+
+def _collect(future, path):
+    # Result of a finished future, or a failed SessionResult if it raised in the parent (e.g. the
+    # result could not be unpickled); BrokenProcessPool is left to the caller
+    try:
+        return future.result()
+    except BrokenProcessPool:
+        raise
+    except Exception:
+        return SessionResult(path, error=traceback.format_exc())
+
+
+def iter_sessions(paths, extract, max_workers=None, max_open=None, cache=None, **kwargs):
+    """
+    Run ``extract(nwb, **kwargs)`` on every session in a process pool, yielding SessionResults as they finish.
+
+    ``extract`` receives an open ``NwbData`` and must be a picklable, module-level function; its
+    return value is sent back to the parent process. At most ``max_open`` files (default: the
+    number of workers) are open at any time. Exceptions raised for a file are captured in that
+    file's result instead of stopping the batch. If a worker dies (e.g. killed out of memory) the
+    pool is recreated and the sessions it was running are retried one at a time, so only the
+    session that kills a worker on its own is reported as failed.
+    """
+    paths = resolve_paths(paths)
+    max_workers = max_workers or min(len(paths), os.cpu_count() or 1) or 1
+    max_open = max(1, max_open or max_workers)
+
+    if max_workers == 1:
+        for path in paths:
+            yield _run_session(path, extract, cache, kwargs)
+        return
+
+    pending = iter(paths)
+    # Sessions that were running when a worker died, each rerun alone
+    suspects = []
+    pool = ProcessPoolExecutor(max_workers=max_workers)
+    running = {}
+    try:
+        while True:
+            if suspects:
+                if not running:
+                    path = suspects.pop(0)
+                    running[pool.submit(_run_session, path, extract, cache, kwargs)] = path, True
+            else:
+                while len(running) < max_open:
+                    path = next(pending, None)
+                    if path is None:
+                        break
+                    running[pool.submit(_run_session, path, extract, cache, kwargs)] = path, False
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            broken = False
+            for future in done:
+                path, alone = running.pop(future)
+                try:
+                    result = _collect(future, path)
+                except BrokenProcessPool:
+                    broken = True
+                    if not alone:
+                        suspects.append(path)
+                        continue
+                    result = SessionResult(path, error=traceback.format_exc())
+                yield result
+
+            if broken:
+                # Every other session of the pool fails with it, unless it finished first
+                for future in wait(running)[0]:
+                    path, _ = running.pop(future)
+                    try:
+                        result = _collect(future, path)
+                    except BrokenProcessPool:
+                        suspects.append(path)
+                        continue
+                    yield result
+                pool.shutdown(wait=False)
+                pool = ProcessPoolExecutor(max_workers=max_workers)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
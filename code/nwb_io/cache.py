@@ -0,0 +1,317 @@
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import numpy as np
+
+from .imports import lazy_import
+
+pd = lazy_import('pandas')
+
+# Bytes hashed from each end of the NWB file for the content part of the fingerprint
+_HASH_BLOCK = 1 << 20
+# Rows copied per block when streaming an HDF5 dataset into a .npy file
+_COPY_BLOCK_BYTES = 64 << 20
+# Touched on every hit; its mtime is the entry's last access, so hits never rewrite the manifest
+_ACCESS_STAMP = 'last_access'
+
+
+class SessionCache:
+    """
+    On-disk cache of arrays extracted from NWB files.
+
+    Every NWB file gets an entry directory named after its fingerprint (resolved path, size,
+    mtime and a hash of the first and last MiB of content). Inside it each cached group
+    (stimulus table, dF/F series, ROI masks) is a folder of ``.npy`` files plus a JSON
+    description, so arrays are served back memory-mapped. A ``manifest.json`` at the cache
+    root tracks entry sizes, and a stamp file in every entry its last access; the least recently
+    used entries are evicted once the cache grows beyond ``max_bytes``. Manifest updates hold a
+    file lock, so processes sharing the cache (``nwb_io.batch``) do not lose each other's entries.
+    """
+
+    def __init__(self, cache_dir, max_bytes: int = 10 * 1024**3):
+        self.cache_dir = Path(cache_dir).expanduser()
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._fingerprints = {}
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.cache_dir / 'manifest.json'
+
+    @contextlib.contextmanager
+    def _locked(self):
+        # Exclusive lock on manifest.lock for a read-modify-write of the manifest
+        with open(self.cache_dir / 'manifest.lock', 'a+b') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _read_manifest(self):
+        if not self.manifest_path.exists():
+            return {'entries': {}}
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+    def _write_manifest(self, manifest):
+        tmp_path = self.manifest_path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+
+    def fingerprint(self, nwb_path) -> str:
+        nwb_path = Path(nwb_path).resolve()
+        stat = nwb_path.stat()
+        stat_key = (str(nwb_path), stat.st_size, stat.st_mtime_ns)
+        if stat_key not in self._fingerprints:
+            self._fingerprints[stat_key] = file_fingerprint(nwb_path)
+        return self._fingerprints[stat_key]
+
+    def _group_dir(self, fingerprint, group) -> Path:
+        return self.cache_dir / fingerprint / group
+
+    def _touch(self, fingerprint):
+        (self.cache_dir / fingerprint / _ACCESS_STAMP).touch()
+
+    def last_access(self, fingerprint) -> float:
+        try:
+            return (self.cache_dir / fingerprint / _ACCESS_STAMP).stat().st_mtime
+        except FileNotFoundError:
+            return 0.0
+
+    def load(self, nwb_path, group):
+        """Return ``(arrays, meta)`` for a cached group, or None on a miss. Arrays are memory-mapped."""
+        fingerprint = self.fingerprint(nwb_path)
+        cached = load_group(self._group_dir(fingerprint, group))
+        if cached is None:
+            return None
+
+        self._touch(fingerprint)
+        return cached
+
+    def writer(self, nwb_path, group):
+        return _CacheGroupWriter(self, nwb_path, group)
+
+    def _commit(self, nwb_path, fingerprint, group, group_bytes, publish):
+        # publish() moves the finished group into place; under the lock, so writers of the same
+        # group never interleave and eviction never sees a half-written entry
+        nwb_path = Path(nwb_path).resolve()
+        stat = nwb_path.stat()
+        with self._locked():
+            publish()
+            self._touch(fingerprint)
+            manifest = self._read_manifest()
+            entry = manifest['entries'].setdefault(fingerprint, {
+                'path': str(nwb_path),
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'groups': {},
+            })
+            entry['groups'][group] = group_bytes
+            entry['bytes'] = sum(entry['groups'].values())
+            self._evict(manifest, keep=fingerprint)
+            self._write_manifest(manifest)
+
+    def _evict(self, manifest, keep=None):
+        entries = manifest['entries']
+        total = sum(e['bytes'] for e in entries.values())
+        for fingerprint in sorted(entries, key=self.last_access):
+            if total <= self.max_bytes:
+                break
+            if fingerprint == keep:
+                continue
+            total -= entries[fingerprint]['bytes']
+            shutil.rmtree(self.cache_dir / fingerprint, ignore_errors=True)
+            del entries[fingerprint]
+
+    def invalidate(self, nwb_path=None):
+        """Drop every cached entry for ``nwb_path`` (any version of the file), or the whole cache if None."""
+        with self._locked():
+            manifest = self._read_manifest()
+            if nwb_path is None:
+                targets = list(manifest['entries'])
+            else:
+                resolved = str(Path(nwb_path).resolve())
+                targets = [fp for fp, e in manifest['entries'].items() if e['path'] == resolved]
+
+            for fingerprint in targets:
+                shutil.rmtree(self.cache_dir / fingerprint, ignore_errors=True)
+                del manifest['entries'][fingerprint]
+            self._write_manifest(manifest)
+        self._fingerprints.clear()
+
+    def size_bytes(self) -> int:
+        return sum(e['bytes'] for e in self._read_manifest()['entries'].values())
+
+
+def file_fingerprint(path) -> str:
+    """
+    Hex digest identifying the current version of a file without reading all of it.
+
+    Hashes the resolved path, size and mtime together with the first and last MiB of content.
+    """
+    path = Path(path).resolve()
+    stat = path.stat()
+    digest = hashlib.sha1(repr((str(path), stat.st_size, stat.st_mtime_ns)).encode())
+    with open(path, 'rb') as f:
+        digest.update(f.read(_HASH_BLOCK))
+        if stat.st_size > _HASH_BLOCK:
+            f.seek(max(_HASH_BLOCK, stat.st_size - _HASH_BLOCK))
+            digest.update(f.read(_HASH_BLOCK))
+    return digest.hexdigest()
+
+
+def save_array(path, data, offset=None) -> bool:
+    """
+    Write ``data`` to a ``.npy`` file, minus ``offset`` if given. HDF5 datasets (anything that is
+    not an ndarray) are streamed block by block so they never have to fit in memory. Returns
+    True if the array holds Python objects and had to be pickled.
+    """
+    if isinstance(data, np.ndarray):
+        arr = data if offset is None else data - offset
+        np.save(path, arr, allow_pickle=arr.dtype.hasobject)
+        return arr.dtype.hasobject
+
+    dtype = np.dtype(data.dtype) if offset is None else np.result_type(data.dtype, offset)
+    out = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=tuple(data.shape))
+    row_bytes = max(1, dtype.itemsize * int(np.prod(data.shape[1:], dtype=np.int64)))
+    step = max(1, _COPY_BLOCK_BYTES // row_bytes)
+    for start in range(0, data.shape[0], step):
+        block = data[start:start + step]
+        out[start:start + len(block)] = block if offset is None else block - offset
+    out.flush()
+    del out
+    return False
+
+
+def load_group(group_dir):
+    """Read a group written by ``GroupWriter`` as ``(arrays, meta)``, or None if it does not exist."""
+    group_dir = Path(group_dir)
+    desc_path = group_dir / 'group.json'
+    if not desc_path.exists():
+        return None
+
+    with open(desc_path) as f:
+        desc = json.load(f)
+    arrays = {}
+    try:
+        for name, file_name in desc['files'].items():
+            pickled = name in desc['pickled']
+            arrays[name] = np.load(group_dir / file_name, mmap_mode=None if pickled else 'r', allow_pickle=pickled)
+    except FileNotFoundError:
+        # Replaced by another writer while being read
+        return None
+    return arrays, desc['meta']
+
+
+class GroupWriter:
+    """
+    Writes a folder of ``.npy`` files plus a ``group.json`` naming them and holding ``meta``.
+
+    Files go to a temporary folder in ``tmp_parent`` (default: next to ``group_dir``, it must be
+    on the same file system) that replaces ``group_dir`` once the group is complete, so readers
+    never see a partly written group.
+    """
+
+    def __init__(self, group_dir, tmp_parent=None):
+        self.group_dir = Path(group_dir)
+        self.tmp_parent = Path(tmp_parent) if tmp_parent is not None else self.group_dir.parent
+        self.files = {}
+        self.pickled = []
+        self.meta = {}
+        self._tmp_dir = None
+
+    def __enter__(self):
+        self.tmp_parent.mkdir(parents=True, exist_ok=True)
+        self._tmp_dir = Path(tempfile.mkdtemp(prefix=f'.{self.group_dir.name}.', suffix='.tmp', dir=self.tmp_parent))
+        return self
+
+    def add(self, name, data, offset=None):
+        """Store ``data`` under ``name`` (see ``save_array``)."""
+        file_name = f'{len(self.files)}.npy'
+        if save_array(self._tmp_dir / file_name, data, offset=offset):
+            self.pickled.append(name)
+        self.files[name] = file_name
+
+    def _finish(self):
+        desc = {'files': self.files, 'pickled': self.pickled, 'meta': self.meta}
+        with open(self._tmp_dir / 'group.json', 'w') as f:
+            json.dump(desc, f)
+
+    def _publish(self):
+        shutil.rmtree(self.group_dir, ignore_errors=True)
+        self.group_dir.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(self._tmp_dir, self.group_dir)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+            return False
+
+        self._finish()
+        self._publish()
+        return False
+
+
+class _CacheGroupWriter(GroupWriter):
+    """GroupWriter that also registers the group in the cache manifest."""
+
+    def __init__(self, cache, nwb_path, group):
+        self.cache = cache
+        self.nwb_path = nwb_path
+        self.group = group
+        self.fingerprint = cache.fingerprint(nwb_path)
+        # Temporary folders live at the cache root, out of reach of the eviction of entries
+        super().__init__(cache._group_dir(self.fingerprint, group), tmp_parent=cache.cache_dir)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            return super().__exit__(exc_type, exc_value, traceback)
+
+        self._finish()
+        group_bytes = sum(p.stat().st_size for p in self._tmp_dir.iterdir())
+        self.cache._commit(self.nwb_path, self.fingerprint, self.group, group_bytes, self._publish)
+        return False
+
+
+def frame_to_cache(writer, df: pd.DataFrame):
+    for i, col in enumerate(df.columns):
+        writer.add(f'col{i}', df[col].to_numpy())
+    writer.add('index', df.index.to_numpy())
+    writer.meta.update({'columns': [str(c) for c in df.columns], 'index_name': df.index.name,
+                        'dtypes': [str(dtype) for dtype in df.dtypes], 'index_dtype': str(df.index.dtype)})
+
+
+def frame_from_cache(arrays, meta) -> pd.DataFrame:
+    df = pd.DataFrame({col: arrays[f'col{i}'] for i, col in enumerate(meta['columns'])},
+                      index=pd.Index(arrays['index'], name=meta['index_name']))
+    # Dtypes that .npy does not keep (categorical, nullable integers, ...); older entries have none
+    dtypes = {col: dtype for col, dtype in zip(meta['columns'], meta.get('dtypes', [])) if str(df[col].dtype) != dtype}
+    if dtypes:
+        df = df.astype(dtypes)
+    index_dtype = meta.get('index_dtype')
+    if index_dtype is not None and str(df.index.dtype) != index_dtype:
+        df.index = df.index.astype(index_dtype)
+    return df
@@ -0,0 +1,131 @@
+import numpy as np
+
+
+def _nearest_frame(t, times):
+    if len(t) == 1:
+        return np.zeros(np.shape(times), dtype=np.intp)
+    right = np.clip(np.searchsorted(t, times), 1, len(t) - 1)
+    return np.where(times - t[right - 1] <= t[right] - times, right - 1, right)
+
+
+def _frame_windows(t, onsets, n_pre, n_post):
+    # Fixed window of frame offsets around the nearest frame to every onset
+    frames = _nearest_frame(t, onsets)[:, None] + np.arange(-n_pre, n_post)[None, :]
+    valid = (frames >= 0) & (frames < len(t))
+    return frames, valid
+
+
+def _interp_windows(t, targets):
+    # Linear interpolation weights of every target time between its two neighbouring frames
+    if len(t) == 1:
+        zeros = np.zeros(np.shape(targets), dtype=np.intp)
+        return zeros, zeros, np.zeros(np.shape(targets)), targets == t[0]
+    right = np.clip(np.searchsorted(t, targets), 1, len(t) - 1)
+    left = right - 1
+    with np.errstate(invalid='ignore', divide='ignore'):
+        w = (targets - t[left]) / (t[right] - t[left])
+    valid = (targets >= t[0]) & (targets <= t[-1])
+    return left, right, np.where(valid, w, 0.0), valid
+
+
+def _read_span(dataset, lo, hi):
+    # One contiguous read covering every window of a series
+    return np.asarray(dataset[lo:hi], dtype=float)
+
+
+def event_tensor(index, stim_df, pre, post, dmd='DMD1', resample_rate=None):
+    """
+    Stimulus-locked ``(events, rois, samples)`` tensor for one DMD.
+
+    Every row of ``stim_df`` is an event aligned on its ``start_time`` and windowed from ``-pre`` to
+    ``post`` seconds. Stimulus times are relative to ``index.anchor`` (the Trial1 start), like the
+    ``time`` of ``NwbData.load_dFoverF_data`` that ``add_stimulus_timeseries`` compares them with;
+    they are shifted by the anchor to be matched with the series timestamps. Events are matched to
+    their trial's series through the ``trial`` column (or by time when there is none); events with a
+    missing trial, or one without a series, are all NaN. Without ``resample_rate`` each window is a
+    fixed number of frames around the nearest frame, sized from the median frame rate of every
+    series, which must agree on it; with it, every series is linearly interpolated onto a common
+    grid at that rate. Each series is read once, as the contiguous span its events need, and all
+    windows are gathered with array indexing.
+
+    Returns ``(tensor, sample_times, events)``: samples outside the recording are NaN,
+    ``sample_times`` are relative to onset, and ``events`` is ``stim_df`` with the matched trial,
+    onset frame/time (relative to the anchor) and a ``complete`` flag for windows fully inside the
+    recording.
+    """
+    stim_df = stim_df.copy()
+    anchor = index.anchor
+    onsets = stim_df['start_time'].to_numpy(dtype=float) + anchor
+    series = {trial_id: index.trials[trial_id][dmd] for trial_id in index.trial_ids() if dmd in index.trials[trial_id]}
+    if not series:
+        raise KeyError(f"No series found for {dmd}")
+
+    # Assign events to trials; events without a trial (NaN) get -1, like those outside every series
+    if 'trial' in stim_df.columns:
+        trial = stim_df['trial'].to_numpy(dtype=float, na_value=np.nan)
+        event_trial = np.where(np.isfinite(trial), trial, -1).astype(int)
+    else:
+        trial_ids = np.array(sorted(series, key=lambda tr: series[tr].t_first))
+        first = np.array([series[tr].t_first for tr in trial_ids])
+        last = np.array([series[tr].t_last for tr in trial_ids])
+        pos = np.searchsorted(first, onsets, side='right') - 1
+        inside = (pos >= 0) & (onsets <= last[np.clip(pos, 0, None)])
+        event_trial = np.where(inside, trial_ids[np.clip(pos, 0, None)], -1)
+
+    n_rois = next(iter(series.values())).shape[1]
+    # Timestamps of the series that have events, read once
+    timestamps = {trial_id: np.asarray(info.series.timestamps[:], dtype=float) for trial_id, info in series.items()
+                  if np.any(event_trial == trial_id)}
+    if resample_rate is not None:
+        sample_times = np.arange(-pre, post, 1.0 / resample_rate)
+    else:
+        windows = {}
+        for trial_id, t in timestamps.items():
+            if len(t) < 2:
+                continue
+            rate = 1.0 / np.median(np.diff(t))
+            windows.setdefault((int(round(pre * rate)), int(round(post * rate))), (trial_id, rate))
+        if len(windows) > 1:
+            raise ValueError(f"{dmd} series have different frame rates "
+                             f"({', '.join(f'Trial{tr}: {rate:.3f} Hz' for tr, rate in windows.values())}); "
+                             f"pass resample_rate to interpolate them onto a common grid")
+        (n_pre, n_post), (_, rate) = next(iter(windows.items()), ((0, 0), (None, 1.0)))
+        sample_times = np.arange(-n_pre, n_post) / rate
+
+    tensor = np.full((len(stim_df), n_rois, len(sample_times)), np.nan)
+    onset_frame = np.full(len(stim_df), -1, dtype=np.int64)
+    onset_time = np.full(len(stim_df), np.nan)
+    complete = np.zeros(len(stim_df), dtype=bool)
+
+    for trial_id, t in timestamps.items():
+        rows = np.flatnonzero(event_trial == trial_id)
+        data = series[trial_id].series.data
+
+        if resample_rate is None:
+            frames, valid = _frame_windows(t, onsets[rows], n_pre, n_post)
+            left = right = frames
+            w = np.zeros(frames.shape)
+        else:
+            left, right, w, valid = _interp_windows(t, onsets[rows, None] + sample_times[None, :])
+
+        onset_frame[rows] = _nearest_frame(t, onsets[rows])
+        onset_time[rows] = t[onset_frame[rows]] - anchor
+        complete[rows] = valid.all(axis=1)
+        if not valid.any():
+            continue
+
+        lo, hi = left[valid].min(), right[valid].max() + 1
+        block = _read_span(data, lo, hi)
+        left_v = block[np.clip(left - lo, 0, hi - lo - 1)]  # (events, samples, rois)
+        if resample_rate is None:
+            values = left_v
+        else:
+            right_v = block[np.clip(right - lo, 0, hi - lo - 1)]
+            values = left_v + (right_v - left_v) * w[..., None]
+        values[~valid] = np.nan
+
+        tensor[rows] = values.transpose(0, 2, 1)
+
+    events = stim_df.assign(event_trial=event_trial, onset_frame=onset_frame,
+                            onset_time=onset_time, complete=complete)
+    return tensor, sample_times, events
@@ -0,0 +1,178 @@
+"""
+Export a SLAP2 NWB session to a flat directory of memory-mappable ``.npy`` files plus JSON,
+and read it back without pynwb.
+
+Layout of an export directory::
+
+    session.json                       source file, NWB identifier, segmentation keys
+    dff/                               raw data and timestamps of every DfOverF series
+    stimulus_presentations/            one .npy per column of the stimulus table
+    masks/<segmentation>/              dense image_mask stack
+    roi_tables/<segmentation>/         ROI ids and the scalar ROI table columns
+
+Usage:
+    python -m nwb_io.export --nwb session.nwb --output session.export
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+
+from .cache import GroupWriter, frame_from_cache, frame_to_cache, load_group
+from .imports import lazy_import
+from .index import SessionIndex
+from .load import NwbData, _masks_from_cache
+from .masks import SparseRoiMasks
+from .profiling import Profiler, profiled
+
+pd = lazy_import('pandas')
+
+EXPORT_FORMAT_VERSION = 1
+_MASK_COLUMNS = ('image_mask', 'pixel_mask', 'voxel_mask')
+
+
+def export_session(nwb_path, output_dir, verbose: bool = True) -> Path:
+    """
+    Write the dF/F series, timestamps, stimulus table and ROI masks of ``nwb_path`` to ``output_dir``.
+
+    Series and masks are streamed from HDF5 in blocks, one series at a time, so memory stays bounded
+    by the copy block size regardless of session length.
+    """
+    from hdmf.common import VectorIndex
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    with NwbData(nwb_path) as nwb:
+        with GroupWriter(output_dir / 'dff') as writer:
+            writer.meta['series'] = []
+            for info in nwb.index:
+                if verbose:
+                    print(f"Exporting {info.key} {info.shape}")
+                if info.series.timestamps is None:
+                    raise ValueError(f"Timestamps missing for {info.key}")
+                writer.add(f'{info.key}/data', info.series.data)
+                writer.add(f'{info.key}/timestamps', info.series.timestamps)
+                writer.meta['series'].append(info.key)
+
+        if 'stimulus_presentations' in nwb.nwbfile.intervals:
+            with GroupWriter(output_dir / 'stimulus_presentations') as writer:
+                frame_to_cache(writer, nwb.load_stimulus_data())
+
+        segmentation_keys = []
+        ophys = nwb.nwbfile.processing.get('ophys')
+        if ophys is not None and 'ImageSegmentation' in ophys.data_interfaces:
+            for seg_key, plane_seg in ophys.data_interfaces['ImageSegmentation'].plane_segmentations.items():
+                if verbose:
+                    print(f"Exporting {seg_key}")
+                segmentation_keys.append(seg_key)
+                if 'image_mask' in plane_seg.colnames:
+                    with GroupWriter(output_dir / 'masks' / seg_key) as writer:
+                        writer.add('image_mask', plane_seg['image_mask'].data)
+
+                with GroupWriter(output_dir / 'roi_tables' / seg_key) as writer:
+                    columns = {'id': np.asarray(plane_seg.id.data[:])}
+                    for col in plane_seg.colnames:
+                        if col in _MASK_COLUMNS or isinstance(plane_seg[col], VectorIndex):
+                            continue
+                        values = np.asarray(plane_seg[col].data[:])
+                        if values.ndim == 1:
+                            columns[col] = values
+                    frame_to_cache(writer, pd.DataFrame(columns).set_index('id'))
+
+        session = {
+            'format_version': EXPORT_FORMAT_VERSION,
+            'source': str(Path(nwb_path).resolve()),
+            'identifier': nwb.nwbfile.identifier,
+            'segmentations': segmentation_keys,
+        }
+        with open(output_dir / 'session.json', 'w') as f:
+            json.dump(session, f, indent=1)
+
+    return output_dir
+
+
+class _ArraySeries:
+    # Stand-in for a RoiResponseSeries: just the data and timestamps arrays
+    def __init__(self, data, timestamps):
+        self.data = data
+        self.timestamps = timestamps
+
+
+class ExportedSession(NwbData):
+    """
+    Reader for a directory written by ``export_session``, with the same methods as ``NwbData``.
+
+    Arrays are memory-mapped from the ``.npy`` files and pynwb is never imported.
+    ``get_roi_meta_data`` returns the exported ROI tables as DataFrames instead of
+    PlaneSegmentation objects.
+    """
+
+    def __init__(self, export_dir, profiler: Profiler = None):
+        super().__init__(Path(export_dir), profiler=profiler)
+        self._session = None
+
+    @profiled('open')
+    def _open(self):
+        with open(self.data_path / 'session.json') as f:
+            self._session = json.load(f)
+        if self._session['format_version'] > EXPORT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported export format version {self._session['format_version']}")
+
+        arrays, meta = load_group(self.data_path / 'dff')
+        self._index = SessionIndex({key: _ArraySeries(arrays[f'{key}/data'], arrays[f'{key}/timestamps'])
+                                    for key in meta['series']})
+
+    @property
+    def session(self) -> dict:
+        if self._session is None:
+            self._open()
+        return self._session
+
+    @property
+    def nwbfile(self):
+        raise AttributeError("Exported sessions have no NWBFile; use the NwbData methods instead")
+
+    @profiled()
+    def load_stimulus_data(self):
+        cached = load_group(self.data_path / 'stimulus_presentations')
+        if cached is None:
+            raise KeyError("stimulus_presentations was not exported")
+        return frame_from_cache(*cached)
+
+    @profiled()
+    def get_roi_meta_data(self):
+        return {seg_key: frame_from_cache(*load_group(self.data_path / 'roi_tables' / seg_key))
+                for seg_key in self.session['segmentations']}
+
+    @profiled()
+    def get_roi_masks_by_dmd(self, segmentation_key: str = 'DMD1_plane_segmentation', sparse: bool = False):
+        if len(self.session['segmentations']) == 0:
+            raise ValueError("No plane segmentations found.")
+        cached = load_group(self.data_path / 'masks' / segmentation_key)
+        if cached is None:
+            raise KeyError(f"Segmentation '{segmentation_key}' not found. Available: {self.session['segmentations']}")
+
+        image_mask = _masks_from_cache(*cached)
+        return SparseRoiMasks.from_dense(image_mask) if sparse else image_mask
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export an NWB session to a flat .npy + JSON directory')
+    parser.add_argument('--nwb', type=str, required=True,
+                        help='Path to NWB file')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Output directory (default: "<nwb name>.export" next to the NWB file)')
+    args = parser.parse_args()
+
+    output = args.output or str(Path(args.nwb).with_suffix('.export'))
+    export_session(args.nwb, output)
+    print(f"Session exported to {output}")
+
+
+if __name__ == "__main__":
+    main()
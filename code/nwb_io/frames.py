@@ -0,0 +1,55 @@
+"""
+Single images from ``(frames, height, width)`` image stacks such as ``ImageSeries.data``,
+read straight from the HDF5 dataset instead of loading the whole stack.
+"""
+
+import numpy as np
+
+FRAME_MODES = ('first', 'mean', 'max')
+
+# Bytes of frames read per block when computing a projection
+_BLOCK_BYTES = 64 << 20
+
+
+def _block_frames(data, block_bytes):
+    # Frames per read: as many as fit in block_bytes, rounded to whole HDF5 chunks along time
+    frame_bytes = int(np.prod(data.shape[1:], dtype=np.int64)) * np.dtype(data.dtype).itemsize
+    step = max(1, block_bytes // max(1, frame_bytes))
+    chunks = getattr(data, 'chunks', None)
+    if chunks:
+        step = max(chunks[0], step // chunks[0] * chunks[0])
+    return step
+
+
+def read_frame(data, mode: str = 'first', n_frames: int = None, block_bytes: int = _BLOCK_BYTES) -> np.ndarray:
+    """
+    One image out of an image stack, reading only the frames it needs.
+
+    ``mode`` is ``'first'`` (frame 0), ``'mean'`` (mean of the first ``n_frames`` frames) or
+    ``'max'`` (maximum projection of the first ``n_frames`` frames); ``n_frames`` of None uses
+    every frame. Projections are accumulated block by block, so at most ``block_bytes`` of
+    frames are in memory at a time. ``data`` can be an HDF5 dataset or an array.
+    """
+    if mode not in FRAME_MODES:
+        raise ValueError(f"Unknown frame mode {mode!r}; use one of {FRAME_MODES}")
+    if data.shape[0] == 0:
+        raise ValueError("Image stack has no frames")
+    if mode == 'first':
+        return np.asarray(data[0])
+
+    stop = data.shape[0] if n_frames is None else max(1, min(n_frames, data.shape[0]))
+    step = _block_frames(data, block_bytes)
+
+    projection = None
+    for start in range(0, stop, step):
+        block = np.asarray(data[start:min(start + step, stop)])
+        if mode == 'mean':
+            block_sum = block.sum(axis=0, dtype=np.float64)
+            projection = block_sum if projection is None else np.add(projection, block_sum, out=projection)
+        else:
+            block_max = block.max(axis=0)
+            projection = block_max if projection is None else np.maximum(projection, block_max, out=projection)
+
+    if mode == 'mean':
+        projection /= stop
+    return projection
@@ -0,0 +1,244 @@
+"""
+Memory-mapped reader of Harp register files (``<Device>_<address>.bin``).
+
+Every message of a register file has the same size, so the file is viewed as an array of
+message frames with a structured dtype: message type, length, address, port, payload type, the
+timestamp (seconds and 32 us ticks), the payload elements and a checksum. Reads return plain
+NumPy arrays, views into the file where possible, with no DataFrame or index construction, and
+time ranges are located by binary search over the memory-mapped timestamps, so only the pages of
+the requested range are read from disk.
+
+``HarpDevice`` maps register names to files and payload members to columns using the session's
+``device.yml`` (see ``nwb_io.harp_registry``)::
+
+    device = HarpDevice(harp_path)
+    t, photodiode = device.register('AnalogData').channel('AnalogInput0', t0=10, t1=20)
+"""
+
+from __future__ import annotations
+
+import bisect
+from pathlib import Path
+
+import numpy as np
+
+from .imports import lazy_import
+
+yaml = lazy_import('yaml')
+
+# Seconds per tick of the sub-second part of Harp timestamps
+SECONDS_PER_TICK = 32e-6
+_TIMESTAMP_FLAG = 0x10
+# Frames decoded per block, so that the strided timestamp fields are read while in cache
+_BLOCK_FRAMES = 1 << 20
+# Payload type codes of the message header (without the timestamp flag)
+_PAYLOAD_DTYPES = {
+    1: np.dtype('u1'), 2: np.dtype('<u2'), 4: np.dtype('<u4'), 8: np.dtype('<u8'),
+    129: np.dtype('i1'), 130: np.dtype('<i2'), 132: np.dtype('<i4'), 136: np.dtype('<i8'),
+    68: np.dtype('<f4'),
+}
+# Register types of device.yml
+_REGISTER_DTYPES = {
+    'U8': np.dtype('u1'), 'U16': np.dtype('<u2'), 'U32': np.dtype('<u4'), 'U64': np.dtype('<u8'),
+    'S8': np.dtype('i1'), 'S16': np.dtype('<i2'), 'S32': np.dtype('<i4'), 'S64': np.dtype('<i8'),
+    'Float': np.dtype('<f4'),
+}
+
+
+def frame_dtype(payload_dtype, length: int, timestamped: bool = True) -> np.dtype:
+    """Structured dtype of one Harp message carrying ``length`` elements of ``payload_dtype``."""
+    payload_dtype = np.dtype(payload_dtype)
+    names = ['type', 'length', 'address', 'port', 'payload_type']
+    formats = ['u1'] * 5
+    offsets = [0, 1, 2, 3, 4]
+    offset = 5
+    if timestamped:
+        names += ['seconds', 'ticks']
+        formats += ['<u4', '<u2']
+        offsets += [5, 9]
+        offset = 11
+    names += ['payload', 'checksum']
+    formats += [(payload_dtype, (length,)), 'u1']
+    offsets += [offset, offset + payload_dtype.itemsize * length]
+    return np.dtype({'names': names, 'formats': formats, 'offsets': offsets,
+                     'itemsize': offset + payload_dtype.itemsize * length + 1})
+
+
+def _decode_timestamps(frames):
+    # Seconds of every frame, computed in blocks with one output array
+    t = np.empty(len(frames))
+    for start in range(0, len(frames), _BLOCK_FRAMES):
+        block = frames[start:start + _BLOCK_FRAMES]
+        out = t[start:start + len(block)]
+        np.multiply(block['ticks'], SECONDS_PER_TICK, out=out)
+        out += block['seconds']
+    return t
+
+
+class _Timestamps:
+    # Sequence view of the timestamps of memory-mapped frames, decoded one at a time for bisect
+    def __init__(self, frames):
+        self.frames = frames
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, i):
+        frame = self.frames[i]
+        return float(frame['seconds']) + float(frame['ticks']) * SECONDS_PER_TICK
+
+
+class HarpRegister:
+    """
+    One Harp register file, memory-mapped as an array of message frames.
+
+    The frame layout is read from the header of the first message and checked against the
+    ``address``, ``dtype`` and ``length`` given (e.g. by ``device.yml``); an empty file needs
+    ``dtype`` and ``length`` to return correctly typed empty arrays. A truncated last message is ignored. ``columns`` maps column names to
+    ``(element, mask)`` of the payload, ``mask`` being None or a bit mask of the element.
+    """
+
+    def __init__(self, path, dtype=None, length: int = None, columns: dict = None, address: int = None):
+        self.path = Path(path)
+        size = self.path.stat().st_size
+        if size:
+            with open(self.path, 'rb') as f:
+                header = np.frombuffer(f.read(5), dtype=np.uint8)
+            self.address = int(header[2])
+            self.timestamped = bool(header[4] & _TIMESTAMP_FLAG)
+            self.dtype = _PAYLOAD_DTYPES[int(header[4]) & ~_TIMESTAMP_FLAG]
+            stride = int(header[1]) + 2
+            self.length = (stride - (11 if self.timestamped else 5) - 1) // self.dtype.itemsize
+            if address is not None and address != self.address:
+                raise ValueError(f"{self.path.name}: expected address {address} but got {self.address}")
+            if dtype is not None and np.dtype(dtype) != self.dtype:
+                raise ValueError(f"{self.path.name}: expected payload type {np.dtype(dtype)} but got {self.dtype}")
+            if length is not None and length != self.length:
+                raise ValueError(f"{self.path.name}: expected payload length {length} but got {self.length}")
+        else:
+            if dtype is None:
+                raise ValueError(f"{self.path.name} is empty: its payload dtype must be given")
+            self.address = address
+            self.timestamped = True
+            self.dtype = np.dtype(dtype)
+            self.length = length or 1
+
+        self.frame_dtype = frame_dtype(self.dtype, self.length, self.timestamped)
+        n_frames = size // self.frame_dtype.itemsize
+        self.frames = (np.memmap(self.path, dtype=self.frame_dtype, mode='r', shape=(n_frames,)) if n_frames
+                       else np.zeros(0, dtype=self.frame_dtype))
+        self.columns = columns or {f'{i}': (i, None) for i in range(self.length)}
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __repr__(self):
+        return (f"HarpRegister({self.path.name!r}, address={self.address}, dtype={self.dtype}, "
+                f"length={self.length}, frames={len(self)})")
+
+    def frame_range(self, t0: float = None, t1: float = None) -> slice:
+        """Frames with ``t0 <= timestamp < t1`` (either bound may be None), found by binary search."""
+        if not self.timestamped:
+            raise ValueError(f"{self.path.name} has no timestamps")
+        times = _Timestamps(self.frames)
+        start = 0 if t0 is None else bisect.bisect_left(times, t0)
+        stop = len(self) if t1 is None else bisect.bisect_left(times, t1, lo=start)
+        return slice(start, stop)
+
+    def _frames(self, t0, t1):
+        return self.frames if t0 is None and t1 is None else self.frames[self.frame_range(t0, t1)]
+
+    def timestamps(self, t0: float = None, t1: float = None) -> np.ndarray:
+        """Timestamps in seconds of the messages between ``t0`` and ``t1``."""
+        return _decode_timestamps(self._frames(t0, t1))
+
+    def read(self, t0: float = None, t1: float = None):
+        """
+        ``(timestamps, payload)`` of the messages between ``t0`` and ``t1`` (seconds, device time).
+
+        ``payload`` is a ``(messages, length)`` view into the memory-mapped file; copy it for a
+        contiguous array.
+        """
+        frames = self._frames(t0, t1)
+        return _decode_timestamps(frames), frames['payload']
+
+    def _decode(self, frames, columns):
+        payload = frames['payload']
+        values = {}
+        for column in columns:
+            element, mask = self.columns[column]
+            values[column] = payload[:, element]
+            if mask is not None:
+                values[column] = (values[column] & mask) >> _mask_shift(mask)
+        return _decode_timestamps(frames), values
+
+    def channels(self, columns, t0: float = None, t1: float = None):
+        """
+        ``(timestamps, {column: values})`` of payload columns (names of ``columns``) between ``t0``
+        and ``t1``, decoding the timestamps once. Unmasked values are views into the file.
+        """
+        return self._decode(self._frames(t0, t1), columns)
+
+    def blocks(self, columns, t0: float = None, t1: float = None, block_frames: int = _BLOCK_FRAMES):
+        """
+        Yield ``channels(columns, t0, t1)`` in blocks of ``block_frames`` messages, for streaming
+        through files larger than memory.
+        """
+        frames = self._frames(t0, t1)
+        for start in range(0, len(frames), block_frames):
+            yield self._decode(frames[start:start + block_frames], columns)
+
+    def channel(self, column, t0: float = None, t1: float = None):
+        """``(timestamps, values)`` of one payload column between ``t0`` and ``t1``; see ``channels``."""
+        t, values = self.channels([column], t0, t1)
+        return t, values[column]
+
+
+def _mask_shift(mask):
+    return (mask & -mask).bit_length() - 1
+
+
+def register_columns(name: str, register: dict) -> dict:
+    """
+    ``{column: (element, mask)}`` of a ``device.yml`` register, named like ``harp.create_reader``:
+    after the members of its ``payloadSpec``, else ``name`` or ``name_<i>`` for every element.
+    """
+    spec = register.get('payloadSpec')
+    if spec:
+        return {member: (int(props.get('offset') or 0), props.get('mask')) for member, props in spec.items()}
+    length = int(register.get('length') or 1)
+    return {name: (0, None)} if length == 1 else {f'{name}_{i}': (i, None) for i in range(length)}
+
+
+class HarpDevice:
+    """
+    Register files of one Harp session folder, named and typed after its ``device.yml``.
+
+    ``device_yml`` is a path, or the YAML content as bytes (e.g. from ``DeviceRegistry.device_yml``);
+    by default the ``device.yml`` of ``harp_path``. Registers that
+    ``device.yml`` does not describe (the common registers) are available by address.
+    """
+
+    def __init__(self, harp_path, device_yml=None):
+        self.harp_path = Path(harp_path)
+        if device_yml is None:
+            device_yml = self.harp_path / 'device.yml'
+        schema = yaml.safe_load(device_yml if isinstance(device_yml, bytes) else Path(device_yml).read_bytes())
+        self.name = schema['device']
+        self.registers = schema.get('registers') or {}
+        self._opened = {}
+
+    def path(self, address: int) -> Path:
+        return self.harp_path / f'{self.name}_{address}.bin'
+
+    def register(self, name_or_address) -> HarpRegister:
+        """The memory-mapped ``HarpRegister`` of a register, by name or address."""
+        if name_or_address not in self._opened:
+            if isinstance(name_or_address, str):
+                register = self.registers[name_or_address]
+                self._opened[name_or_address] = HarpRegister(
+                    self.path(register['address']), _REGISTER_DTYPES[register['type']], register.get('length') or 1,
+                    register_columns(name_or_address, register), register['address'])
+            else:
+                self._opened[name_or_address] = HarpRegister(self.path(name_or_address))
+        return self._opened[name_or_address]
@@ -0,0 +1,228 @@
+"""
+Local registry of Harp device descriptions: ``whoami.yml`` and the ``device.yml`` of each device.
+
+``harp.create_reader`` needs the ``device.yml`` of the device that recorded a session. A
+``DeviceRegistry`` resolves it by WhoAmI and release from, in order: memory, an on-disk cache, a
+fetcher (GitHub by default) and a read-only snapshot. Whatever is fetched is written to the
+cache, so a description costs one network round trip per machine, then one dictionary lookup per
+process. The cache and the snapshot share one layout::
+
+    whoami.yml
+    devices/<who_am_i>/<release>/device.yml
+
+A fetcher is any callable taking a URL and returning the bytes at it, or None if there is
+nothing there; ``{url: content}.get`` or ``directory_fetcher(mirror)`` stand in for GitHub in
+tests. Nodes without network access work from the snapshot next to this module
+(``harp_devices``, not part of the repository until filled) or from a cache copied over and
+pointed to by ``HARP_REGISTRY_DIR``, both filled on a connected machine::
+
+    python -m nwb_io.harp_registry 1216 --snapshot
+    python -m nwb_io.harp_registry 1216 --cache-dir harp_devices
+"""
+
+from __future__ import annotations
+
+import argparse
+import functools
+import os
+import warnings
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from .imports import lazy_import
+
+yaml = lazy_import('yaml')
+
+WHOAMI_URL = "https://raw.githubusercontent.com/harp-tech/protocol/main/whoami.yml"
+# Cache shared by every process of a user; HARP_REGISTRY_DIR overrides it
+DEFAULT_CACHE_DIR = Path(os.environ.get('HARP_REGISTRY_DIR', '~/.cache/harp_devices')).expanduser()
+# Read-only fallback shipped with the package, filled with ``--snapshot``
+BUNDLED_SNAPSHOT = Path(__file__).with_name('harp_devices')
+# Places of device.yml in a device repository, relative to the release
+_DEVICE_YML_PATHS = ('device.yml', 'software/bonsai/device.yml')
+# Seconds to wait for GitHub before treating the machine as offline
+_TIMEOUT = 5
+
+
+def http_fetcher(url: str):
+    """Content at ``url`` over HTTP(S), or None unless the server answers 200."""
+    import requests
+
+    response = requests.get(url, allow_redirects=True, timeout=_TIMEOUT)
+    return response.content if response.status_code == 200 else None
+
+
+def directory_fetcher(root):
+    """Fetcher reading ``<root>/<host>/<path>`` for every URL, e.g. from a mirror of raw GitHub files."""
+    root = Path(root)
+
+    def fetch(url):
+        parts = urlsplit(url)
+        path = root / parts.netloc / parts.path.lstrip('/')
+        return path.read_bytes() if path.is_file() else None
+    return fetch
+
+
+def _raw_url(url):
+    # Raw file URLs of a github.com repository
+    return url.replace("//github.com", "//raw.githubusercontent.com")
+
+
+class DeviceRegistry:
+    """
+    ``device.yml`` content of Harp devices by WhoAmI and release, cached in memory and on disk.
+
+    ``cache_dir`` of None keeps everything in memory; ``fetcher`` of None never goes online;
+    ``snapshot_dir`` of None has no fallback. After the first failure to reach the fetcher (no
+    network, timeout), the registry stays offline for the rest of the process instead of waiting
+    for every lookup to time out.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, fetcher=http_fetcher, snapshot_dir=BUNDLED_SNAPSHOT,
+                 whoami_url: str = WHOAMI_URL):
+        self.cache_dir = None if cache_dir is None else Path(cache_dir)
+        self.fetcher = fetcher
+        self.snapshot_dir = None if snapshot_dir is None else Path(snapshot_dir)
+        self.whoami_url = whoami_url
+        self._devices = {}
+        self._whoami = None
+
+    @property
+    def offline(self) -> bool:
+        return self.fetcher is None
+
+    @staticmethod
+    def _device_path(who_am_i, release):
+        return Path('devices', str(who_am_i), release.replace('/', '_'), 'device.yml')
+
+    @staticmethod
+    def _read(root, relative):
+        return None if root is None or not (root / relative).is_file() else (root / relative).read_bytes()
+
+    def _fetch(self, url):
+        if self.fetcher is None:
+            return None
+        try:
+            return self.fetcher(url)
+        except OSError as e:  # requests' connection errors and timeouts included
+            warnings.warn(f"Could not fetch {url} ({e.__class__.__name__}); using local Harp device files only")
+            self.fetcher = None
+            return None
+
+    def _store(self, relative, content):
+        if self.cache_dir is None:
+            return
+        path = self.cache_dir / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + f'.{os.getpid()}.tmp')
+        tmp.write_bytes(content)
+        os.replace(tmp, path)
+
+    def whoami(self, refresh: bool = False) -> dict:
+        """
+        ``{who_am_i: device entry}`` of ``whoami.yml``, from the cache, the fetcher or the snapshot;
+        ``refresh`` fetches it again.
+        """
+        if self._whoami is None or refresh:
+            content = None if refresh else self._read(self.cache_dir, 'whoami.yml')
+            if content is None:
+                content = self._fetch(self.whoami_url)
+                if content is not None:
+                    self._store('whoami.yml', content)
+            if content is None and not refresh:
+                content = self._read(self.snapshot_dir, 'whoami.yml')
+            if content is None:
+                raise FileNotFoundError(f"whoami.yml is not cached in {self.cache_dir} or in the snapshot, "
+                                        f"and could not be fetched from {self.whoami_url}")
+            self._whoami = yaml.safe_load(content.decode('utf-8'))['devices']
+        return self._whoami
+
+    def device_yml(self, who_am_i: int, release: str = "main") -> bytes:
+        """Content of the ``device.yml`` of the device with WhoAmI ``who_am_i`` at ``release``."""
+        key = (int(who_am_i), release)
+        if key not in self._devices:
+            self._devices[key] = self._resolve(*key)
+        return self._devices[key]
+
+    def _resolve(self, who_am_i, release):
+        relative = self._device_path(who_am_i, release)
+        content = self._read(self.cache_dir, relative)
+        if content is not None:
+            return content
+
+        snapshot = self._read(self.snapshot_dir, relative)
+        content = None
+        try:
+            if not self.offline:
+                content = self.fetch_device(who_am_i, release)
+        except (KeyError, ValueError, FileNotFoundError):
+            # Unknown to whoami.yml or missing from its repository: the snapshot may still have it
+            if snapshot is None:
+                raise
+        if content is not None:
+            self._store(relative, content)
+            return content
+        if snapshot is None:
+            raise FileNotFoundError(f"device.yml of WhoAmI {who_am_i} ({release}) is not cached in "
+                                    f"{self.cache_dir} or in the snapshot, and could not be fetched")
+        return snapshot
+
+    def fetch_device(self, who_am_i: int, release: str = "main"):
+        """
+        ``device.yml`` of WhoAmI ``who_am_i`` at ``release`` from the fetcher, whether or not it is
+        cached or in the snapshot; None once the registry is offline.
+        """
+        try:
+            device = self.whoami()[who_am_i]
+        except KeyError as e:
+            raise KeyError(f"WhoAmI {who_am_i} not found in whoami.yml") from e
+
+        repository_url = device.get("repositoryUrl", None)
+        if repository_url is None:
+            raise ValueError("Device's repositoryUrl not found in whoami.yml")
+
+        for path in _DEVICE_YML_PATHS:
+            content = self._fetch(_raw_url(f"{repository_url}/{release}/{path}"))
+            if content is not None or self.offline:
+                return content
+        raise FileNotFoundError(f"device.yml of WhoAmI {who_am_i} not found in {repository_url} ({release})")
+
+    def add(self, who_am_i: int, content: bytes, release: str = "main"):
+        """Register a known ``device.yml`` (e.g. one already next to a session) in memory and in the cache."""
+        self._devices[(int(who_am_i), release)] = content
+        self._store(self._device_path(who_am_i, release), content)
+
+
+@functools.cache
+def default_registry() -> DeviceRegistry:
+    """Process-wide registry with the default cache directory, GitHub fetcher and bundled snapshot."""
+    return DeviceRegistry()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fetch Harp device.yml files into the local device registry')
+    parser.add_argument('who_am_i', type=int, nargs='+',
+                        help='WhoAmI of every device to fetch')
+    parser.add_argument('--release', type=str, default='main',
+                        help='Release (branch or tag) of the device repositories (default: main)')
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--cache-dir', type=Path, default=DEFAULT_CACHE_DIR,
+                        help=f'Registry directory to write into, e.g. one to copy to an offline node '
+                             f'(default: {DEFAULT_CACHE_DIR})')
+    target.add_argument('--snapshot', action='store_true',
+                        help=f'Write into the snapshot next to the package ({BUNDLED_SNAPSHOT}) instead')
+    args = parser.parse_args()
+
+    target = BUNDLED_SNAPSHOT if args.snapshot else args.cache_dir
+    registry = DeviceRegistry(cache_dir=target, snapshot_dir=None)
+    registry.whoami(refresh=True)
+    for who_am_i in args.who_am_i:
+        content = registry.fetch_device(who_am_i, args.release)
+        if content is None:
+            raise SystemExit(f"Could not fetch the device.yml of WhoAmI {who_am_i}")
+        registry.add(who_am_i, content, args.release)
+        print(f"WhoAmI {who_am_i}: {target / registry._device_path(who_am_i, args.release)}")
+
+
+if __name__ == "__main__":
+    main()
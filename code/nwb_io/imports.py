@@ -0,0 +1,23 @@
+import importlib
+import sys
+import types
+
+
+class _LazyModule(types.ModuleType):
+    # Imports the real module on first attribute access and takes over its namespace
+    def __getattr__(self, attr):
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
+def lazy_import(name: str) -> types.ModuleType:
+    """
+    Return ``name`` as a module whose import is deferred until one of its attributes is used.
+
+    ``pd = lazy_import('pandas')`` at module level costs nothing until ``pd.DataFrame`` is first
+    touched, which keeps ``import nwb_io`` and the ``--help`` paths of the scripts fast.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return _LazyModule(name)
@@ -0,0 +1,109 @@
+import functools
+import re
+import warnings
+
+import numpy as np
+
+_TRIAL_RE = re.compile(r'Trial(\d+)')
+_DMD_RE = re.compile(r'DMD\d+')
+
+
+class SeriesInfo:
+    """Metadata for one RoiResponseSeries, gathered without reading its data or timestamp arrays."""
+
+    __slots__ = ('key', 'trial', 'dmd', 'series', 'shape', 'dtype', 't_first', 't_last')
+
+    def __init__(self, key, trial, dmd, series):
+        self.key = key
+        self.trial = trial
+        self.dmd = dmd
+        self.series = series
+        self.shape = tuple(series.data.shape)
+        self.dtype = np.dtype(series.data.dtype)
+
+        # Only the two endpoints are read, never the whole timestamp array
+        timestamps = series.timestamps
+        if timestamps is None or len(timestamps) == 0:
+            self.t_first = self.t_last = None
+        else:
+            self.t_first = float(timestamps[0])
+            self.t_last = float(timestamps[-1])
+
+    @property
+    def n_frames(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return f"SeriesInfo(key={self.key!r}, shape={self.shape}, t_first={self.t_first}, t_last={self.t_last})"
+
+
+class SessionIndex:
+    """
+    Trial id -> DMD -> SeriesInfo for the DfOverF series of one session.
+
+    Built in a single pass over ``roi_response_series`` when ``NwbData`` is opened so that the
+    loaders never have to re-parse series names or touch timestamp arrays to find trial bounds.
+    """
+
+    def __init__(self, roi_response_series=None):
+        self.trials = {}
+        self.series = {}
+        if roi_response_series is None:
+            return
+
+        # Anything with .data and .timestamps works as a series, not only pynwb RoiResponseSeries
+        for key, ts in roi_response_series.items():
+            trial_match = _TRIAL_RE.match(key)
+            if trial_match is None:
+                continue
+            dmd_match = _DMD_RE.search(key)
+            # Same fallback the loader has always used for series without an explicit DMD1
+            dmd = dmd_match.group(0) if dmd_match else 'DMD2'
+
+            info = SeriesInfo(key, int(trial_match.group(1)), dmd, ts)
+            self.trials.setdefault(info.trial, {})[dmd] = info
+            self.series[key] = info
+
+        self._warn_anchor()
+
+    @classmethod
+    def from_nwbfile(cls, nwbfile):
+        ophys = nwbfile.processing.get('ophys') if nwbfile.processing is not None else None
+        if ophys is None or 'DfOverF' not in ophys.data_interfaces:
+            return cls()
+        return cls(ophys.data_interfaces['DfOverF'].roi_response_series)
+
+    def __len__(self):
+        return len(self.series)
+
+    def __iter__(self):
+        return iter(self.series.values())
+
+    def trial_ids(self):
+        return sorted(self.trials)
+
+    def time_info(self, trial_id) -> SeriesInfo:
+        # The trial's 'time' entry comes from the last series registered for it, as in load_dFoverF_data
+        return list(self.trials[trial_id].values())[-1]
+
+    def _warn_anchor(self):
+        # Warned once here rather than on every anchor lookup
+        if 1 not in self.trials or self.time_info(1).t_first is None:
+            return
+        t_first = self.time_info(1).t_first
+        earliest_time = min(i.t_first for i in self if i.t_first is not None)
+        if t_first > earliest_time:
+            warnings.warn(
+                f"Trial1 does not have the earliest timestamp. "
+                f"Trial1 starts at {t_first:.3f}, but earliest trial starts at {earliest_time:.3f}."
+            )
+
+    @functools.cached_property
+    def anchor(self) -> float:
+        """Start time of Trial1, which every trial's timestamps are expressed relative to."""
+        if 1 not in self.trials:
+            raise ValueError("Could not find Trial1 to anchor timestamps.")
+        info = self.time_info(1)
+        if info.t_first is None:
+            raise ValueError(f"Timestamps missing for {info.key}")
+        return info.t_first
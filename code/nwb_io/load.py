@@ -1,129 +1,213 @@
+from __future__ import annotations
+
+import warnings
 from pathlib import Path
-from pynwb import NWBHDF5IO
-import pandas as pd
 import numpy as np
 from collections import defaultdict
-import warnings
+
+from .cache import SessionCache, frame_from_cache, frame_to_cache
+from .events import event_tensor
+from .imports import lazy_import
+from .index import SessionIndex
+from .masks import SparseRoiMasks
+from .profiling import Profiler, profiled
+from .stimulus import stimulus_feature_matrix
+from .sync import session_clock
+from .timing import concatenate_segments, find_frame_gaps, sampling_stats
+from .views import DffView, TimestampView
+from .wheel import running_speed
+
+pd = lazy_import('pandas')
+
+
+def _masks_from_cache(arrays, meta, sparse=False):
+    if sparse:
+        return SparseRoiMasks(arrays['indptr'], arrays['indices'], arrays['weights'], meta['image_shape'])
+    return arrays['image_mask']
+
 
 class NwbData:
-    def __init__(self, data_path: Path):
+    def __init__(self, data_path: Path, cache: SessionCache = None, profiler: Profiler = None):
         self.data_path = data_path
+        self.cache = cache
+        # Optional Profiler accounting the time, reads and memory of every load_* call to a stage
+        self.profiler = profiler
         self.io=None
-        self.nwbfile=None
+        self._nwbfile=None
+        self._index=None
 
     def __enter__(self):
-        self.io=NWBHDF5IO(str(self.data_path),mode='r')
-        self.nwbfile=self.io.read()
+        # With a cache the NWB file is only opened once something has to be read from it
+        if self.cache is None:
+            self._open()
         return self
     
     def __exit__(self, exc_type, exc_value, traceback):
         if self.io is not None:
             self.io.close()
+            self.io=None
 
+    @profiled('open')
+    def _open(self):
+        # Imported here so that readers which never touch the NWB file don't pay for pynwb
+        from pynwb import NWBHDF5IO
+        self.io=NWBHDF5IO(str(self.data_path),mode='r')
+        self._nwbfile=self.io.read()
+        self._index=SessionIndex.from_nwbfile(self._nwbfile)
+
+    @property
+    def nwbfile(self):
+        if self._nwbfile is None:
+            self._open()
+        return self._nwbfile
+
+    @property
+    def index(self) -> SessionIndex:
+        if self._index is None:
+            self._open()
+        return self._index
+
+    @profiled()
     def load_meta_data(self) -> pd.DataFrame:
-        dff_obj = self.nwbfile.processing['ophys'].data_interfaces['DfOverF']
-        keys = list(dff_obj.roi_response_series.keys())
-        shapes = [dff_obj.roi_response_series[key].data.shape for key in keys]
+        keys = list(self.index.series.keys())
+        shapes = [info.shape for info in self.index]
 
         meta_df = pd.DataFrame({'Key': keys, 'Shape': shapes})
-        meta_df['Trial'] = meta_df['Key'].str.extract(r'Trial(\d+)', expand=False).astype(int)
+        meta_df['Trial'] = [info.trial for info in self.index]
         meta_df_sorted = meta_df.sort_values(by='Trial').reset_index(drop=True)
         return meta_df_sorted
     
-    def load_sampling_rate_info(self, dFoverF_data) -> pd.DataFrame:
-        trial_rates = []
-
-        # Sort trials by number
-        sorted_trials = sorted(dFoverF_data.items(), key=lambda x: x[0])
-        first_trial_start_time = sorted_trials[0][1]['time'][0]
+    def _trial_timestamps(self, dFoverF_data=None):
+        # Timestamps of every trial with at least two frames, concatenated for segment reductions.
+        # Without loaded data they are read straight from the indexed timestamp datasets.
+        if dFoverF_data is None:
+            anchor = self.index.anchor
+            trials = {trial_id: self.index.time_info(trial_id).series.timestamps for trial_id in self.index.trial_ids()}
+        else:
+            anchor = 0.0
+            trials = {trial_id: trial_data['time'] for trial_id, trial_data in dFoverF_data.items()}
 
-        for trial_name, trial_data in sorted_trials:
-            t = trial_data['time']
-            if len(t) < 2:
-                print(f"Warning: Note enough data to estimate rate for {trial_name}")
+        trial_ids = []
+        for trial_id in sorted(trials):
+            if len(trials[trial_id]) < 2:
+                warnings.warn(f"Not enough data to estimate the frame rate of {trial_id}")
                 continue
+            trial_ids.append(trial_id)
 
-            dt = np.diff(t)
-            mean_rate = 1 / np.mean(dt)
-            median_rate = 1 / np.median(dt)
-            std_dt = np.std(dt)
-
-            # Total time
-            normed_timestamps = t - t[0]
-            total_trial_duration = normed_timestamps[-1]
-            trial_start_relative_to_first_trial = t[0] - first_trial_start_time
-            trial_end_relative_to_first_trial = t[-1] - first_trial_start_time
-
-            trial_rates.append({
-                'Trial': trial_name,
-                'Duration': round(total_trial_duration, 3),
-                'Trial Start (w.r.t. initial trial)': round(trial_start_relative_to_first_trial, 3),
-                'Trial End (w.r.t. initial trial)': round(trial_end_relative_to_first_trial, 3),
-                'Mean Rate (Hz)': round(mean_rate, 2),
-                'Median Rate (Hz)': round(median_rate, 2),
-                'Mean Δt (ms)': round(np.mean(dt) * 1000, 3),
-                'Median Δt (ms)': round(np.median(dt) * 1000, 3),
-                'Δt Std (ms)': round(std_dt * 1000, 4),
-                'Num Frames': len(t),
-            })
-
-        rate_df = pd.DataFrame(trial_rates).sort_values('Trial').reset_index(drop=True)
+        t, offsets = concatenate_segments([trials[trial_id] for trial_id in trial_ids])
+        return trial_ids, t - anchor, offsets
+
+    @profiled()
+    def load_sampling_rate_info(self, dFoverF_data=None, gap_threshold: float = 1.5) -> pd.DataFrame:
+        trial_ids, t, offsets = self._trial_timestamps(dFoverF_data)
+        # Frame drops: intervals longer than gap_threshold x the trial's median interval
+        stats = sampling_stats(t, offsets, gap_threshold)
+        first_trial_start_time = stats['t_first'][0]
+
+        rate_df = pd.DataFrame({
+            'Trial': trial_ids,
+            'Duration': np.round(stats['t_last'] - stats['t_first'], 3),
+            'Trial Start (w.r.t. initial trial)': np.round(stats['t_first'] - first_trial_start_time, 3),
+            'Trial End (w.r.t. initial trial)': np.round(stats['t_last'] - first_trial_start_time, 3),
+            'Mean Rate (Hz)': np.round(1 / stats['mean_dt'], 2),
+            'Median Rate (Hz)': np.round(1 / stats['median_dt'], 2),
+            'Mean Δt (ms)': np.round(stats['mean_dt'] * 1000, 3),
+            'Median Δt (ms)': np.round(stats['median_dt'] * 1000, 3),
+            'Δt Std (ms)': np.round(stats['std_dt'] * 1000, 4),
+            'Num Frames': stats['n_frames'],
+            'Num Gaps': stats['n_gaps'],
+            'Missing Frames': stats['missing_frames'],
+        })
+        rate_df = rate_df.sort_values('Trial').reset_index(drop=True)
         return rate_df
+
+    @profiled()
+    def load_frame_gaps(self, dFoverF_data=None, gap_threshold: float = 1.5) -> pd.DataFrame:
+        trial_ids, t, offsets = self._trial_timestamps(dFoverF_data)
+        segment, frame, gap, n_missing = find_frame_gaps(t, offsets, k=gap_threshold)
+
+        gap_df = pd.DataFrame({
+            'Trial': np.asarray(trial_ids)[segment],
+            'Frame': frame,
+            'Time': t[offsets[segment] + frame],
+            'Gap (ms)': np.round(gap * 1000, 3),
+            'Missing Frames': n_missing,
+        })
+        return gap_df
     
+    @profiled()
     def load_stimulus_data(self) -> pd.DataFrame:
+        if self.cache is not None:
+            cached = self.cache.load(self.data_path, 'stimulus_presentations')
+            if cached is not None:
+                return frame_from_cache(*cached)
+
         stim_table = self.nwbfile.intervals['stimulus_presentations']
         stim_df = stim_table.to_dataframe()
+
+        if self.cache is not None:
+            with self.cache.writer(self.data_path, 'stimulus_presentations') as writer:
+                frame_to_cache(writer, stim_df)
         return stim_df
     
-    def load_dFoverF_data(self):
+    @profiled()
+    def load_dFoverF_data(self, lazy: bool = False):
+        # Cached series come back memory-mapped, so they are as cheap to hold as the lazy views
+        if self.cache is not None:
+            return self._load_dFoverF_data_cached()
+
         data_dict = defaultdict(dict)
-        dff_obj = self.nwbfile.processing['ophys'].data_interfaces['DfOverF']
-
-        trial_start_times = {}
-        trial1_time0=None
-
-        # First pass: find Trial1 start time
-        for key in dff_obj.roi_response_series.keys():
-            if key.startswith('Trial1'):
-                ts = dff_obj.roi_response_series[key]
-                if ts.timestamps is None:
-                    raise ValueError(f"Timestamps missing for {key}")
-                trial1_time0 = ts.timestamps[0]
-                t0 = ts.timestamps[0]
-
-                trial_id = key.split('_')[0]
-                trial_start_times[trial_id] = min(trial_start_times.get(trial_id, t0), t0)
-
-                if trial_id == 'Trial1':
-                    trial1_time0 = t0
-
-        if trial1_time0 is None:
-            raise ValueError("Could not find Trial1 to anchor timestamps.")
-        
-        # Check if Trial1 is the earliest
-        earliest_time = min(trial_start_times.values())
-        if trial1_time0 > earliest_time:
-            warnings.warn(
-                f"Trial1 does not have the earliest timestamp. "
-                f"Trial1 starts at {trial1_time0:.3f}, but earliest trial starts at {earliest_time:.3f}."
-            )
-        
-        # Second pass: load and normalize all trials relative to Trial1 start
-        for key in dff_obj.roi_response_series.keys():
-            ts = dff_obj.roi_response_series[key]
-            x = ts.data[:].T  # (timepoints, rois)
+        trial1_time0 = self.index.anchor
 
+        # Single pass over the index: normalize all trials relative to Trial1 start
+        # With lazy=True nothing is read here; the views read on indexing while the file is open
+        for info in self.index:
+            ts = info.series
             if ts.timestamps is None:
-                raise ValueError(f"Timestamps missing for {key}")
-            t = ts.timestamps[:] - trial1_time0
-
-            trial_str = key.split('_')[0] # e.g., 'Trial1'
-            trial_id = int(trial_str.replace('Trial','')) # e.g., 1
-            dmd_id = 'DMD1' if 'DMD1' in key else 'DMD2'
-            data_dict[trial_id][dmd_id] = x
-            data_dict[trial_id]['time'] = t
+                raise ValueError(f"Timestamps missing for {info.key}")
+
+            if lazy:
+                t = TimestampView(ts.timestamps, offset=trial1_time0)
+                x = DffView(ts.data, t)
+            else:
+                x = ts.data[:].T  # (timepoints, rois)
+                t = ts.timestamps[:] - trial1_time0
+
+            data_dict[info.trial][info.dmd] = x
+            data_dict[info.trial]['time'] = t
         return data_dict
     
+    def _load_dFoverF_data_cached(self):
+        cached = self.cache.load(self.data_path, 'dff')
+        if cached is None:
+            trial1_time0 = self.index.anchor
+            with self.cache.writer(self.data_path, 'dff') as writer:
+                writer.meta['series'] = []
+                for info in self.index:
+                    ts = info.series
+                    if ts.timestamps is None:
+                        raise ValueError(f"Timestamps missing for {info.key}")
+                    writer.add(f'{info.key}/data', ts.data)
+                    writer.add(f'{info.key}/time', ts.timestamps, offset=trial1_time0)
+                    writer.meta['series'].append([info.key, info.trial, info.dmd])
+            cached = self.cache.load(self.data_path, 'dff')
+
+        arrays, meta = cached
+        data_dict = defaultdict(dict)
+        for key, trial_id, dmd_id in meta['series']:
+            data_dict[trial_id][dmd_id] = arrays[f'{key}/data'].T  # (timepoints, rois)
+            data_dict[trial_id]['time'] = arrays[f'{key}/time']
+        return data_dict
+
+    @profiled()
+    def load_event_tensor(self, pre: float, post: float, dmd: str = 'DMD1', stim_df: pd.DataFrame = None,
+                          resample_rate: float = None):
+        # (events, rois, samples) around every stimulus onset; see events.event_tensor
+        if stim_df is None:
+            stim_df = self.load_stimulus_data()
+        return event_tensor(self.index, stim_df, pre, post, dmd=dmd, resample_rate=resample_rate)
+
+    @profiled()
     def get_roi_meta_data(self):
         img_seg = self.nwbfile.processing['ophys'].data_interfaces['ImageSegmentation']
         plane_segmentations = img_seg.plane_segmentations
@@ -136,7 +220,15 @@ class NwbData:
 
         return plane_segmentations_meta_data
 
-    def get_roi_masks_by_dmd(self, segmentation_key: str = 'DMD1_plane_segmentation'):
+    @profiled()
+    def get_roi_masks_by_dmd(self, segmentation_key: str = 'DMD1_plane_segmentation', sparse: bool = False):
+        # sparse=True returns SparseRoiMasks (CSR over flattened pixels) instead of the dense (n_rois, H, W) stack
+        group = f"{'sparse_masks' if sparse else 'masks'}/{segmentation_key}"
+        if self.cache is not None:
+            cached = self.cache.load(self.data_path, group)
+            if cached is not None:
+                return _masks_from_cache(*cached, sparse=sparse)
+
         img_seg = self.nwbfile.processing['ophys'].data_interfaces['ImageSegmentation']
         plane_segmentations = dict(img_seg.plane_segmentations.items())
 
@@ -146,25 +238,67 @@ class NwbData:
         if segmentation_key not in plane_segmentations:
             raise KeyError(f"Segmentation '{segmentation_key}' not found. Available: {list(plane_segmentations.keys())}")
 
-        return plane_segmentations[segmentation_key]['image_mask'].data[:]
+        image_mask = plane_segmentations[segmentation_key]['image_mask'].data
+        masks = SparseRoiMasks.from_dense(image_mask) if sparse else image_mask
+
+        if self.cache is not None:
+            with self.cache.writer(self.data_path, group) as writer:
+                if sparse:
+                    writer.add('indptr', masks.indptr)
+                    writer.add('indices', masks.indices)
+                    writer.add('weights', masks.weights)
+                    writer.meta['image_shape'] = list(masks.image_shape)
+                else:
+                    writer.add('image_mask', image_mask)
+            return _masks_from_cache(*self.cache.load(self.data_path, group), sparse=sparse)
 
+        return masks if sparse else image_mask[:]
+
+    @profiled()
     def add_stimulus_timeseries(self, dFoverF_data, stim_df, features=('orientation', 'contrast', 'x_position', 'y_position', 'delay',
                                                                     'diameter', 'spatial_frequency', 'temporal_frequency')):
         stim_df = stim_df.copy()
         stim_df['trial']=stim_df['trial'].astype(int)
+        trial_groups = {trial_id: rows for trial_id, rows in stim_df.groupby('trial', sort=False)}
+        features = list(features)
 
         for trial_id, trial_data in dFoverF_data.items():
-            t = trial_data['time']
-            stim_ts = {feat: np.full_like(t,np.nan, dtype=float) for feat in features}
-
-            trial_stimuli = stim_df[stim_df['trial'] == trial_id]
+            t = np.asarray(trial_data['time'], dtype=float)
+            trial_stimuli = trial_groups.get(trial_id, stim_df.iloc[:0])
 
-            for _,row in trial_stimuli.iterrows():
-                # Find time indices within stimulus window
-                stim_mask = (t >= row['start_time']) & (t <= row['stop_time'])
-                for feat in features:
-                    stim_ts[feat][stim_mask] = row[feat]
+            # One interval search over all stimuli, then one gather for every feature
+            stim_matrix = stimulus_feature_matrix(t, trial_stimuli['start_time'].to_numpy(),
+                                                  trial_stimuli['stop_time'].to_numpy(),
+                                                  trial_stimuli[features].to_numpy(dtype=float))
+            stim_ts = {feat: stim_matrix[:, i] for i, feat in enumerate(features)}
 
             dFoverF_data[trial_id]['stim_ts'] = stim_ts # Dict of np.array_split
 
-        return dFoverF_data
\ No newline at end of file
+        return dFoverF_data
+
+    @profiled()
+    def add_running_speed(self, dFoverF_data, blocks, cm_per_count: float, clock, **kwargs):
+        # blocks: (harp_times, encoder_counts) in time order, e.g. HarpRegister.blocks(['Encoder']);
+        # clock maps Harp seconds to NWB timestamps (harp_clock), the two clocks do not share an origin.
+        # See nwb_io.wheel.WheelSpeed for the filter options.
+        trial_ids = list(dFoverF_data)
+        t, offsets = concatenate_segments([dFoverF_data[trial_id]['time'] for trial_id in trial_ids])
+        # Trials are streamed as one sorted series of NWB timestamps
+        order = np.argsort(t, kind='stable')
+        speed = np.empty(len(t))
+        speed[order] = running_speed(blocks, cm_per_count, t[order] + self.index.anchor, clock=clock, **kwargs)
+        if len(speed) and np.isnan(speed).all():
+            raise ValueError("The encoder recording does not overlap the frame times; is clock the "
+                             "ClockSync of this session (harp_clock)?")
+
+        for i, trial_id in enumerate(trial_ids):
+            dFoverF_data[trial_id]['running_speed'] = speed[offsets[i]:offsets[i + 1]]
+
+        return dFoverF_data
+
+    @profiled()
+    def harp_clock(self, device, pulses=('PulseDO0',), **kwargs):
+        # ClockSync from the Harp seconds of a HarpDevice to the NWB timestamps, fitted to the trial
+        # start/stop pulses; subtract index.anchor to compare with dFoverF_data[trial]['time'].
+        # It is the clock argument of add_running_speed.
+        return session_clock(self, device, pulses, **kwargs)
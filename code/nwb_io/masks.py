@@ -0,0 +1,151 @@
+import numpy as np
+
+# ROIs read per block when converting a dense image_mask dataset
+_ROI_BLOCK = 256
+
+
+class SparseRoiMasks:
+    """
+    ROI masks stored as CSR over flattened pixels.
+
+    ROI ``i`` covers the flat pixel indices ``indices[indptr[i]:indptr[i + 1]]`` with the matching
+    ``weights``. Background pixels (0 or NaN in the dense ``image_mask``) are not stored, so memory
+    scales with the number of ROI pixels rather than ROIs x field of view.
+    """
+
+    def __init__(self, indptr, indices, weights, image_shape):
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.weights = np.asarray(weights)
+        self.image_shape = tuple(int(n) for n in image_shape)
+
+    @classmethod
+    def from_dense(cls, image_mask, block_size: int = _ROI_BLOCK):
+        """Build from an ``(n_rois, H, W)`` array or HDF5 dataset, reading ``block_size`` ROIs at a time."""
+        n_rois, height, width = image_mask.shape
+        counts = np.zeros(n_rois, dtype=np.int64)
+        indices, weights = [], []
+
+        for start in range(0, n_rois, block_size):
+            block = np.asarray(image_mask[start:start + block_size]).reshape(-1, height * width)
+            valid = (block != 0) & ~np.isnan(block)
+            rows, pixels = np.nonzero(valid)
+            counts[start:start + len(block)] = np.bincount(rows, minlength=len(block))
+            indices.append(pixels)
+            weights.append(block[rows, pixels])
+
+        indptr = np.concatenate([[0], np.cumsum(counts)])
+        return cls(indptr,
+                   np.concatenate(indices) if indices else np.empty(0, dtype=np.int64),
+                   np.concatenate(weights) if weights else np.empty(0),
+                   (height, width))
+
+    @classmethod
+    def from_pixel_masks(cls, pixel_masks, image_shape):
+        """Build from NWB-style pixel masks: one ``(n_pixels, 3)`` array of ``(x, y, weight)`` per ROI."""
+        pixel_masks = [np.asarray(p, dtype=float).reshape(-1, 3) for p in pixel_masks]
+        counts = np.array([len(p) for p in pixel_masks], dtype=np.int64)
+        stacked = np.concatenate(pixel_masks) if pixel_masks else np.empty((0, 3))
+        return cls.from_pixel_table(stacked, np.cumsum(counts), image_shape)
+
+    @classmethod
+    def from_pixel_table(cls, pixels, ends, image_shape=None):
+        """
+        Build from the flat pixel table of a ragged NWB ``pixel_mask`` column (its ``target.data``)
+        and the end offset of every ROI in it (its ``data``). Rows are ``(x, y, weight)``, as a
+        compound dtype with those fields or an ``(n_pixels, 3)`` array. ``image_shape`` defaults to
+        the extent of the pixel coordinates.
+        """
+        pixels = np.asarray(pixels)
+        if pixels.dtype.names:
+            names = ('x', 'y', 'weight') if {'x', 'y', 'weight'} <= set(pixels.dtype.names) else pixels.dtype.names[:3]
+            x, y, weights = (pixels[name] for name in names)
+        else:
+            pixels = pixels.reshape(-1, 3)
+            x, y, weights = pixels[:, 0], pixels[:, 1], pixels[:, 2]
+        x, y = x.astype(np.int64), y.astype(np.int64)
+        if image_shape is None:
+            image_shape = (int(y.max()) + 1 if len(y) else 1, int(x.max()) + 1 if len(x) else 1)
+        indices = np.ravel_multi_index((y, x), image_shape)
+        return cls(np.concatenate([[0], np.asarray(ends, dtype=np.int64)]), indices, weights, image_shape)
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    @property
+    def n_rois(self):
+        return len(self)
+
+    @property
+    def nbytes(self):
+        return self.indptr.nbytes + self.indices.nbytes + self.weights.nbytes
+
+    def roi_ids(self):
+        """ROI index of every stored pixel."""
+        return np.repeat(np.arange(self.n_rois), np.diff(self.indptr))
+
+    def pixel_mask(self, roi):
+        """``(n_pixels, 3)`` array of ``(x, y, weight)`` for one ROI, as in NWB pixel masks."""
+        sl = slice(self.indptr[roi], self.indptr[roi + 1])
+        y, x = np.unravel_index(self.indices[sl], self.image_shape)
+        return np.column_stack([x, y, self.weights[sl]])
+
+    def to_dense(self, rois=None):
+        rois = np.arange(self.n_rois) if rois is None else np.atleast_1d(rois)
+        out = np.zeros((len(rois),) + self.image_shape, dtype=self.weights.dtype)
+        flat = out.reshape(len(rois), -1)
+        for i, roi in enumerate(rois):
+            sl = slice(self.indptr[roi], self.indptr[roi + 1])
+            flat[i, self.indices[sl]] = self.weights[sl]
+        return out
+
+    def label_image(self):
+        """``(H, W)`` int32 image with ROI ``i`` labelled ``i + 1``; where ROIs overlap the later one wins."""
+        labels = np.zeros(self.image_shape[0] * self.image_shape[1], dtype=np.int32)
+        np.maximum.at(labels, self.indices, self.roi_ids().astype(np.int32) + 1)
+        return labels.reshape(self.image_shape)
+
+    def areas(self):
+        """Number of pixels in every ROI."""
+        return np.diff(self.indptr)
+
+    def centroids(self, weighted: bool = True):
+        """``(n_rois, 2)`` array of ``(y, x)`` centroids, NaN for empty ROIs."""
+        y, x = np.unravel_index(self.indices, self.image_shape)
+        roi_ids = self.roi_ids()
+        w = np.abs(self.weights).astype(float) if weighted else np.ones(len(self.indices))
+        total = np.bincount(roi_ids, weights=w, minlength=self.n_rois)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cy = np.bincount(roi_ids, weights=w * y, minlength=self.n_rois) / total
+            cx = np.bincount(roi_ids, weights=w * x, minlength=self.n_rois) / total
+        return np.column_stack([cy, cx])
+
+    def project(self, frames, normalize: bool = True, block_size: int = 512):
+        """
+        Project a frame stack onto the ROIs.
+
+        ``frames`` is ``(T, H, W)`` (array or HDF5 dataset) and is read ``block_size`` frames at a
+        time. Returns ``(T, n_rois)`` weighted sums, divided by each ROI's total weight when
+        ``normalize`` is set.
+        """
+        n_frames = frames.shape[0]
+        out = np.zeros((n_frames, self.n_rois))
+        starts = self.indptr[:-1]
+        nonempty = np.diff(self.indptr) > 0
+
+        for start in range(0, n_frames, block_size):
+            block = np.asarray(frames[start:start + block_size]).reshape(-1, self.image_shape[0] * self.image_shape[1])
+            contrib = block[:, self.indices] * self.weights
+            if contrib.shape[1]:
+                # reduceat on the non-empty ROIs only; empty ROIs stay 0
+                out[start:start + len(block), nonempty] = np.add.reduceat(contrib, starts[nonempty], axis=1)
+
+        if normalize:
+            total = np.add.reduceat(self.weights.astype(float), starts[nonempty]) if nonempty.any() else np.empty(0)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                out[:, nonempty] /= total
+            out[:, ~nonempty] = np.nan
+        return out
+
+    def __repr__(self):
+        return f"SparseRoiMasks(n_rois={self.n_rois}, image_shape={self.image_shape}, n_pixels={len(self.indices)})"
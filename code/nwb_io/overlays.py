@@ -0,0 +1,113 @@
+"""
+Stimulus overlays drawn as a few matplotlib collections instead of one artist per presentation.
+
+Intervals (``start``, ``stop``) become rectangles of a ``PolyCollection`` and onsets the segments
+of a ``LineCollection``, one collection per distinct value (stimulus type, parameter value...) so
+that every value can have its own color and legend entry. Thousands of presentations then cost a
+handful of artists to draw and save.
+"""
+
+import numpy as np
+
+from .imports import lazy_import
+
+mcollections = lazy_import('matplotlib.collections')
+mcolors = lazy_import('matplotlib.colors')
+pd = lazy_import('pandas')
+
+
+def _groups(n, values, colors):
+    # (value, index array, color) for each distinct value, in order of first appearance. Values
+    # are never sorted, so they can be of mixed types; missing values (None, NaN) form one group.
+    if values is None:
+        yield None, np.arange(n), colors
+        return
+
+    if not hasattr(values, 'dtype'):
+        # Not through np.asarray, which turns [1, 'a'] into strings
+        values = pd.Series(values, dtype=object)
+    if len(values) != n:
+        raise ValueError(f"Got {len(values)} values for {n} intervals")
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    # Indices of every value, from one stable sort of the codes
+    order = np.argsort(codes, kind='stable')
+    index = np.split(order, np.cumsum(np.bincount(codes, minlength=len(uniques)))[:-1])
+    cycle = list(mcolors.TABLEAU_COLORS.values())
+    for rank, value in enumerate(uniques):
+        if isinstance(colors, dict):
+            color = colors[value]
+        else:
+            color = colors if colors is not None else cycle[rank % len(cycle)]
+        yield value, index[rank], color
+
+
+def _y_transform(ax, ycoords):
+    if ycoords == 'axes':
+        return ax.get_xaxis_transform()
+    if ycoords == 'data':
+        return ax.transData
+    raise ValueError(f"Unknown ycoords {ycoords!r}; use 'axes' or 'data'")
+
+
+def _add(ax, collection, x, ymin, ymax, ycoords):
+    ax.add_collection(collection, autolim=False)
+    if len(x):
+        # Like axvspan/axvline: the x range is autoscaled, y only when it is in data units
+        x = np.asarray(x, dtype=float)
+        y = [ymin, ymax] if ycoords == 'data' else [0, 0]
+        ax.update_datalim([[np.nanmin(x), y[0]], [np.nanmax(x), y[1]]], updatey=ycoords == 'data')
+        ax.autoscale_view()
+
+
+def add_intervals(ax, starts, stops, values=None, colors=None, ymin=0.0, ymax=1.0, ycoords='axes', **kwargs):
+    """
+    Shade ``[starts[i], stops[i]]`` between ``ymin`` and ``ymax`` with one PolyCollection per value.
+
+    ``values`` (one per interval) groups the intervals; ``colors`` is a single color, a dict
+    mapping each value to a color, or None for the Tableau color cycle. ``ymin`` and ``ymax``
+    are axes fractions like ``axvspan``, or data units with ``ycoords='data'``. Other keyword
+    arguments (``alpha``, ``edgecolor``, ``label``...) go to every collection; without an explicit
+    ``label`` each collection is labelled with its value. Returns ``{value: collection}``.
+    """
+    starts = np.asarray(starts, dtype=float)
+    stops = np.asarray(stops, dtype=float)
+    transform = _y_transform(ax, ycoords)
+
+    collections = {}
+    for value, index, color in _groups(len(starts), values, colors):
+        x0, x1 = starts[index], stops[index]
+        # (n, 4, 2) rectangle corners, counterclockwise from the bottom left
+        verts = np.stack([np.column_stack([x0, np.full_like(x0, ymin)]),
+                          np.column_stack([x1, np.full_like(x1, ymin)]),
+                          np.column_stack([x1, np.full_like(x1, ymax)]),
+                          np.column_stack([x0, np.full_like(x0, ymax)])], axis=1)
+        options = {'label': None if value is None else str(value), **kwargs}
+        if color is not None:
+            options.setdefault('color', color)
+        collection = mcollections.PolyCollection(verts, transform=transform, **options)
+        _add(ax, collection, np.concatenate([x0, x1]), ymin, ymax, ycoords)
+        collections[value] = collection
+    return collections
+
+
+def add_events(ax, x, values=None, colors=None, ymin=0.0, ymax=1.0, ycoords='axes', **kwargs):
+    """
+    Vertical lines at ``x`` from ``ymin`` to ``ymax`` with one LineCollection per value.
+
+    Arguments are those of ``add_intervals``; the keyword arguments are LineCollection properties
+    (``linewidth``, ``linestyle``, ``alpha``...). Returns ``{value: collection}``.
+    """
+    x = np.asarray(x, dtype=float)
+    transform = _y_transform(ax, ycoords)
+
+    collections = {}
+    for value, index, color in _groups(len(x), values, colors):
+        segments = np.stack([np.column_stack([x[index], np.full(len(index), ymin)]),
+                             np.column_stack([x[index], np.full(len(index), ymax)])], axis=1)
+        options = {'label': None if value is None else str(value), **kwargs}
+        if color is not None:
+            options.setdefault('colors', color)
+        collection = mcollections.LineCollection(segments, transform=transform, **options)
+        _add(ax, collection, x[index], ymin, ymax, ycoords)
+        collections[value] = collection
+    return collections
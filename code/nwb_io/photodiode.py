@@ -0,0 +1,167 @@
+"""
+Photodiode flip detection and alignment of the flips to stimulus onsets.
+
+The photodiode trace is thresholded with hysteresis: it is high once above ``high``, low once
+below ``low``, and keeps its last state in between, which is a forward fill of the last crossing
+index (``np.maximum.accumulate``) rather than a loop over samples. Flips that do not hold for
+``min_duration`` (bounces, glitches) are debounced on the run lengths between flips. A
+``FlipDetector`` carries the hysteresis state from one block to the next, so a session can be
+streamed from a memory-mapped Harp file (``HarpRegister.blocks``) without holding it in memory.
+
+Flips are then assigned to the expected stimulus onsets with one ``searchsorted``, giving the
+display latency of every stimulus.
+"""
+
+import numpy as np
+
+# Samples thresholded per block: bounds the temporary index arrays
+_BLOCK_SAMPLES = 1 << 20
+# Flips holding for less than this are not real: shorter than a frame of a 60 Hz display
+DEFAULT_MIN_DURATION = 0.01
+# Samples used to estimate the thresholds of a trace
+_THRESHOLD_SAMPLES = 1_000_000
+
+
+def flip_thresholds(x, low_fraction: float = 0.25, high_fraction: float = 0.75):
+    """
+    ``(low, high)`` hysteresis thresholds at fractions of the range between the dark and bright
+    levels of a photodiode trace (its 1st and 99th percentiles). Long traces are subsampled.
+    """
+    step = max(1, len(x) // _THRESHOLD_SAMPLES)
+    dark, bright = np.nanpercentile(np.asarray(x[::step], dtype=np.float64), [1, 99])
+    return dark + low_fraction * (bright - dark), dark + high_fraction * (bright - dark)
+
+
+def hysteresis_state(x, low, high, initial: int = -1) -> np.ndarray:
+    """
+    State of every sample of ``x`` (1 high, 0 low) thresholded with hysteresis: samples between
+    ``low`` and ``high`` (or NaN) keep the state of the last sample outside, and those before any
+    crossing get ``initial`` (-1 for unknown).
+    """
+    x = np.asarray(x)
+    marks = np.full(len(x), -1, dtype=np.int8)
+    marks[x <= low] = 0
+    marks[x >= high] = 1
+    # Index of the last sample that crossed a threshold, forward-filled
+    last = np.where(marks >= 0, np.arange(len(x)), -1)
+    np.maximum.accumulate(last, out=last)
+    return np.where(last >= 0, marks[np.maximum(last, 0)], np.int8(initial)).astype(np.int8)
+
+
+def debounce(times, rising, min_duration: float = DEFAULT_MIN_DURATION):
+    """
+    Drop the flips of runs shorter than ``min_duration`` seconds.
+
+    A short run takes the state of the next run that lasts, so a glitch disappears (both of its
+    flips) and a bouncing transition is kept at its first flip. The last run is taken to last.
+    Returns the kept ``(times, rising)``.
+    """
+    times = np.asarray(times, dtype=np.float64)
+    rising = np.asarray(rising, dtype=bool)
+    n = len(times)
+    if n == 0 or not min_duration:
+        return times, rising
+
+    lasting = np.append(np.diff(times) >= min_duration, True)
+    # Index of the next lasting run, backward-filled
+    next_lasting = np.where(lasting, np.arange(n), n)
+    next_lasting = np.minimum.accumulate(next_lasting[::-1])[::-1]
+    state = rising[next_lasting]
+    # The state before the first flip is the opposite of its direction
+    keep = state != np.concatenate([[not rising[0]], state[:-1]])
+    return times[keep], state[keep]
+
+
+class FlipDetector:
+    """
+    Streaming photodiode flip detector: feed blocks of ``(values, times)`` in time order to
+    ``update``, then get the debounced flips from ``flips``.
+
+    The hysteresis state is carried across blocks, so the result does not depend on the block
+    boundaries. Only the raw flips are kept between blocks. Without ``initial_state`` the first
+    threshold crossing sets the state and is not a flip.
+    """
+
+    def __init__(self, low: float, high: float, min_duration: float = DEFAULT_MIN_DURATION, initial_state: int = None):
+        if low > high:
+            raise ValueError(f"Low threshold {low} is above the high threshold {high}")
+        self.low = low
+        self.high = high
+        self.min_duration = min_duration
+        self.state = -1 if initial_state is None else int(initial_state)
+        self._times = []
+        self._rising = []
+
+    def update(self, values, times):
+        for start in range(0, len(values), _BLOCK_SAMPLES):
+            state = hysteresis_state(values[start:start + _BLOCK_SAMPLES], self.low, self.high, self.state)
+            previous = np.concatenate([[self.state], state[:-1]])
+            flips = np.flatnonzero((state != previous) & (previous >= 0))
+            self._times.append(np.asarray(times[start:start + _BLOCK_SAMPLES], dtype=np.float64)[flips])
+            self._rising.append(state[flips] == 1)
+            self.state = int(state[-1])
+
+    def flips(self):
+        """``(times, rising)`` of the debounced flips seen so far."""
+        times = np.concatenate(self._times) if self._times else np.zeros(0)
+        rising = np.concatenate(self._rising) if self._rising else np.zeros(0, dtype=bool)
+        return debounce(times, rising, self.min_duration)
+
+
+def detect_flips(values, times, low: float = None, high: float = None, min_duration: float = DEFAULT_MIN_DURATION):
+    """
+    ``(times, rising)`` of the flips of a photodiode trace, thresholded with hysteresis and
+    debounced. Thresholds default to ``flip_thresholds(values)``; ``values`` and ``times`` can be
+    memory-mapped, they are read block by block.
+    """
+    if low is None or high is None:
+        default_low, default_high = flip_thresholds(values)
+        low = default_low if low is None else low
+        high = default_high if high is None else high
+    detector = FlipDetector(low, high, min_duration)
+    detector.update(values, times)
+    return detector.flips()
+
+
+def match_onsets(flip_times, onsets, max_latency: float, min_latency: float = 0.0):
+    """
+    Assign to every expected onset the first flip ``min_latency`` to ``max_latency`` seconds after it.
+
+    Flips and onsets must share a clock. The assignment is monotonic: a flip goes to at most one
+    onset, the last one before it, and earlier onsets claiming the same flip stay unmatched (a
+    missed display frame). Returns ``(flip_index, latency)`` in the order of ``onsets``, with -1
+    and NaN for unmatched onsets.
+    """
+    flip_times = np.asarray(flip_times, dtype=np.float64)
+    onsets = np.asarray(onsets, dtype=np.float64)
+    order = np.argsort(onsets, kind='stable')
+    sorted_onsets = onsets[order]
+
+    index = np.searchsorted(flip_times, sorted_onsets + min_latency, side='left')
+    matched = index < len(flip_times)
+    latency = np.full(len(onsets), np.nan)
+    latency[matched] = flip_times[index[matched]] - sorted_onsets[matched]
+    matched &= latency <= max_latency
+    # index is non-decreasing: of the onsets sharing a flip, only the last keeps it
+    shared = np.zeros(len(onsets), dtype=bool)
+    shared[:-1] = matched[1:] & (index[1:] == index[:-1])
+    matched &= ~shared
+
+    flip_index = np.full(len(onsets), -1)
+    flip_latency = np.full(len(onsets), np.nan)
+    flip_index[order[matched]] = index[matched]
+    flip_latency[order[matched]] = latency[matched]
+    return flip_index, flip_latency
+
+
+def display_latencies(stim_df, flip_times, max_latency: float = 0.1, min_latency: float = 0.0,
+                      onset_column: str = 'start_time', offset: float = 0.0):
+    """
+    ``stim_df`` with the ``flip_time`` and display ``latency`` (seconds, NaN when no flip matched) of
+    every stimulus. ``offset`` is added to the onsets to bring them to the clock of ``flip_times``.
+    """
+    onsets = stim_df[onset_column].to_numpy(dtype=np.float64) + offset
+    flip_index, latency = match_onsets(flip_times, onsets, max_latency, min_latency)
+    flip_time = np.full(len(onsets), np.nan)
+    flip_time[flip_index >= 0] = np.asarray(flip_times, dtype=np.float64)[flip_index[flip_index >= 0]]
+    return stim_df.assign(flip_time=flip_time, latency=latency)
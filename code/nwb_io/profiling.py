@@ -0,0 +1,217 @@
+"""
+Opt-in instrumentation of named stages: wall time, bytes read and peak memory.
+
+Code runs inside ``with profiler.stage(name)`` blocks (or ``profiler.iterate(name, iterable)``
+for the work done by a generator, or ``@profiled`` methods of an object with a ``profiler``
+attribute such as ``NwbData``). A stage entered several times accumulates its calls; nested
+stages are recorded under ``outer/inner``. ``Profiler.write`` saves the totals together with a
+Chrome trace (``traceEvents``, viewable in chrome://tracing or Perfetto). A disabled profiler
+makes every hook a no-op.
+
+Bytes read are those the process requested from the operating system (``rchar`` of
+``/proc/self/io``), which while an NWB file is being read are almost all HDF5 reads; they are
+None where ``/proc`` is not available. Peak RSS is the process' high-water mark.
+"""
+
+import contextlib
+import functools
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROFILE_TOOLS = ('cprofile', 'pyinstrument')
+
+
+def _read_bytes():
+    try:
+        with open('/proc/self/io', 'rb') as f:
+            for line in f:
+                if line.startswith(b'rchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _peak_rss():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _mb(n_bytes):
+    return None if n_bytes is None else round(n_bytes / 2**20, 3)
+
+
+class Profiler:
+    """
+    Per-stage wall time, bytes read and peak RSS of the current process.
+
+    ``enabled=False`` gives a profiler whose hooks cost nothing, so instrumented code does not
+    have to check whether profiling was asked for.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.stages = {}
+        self.events = []
+        self._stack = []
+        self._origin = time.perf_counter()
+
+    def _entry(self, path):
+        return self.stages.setdefault(path, {'calls': 0, 'wall_s': 0.0, 'read_bytes': None,
+                                             'peak_rss_bytes': None, 'rss_growth_bytes': None})
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Account the time, reads and memory growth of the ``with`` block to stage ``name``."""
+        if not self.enabled:
+            yield
+            return
+
+        self._stack.append(name)
+        path = '/'.join(self._stack)
+        read, peak = _read_bytes(), _peak_rss()
+        tic = time.perf_counter()
+        try:
+            yield
+        finally:
+            toc = time.perf_counter()
+            read = None if read is None else _read_bytes() - read
+            start_peak, peak = peak, _peak_rss()
+            self._stack.pop()
+
+            entry = self._entry(path)
+            entry['calls'] += 1
+            entry['wall_s'] += toc - tic
+            if read is not None:
+                entry['read_bytes'] = (entry['read_bytes'] or 0) + read
+            if peak is not None:
+                entry['peak_rss_bytes'] = max(entry['peak_rss_bytes'] or 0, peak)
+                entry['rss_growth_bytes'] = (entry['rss_growth_bytes'] or 0) + peak - start_peak
+            self.events.append({'name': name, 'cat': path, 'ph': 'X', 'pid': os.getpid(), 'tid': 0,
+                                'ts': round((tic - self._origin) * 1e6, 1), 'dur': round((toc - tic) * 1e6, 1),
+                                'args': {'read_bytes': read, 'peak_rss_mb': _mb(peak)}})
+
+    def iterate(self, name, iterable):
+        """Yield from ``iterable``, accounting the work of producing every item to stage ``name``."""
+        if not self.enabled:
+            yield from iterable
+            return
+
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def wrap(self, name, func):
+        """``func`` with every call accounted to stage ``name``."""
+        if not self.enabled:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def add(self, name, wall_s):
+        """Account ``wall_s`` seconds measured elsewhere (e.g. in a worker process) to stage ``name``."""
+        if self.enabled:
+            entry = self._entry(name)
+            entry['calls'] += 1
+            entry['wall_s'] += wall_s
+
+    def summary(self):
+        """``{stage: {calls, wall_s, read_mb, peak_rss_mb, rss_growth_mb}}``, slowest stage first."""
+        ordered = sorted(self.stages.items(), key=lambda item: item[1]['wall_s'], reverse=True)
+        return {path: {'calls': entry['calls'], 'wall_s': round(entry['wall_s'], 4),
+                       'read_mb': _mb(entry['read_bytes']), 'peak_rss_mb': _mb(entry['peak_rss_bytes']),
+                       'rss_growth_mb': _mb(entry['rss_growth_bytes'])}
+                for path, entry in ordered}
+
+    def write(self, path, **extra):
+        """Write the stage summary, any ``extra`` JSON values and the Chrome trace events to ``path``."""
+        trace = {'stages': self.summary(), **extra, 'traceEvents': self.events}
+        path = Path(path)
+        tmp = path.with_name(path.name + '.tmp')
+        tmp.write_text(json.dumps(trace, indent=1))
+        os.replace(tmp, path)
+        return path
+
+    def print_summary(self, file=None):
+        """Print one line per stage, slowest first."""
+        print(f"{'stage':<32} {'calls':>6} {'wall (s)':>9} {'read (MB)':>10} {'peak RSS (MB)':>14} {'RSS growth (MB)':>16}",
+              file=file)
+        for path, entry in self.summary().items():
+            read, peak, growth = (('-' if entry[key] is None else f"{entry[key]:.1f}")
+                                  for key in ('read_mb', 'peak_rss_mb', 'rss_growth_mb'))
+            print(f"{path:<32} {entry['calls']:>6} {entry['wall_s']:>9.3f} {read:>10} {peak:>14} {growth:>16}", file=file)
+
+
+def profiled(name=None):
+    """
+    Decorator accounting every call of a method to stage ``name`` (default: the method name) of
+    ``self.profiler``; methods of objects without a profiler run untouched.
+    """
+    def decorator(method):
+        stage = name or method.__name__
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            profiler = getattr(self, 'profiler', None)
+            if profiler is None or not profiler.enabled:
+                return method(self, *args, **kwargs)
+            with profiler.stage(stage):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextlib.contextmanager
+def function_profile(path, tool='cprofile'):
+    """
+    Profile the ``with`` block function by function and save the result to ``path``.
+
+    ``tool`` is ``'cprofile'`` (a pstats dump, e.g. for ``snakeviz`` or ``python -m pstats``) or
+    ``'pyinstrument'`` (an HTML report; needs the optional pyinstrument package). Only this
+    process is profiled.
+    """
+    if tool == 'cprofile':
+        import cProfile
+
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            profile.dump_stats(str(path))
+    elif tool == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler as SamplingProfiler
+        except ImportError:
+            raise ImportError("The pyinstrument profile needs pyinstrument: pip install pyinstrument") from None
+
+        profile = SamplingProfiler()
+        profile.start()
+        try:
+            yield
+        finally:
+            profile.stop()
+            Path(path).write_text(profile.output_html())
+    else:
+        raise ValueError(f"Unknown profiling tool {tool!r}; use one of {PROFILE_TOOLS}")
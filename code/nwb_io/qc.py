@@ -0,0 +1,165 @@
+"""
+Numeric QC metrics of a session, computed from arrays that are read anyway for plotting.
+
+``TraceStats`` accumulates per-ROI statistics of a trace series one block of frames at a time, so
+it can ride along with the block reads of ``minmax_envelope`` and ``trace_raster``. The other
+helpers reduce timestamps, ROI masks and the stimulus table in a few vectorized operations.
+"""
+
+import numpy as np
+
+from .masks import SparseRoiMasks
+from .timing import sampling_stats
+
+
+class TraceStats:
+    """
+    Per-ROI statistics of a ``(frames, rois)`` trace series, fed one block of frames at a time.
+
+    The noise of every ROI is estimated from its first differences (``std(diff) / sqrt(2)``), which
+    slow transients barely affect, and its SNR is the peak above the mean in units of that noise.
+    NaNs are counted and otherwise ignored.
+    """
+
+    def __init__(self):
+        self.n_frames = 0
+        self._result = None
+        self._shift = None
+
+    def update(self, block):
+        block = np.asarray(block, dtype=np.float64)
+        if block.ndim == 1:
+            block = block[:, None]
+        if not len(block):
+            return
+        finite = np.isfinite(block)
+
+        if self._shift is None:
+            n_rois = block.shape[1]
+            # Moments are taken around the first block's mean so the variance keeps its precision
+            self._shift = np.where(finite, block, 0.0).sum(axis=0) / np.maximum(finite.sum(axis=0), 1)
+            self._n_valid = np.zeros(n_rois, dtype=np.int64)
+            self._n_nan = np.zeros(n_rois, dtype=np.int64)
+            self._sum = np.zeros(n_rois)
+            self._sum_sq = np.zeros(n_rois)
+            self._max = np.full(n_rois, -np.inf)
+            self._diff_sq = np.zeros(n_rois)
+            self._n_diff = np.zeros(n_rois, dtype=np.int64)
+            self._last = None
+
+        centered = np.where(finite, block - self._shift, 0.0)
+        self._n_valid += finite.sum(axis=0)
+        self._n_nan += np.isnan(block).sum(axis=0)
+        self._sum += centered.sum(axis=0)
+        self._sum_sq += np.square(centered).sum(axis=0)
+        self._max = np.fmax(self._max, np.where(finite, block, -np.inf).max(axis=0))
+
+        # First differences within the block and across the boundary with the previous one
+        diff = np.diff(block, axis=0)
+        diff_ok = np.isfinite(diff)
+        self._diff_sq += np.square(np.where(diff_ok, diff, 0.0)).sum(axis=0)
+        self._n_diff += diff_ok.sum(axis=0)
+        if self._last is not None:
+            edge = block[0] - self._last
+            edge_ok = np.isfinite(edge)
+            self._diff_sq += np.where(edge_ok, np.square(edge), 0.0)
+            self._n_diff += edge_ok
+        self._last = block[-1]
+        self.n_frames += len(block)
+
+    def result(self) -> dict:
+        """Per-ROI arrays ``mean``, ``std``, ``max``, ``noise``, ``snr`` and ``nan_fraction``, plus ``n_frames``."""
+        if self._result is not None:
+            return self._result
+        if self._shift is None:
+            empty = np.zeros(0)
+            return {'n_frames': 0, 'mean': empty, 'std': empty, 'max': empty, 'noise': empty, 'snr': empty,
+                    'nan_fraction': empty}
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            n_valid = np.where(self._n_valid > 0, self._n_valid, np.nan)
+            centered_mean = self._sum / n_valid
+            std = np.sqrt(np.maximum(self._sum_sq / n_valid - np.square(centered_mean), 0.0))
+            noise = np.sqrt(self._diff_sq / np.where(self._n_diff > 0, self._n_diff, np.nan) / 2)
+            mean = self._shift + centered_mean
+            maximum = np.where(np.isfinite(self._max), self._max, np.nan)
+            snr = np.where(noise > 0, (maximum - mean) / noise, np.nan)
+        return {'n_frames': self.n_frames, 'mean': mean, 'std': std, 'max': maximum, 'noise': noise,
+                'snr': snr, 'nan_fraction': self._n_nan / self.n_frames}
+
+    def restore(self, result):
+        """Make ``result()`` return a previously computed (e.g. cached) result."""
+        self.n_frames = int(result['n_frames'])
+        self._result = {name: (self.n_frames if name == 'n_frames' else np.asarray(value))
+                        for name, value in result.items()}
+
+
+def timing_summary(timestamps, gap_threshold: float = 1.5) -> dict:
+    """
+    Frame interval statistics of one series' timestamps, as in ``NwbData.load_sampling_rate_info``:
+    mean and median rate, mean, median and standard deviation of the interval (jitter) in ms, and
+    the frame gaps longer than ``gap_threshold`` median intervals.
+    """
+    t = np.asarray(timestamps, dtype=float)
+    if len(t) < 2:
+        return {'n_frames': len(t)}
+    stats = sampling_stats(t, np.array([0, len(t)]), gap_threshold)
+    return {
+        'n_frames': len(t),
+        'duration': float(t[-1] - t[0]),
+        'mean_rate_hz': float(1 / stats['mean_dt'][0]),
+        'median_rate_hz': float(1 / stats['median_dt'][0]),
+        'mean_dt_ms': float(stats['mean_dt'][0] * 1000),
+        'median_dt_ms': float(stats['median_dt'][0] * 1000),
+        'dt_std_ms': float(stats['std_dt'][0] * 1000),
+        'n_gaps': int(stats['n_gaps'][0]),
+        'missing_frames': int(stats['missing_frames'][0]),
+    }
+
+
+def roi_areas(masks) -> np.ndarray:
+    """Number of pixels with a positive weight in every mask of an ``(n_rois, H, W)`` stack or ``SparseRoiMasks``."""
+    if isinstance(masks, SparseRoiMasks):
+        return np.bincount(masks.roi_ids()[masks.weights > 0], minlength=masks.n_rois)
+    masks = np.asarray(masks)
+    return np.count_nonzero(masks.reshape(len(masks), -1) > 0, axis=1)
+
+
+def stimulus_counts(stim_df, param_columns) -> dict:
+    """
+    Presentation counts of a stimulus table: in total, per stimulus type (each distinct
+    combination of ``param_columns`` values) and per value of every parameter.
+    """
+    params = stim_df[list(param_columns)]
+    per_parameter = {}
+    for param in params.columns:
+        values, counts = np.unique(params[param].dropna().to_numpy(), return_counts=True)
+        per_parameter[str(param)] = {_format_value(v): int(c) for v, c in zip(values, counts)}
+
+    per_type = []
+    if len(params.columns) and len(params):
+        for combination, count in params.value_counts(dropna=False, sort=False).items():
+            combination = combination if isinstance(combination, tuple) else (combination,)
+            per_type.append({**{str(p): _format_value(v) for p, v in zip(params.columns, combination)},
+                             'count': int(count)})
+    return {'n_presentations': len(stim_df), 'n_types': len(per_type), 'per_parameter': per_parameter,
+            'per_type': per_type}
+
+
+def _format_value(value):
+    try:
+        return f"{float(value):g}"
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def summarize(values) -> dict:
+    """Count, NaN count, mean and min/quartiles/max of the finite ``values``; JSON-ready."""
+    values = np.asarray(values, dtype=float).ravel()
+    finite = values[np.isfinite(values)]
+    summary = {'n': int(values.size), 'n_nan': int(values.size - finite.size)}
+    if finite.size:
+        q = np.percentile(finite, [0, 25, 50, 75, 100])
+        summary.update({'mean': float(finite.mean()), 'min': float(q[0]), 'p25': float(q[1]),
+                        'median': float(q[2]), 'p75': float(q[3]), 'max': float(q[4])})
+    return summary
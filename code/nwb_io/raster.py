@@ -0,0 +1,107 @@
+"""
+ROI x time rasters of trace series, binned to display resolution and optionally z-scored.
+
+A raster is cheap to draw with ``imshow`` whatever the number of ROIs or frames. Rasters can be
+kept in a ``SessionCache`` so that figures can be redrawn with other color limits or overlays
+without reading the traces from the NWB file again.
+"""
+
+import numpy as np
+
+from .decimate import _bin_starts
+
+# Bytes of float64 frames read per block while binning an HDF5 dataset
+_BLOCK_BYTES = 64 << 20
+
+
+def trace_raster(data, n_bins=None, zscore=True, block_bytes=_BLOCK_BYTES, on_block=None):
+    """
+    Bin a ``(frames, rois)`` trace array into an ``(rois, n_bins)`` raster of bin means.
+
+    Returns ``(bin_starts, raster)``, ``bin_starts`` being the first frame of every bin. With
+    ``zscore`` each ROI is scaled by the mean and standard deviation of all its frames (not of
+    the bins), so the raster shows the binned z-scored trace. ``n_bins`` of None keeps every
+    frame. ``data`` can be an HDF5 dataset; it is read in blocks of whole bins of at most
+    ``block_bytes``. NaNs are ignored; a bin with nothing else is NaN. ``on_block``, if given, is
+    called with every block read, in frame order.
+    """
+    n_frames, n_rois = data.shape
+    n_bins = n_frames if not n_bins else max(1, min(n_bins, n_frames))
+    starts = _bin_starts(n_frames, n_bins)
+    bounds = np.append(starts, n_frames)
+    block_frames = max(1, block_bytes // (8 * max(1, n_rois)))
+
+    sums = np.zeros((n_bins, n_rois))
+    counts = np.zeros((n_bins, n_rois), dtype=np.int64)
+    # Per-ROI moments, shifted by the first block's mean so the variance does not lose precision
+    shift = None
+    total = np.zeros(n_rois)
+    total_sq = np.zeros(n_rois)
+
+    first_bin = 0
+    while first_bin < n_bins:
+        # Whole bins up to block_frames frames (at least one bin)
+        last_bin = max(first_bin + 1, np.searchsorted(bounds, bounds[first_bin] + block_frames, side='right') - 1)
+        last_bin = min(last_bin, n_bins)
+        block = np.asarray(data[bounds[first_bin]:bounds[last_bin]], dtype=np.float64)
+        if on_block is not None:
+            on_block(block)
+        finite = np.isfinite(block)
+        values = np.where(finite, block, 0.0)
+        offsets = bounds[first_bin:last_bin] - bounds[first_bin]
+        sums[first_bin:last_bin] = np.add.reduceat(values, offsets, axis=0)
+        counts[first_bin:last_bin] = np.add.reduceat(finite, offsets, axis=0)
+
+        if zscore:
+            if shift is None:
+                shift = values.sum(axis=0) / np.maximum(finite.sum(axis=0), 1)
+            centered = np.where(finite, values - shift, 0.0)
+            total += centered.sum(axis=0)
+            total_sq += np.square(centered).sum(axis=0)
+        first_bin = last_bin
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        raster = sums / counts
+    if zscore:
+        n_valid = np.maximum(counts.sum(axis=0), 1)
+        mean = total / n_valid
+        std = np.sqrt(np.maximum(total_sq / n_valid - np.square(mean), 0.0))
+        # Flat ROIs stay at 0 instead of dividing by 0
+        raster = (raster - (shift + mean)) / np.where(std > 0, std, 1.0)
+    return starts, raster.T.astype(np.float32)
+
+
+def cached_trace_raster(cache, nwb_path, series, n_bins=None, zscore=True, timestamps=None, stats=None):
+    """
+    ``(bin_times, raster)`` of a RoiResponseSeries (see ``trace_raster``), served from ``cache``.
+
+    ``cache`` is a ``SessionCache`` or None; ``bin_times`` are the timestamps of the first frame of
+    every bin, taken from ``timestamps`` if the series' timestamps are already loaded. Cached
+    rasters are returned memory-mapped and are recomputed once the NWB file changes. A
+    ``TraceStats`` passed as ``stats`` is fed while the series is read, and its result is cached
+    with the raster, so a cached raster comes with its statistics.
+    """
+    on_block = None if stats is None else stats.update
+    if cache is None:
+        starts, raster = trace_raster(series.data, n_bins, zscore, on_block=on_block)
+        return _timestamps(series, timestamps)[starts], raster
+
+    group = f"raster/{series.name}/{n_bins or 'all'}{'_z' if zscore else ''}"
+    cached = cache.load(nwb_path, group)
+    if cached is None or (stats is not None and 'stats/snr' not in cached[0]):
+        starts, raster = trace_raster(series.data, n_bins, zscore, on_block=on_block)
+        with cache.writer(nwb_path, group) as writer:
+            writer.add('bin_times', _timestamps(series, timestamps)[starts])
+            writer.add('raster', raster)
+            if stats is not None:
+                for name, value in stats.result().items():
+                    writer.add(f'stats/{name}', np.asarray(value))
+        cached = cache.load(nwb_path, group)
+    elif stats is not None:
+        stats.restore({name[len('stats/'):]: value for name, value in cached[0].items() if name.startswith('stats/')})
+    arrays, _ = cached
+    return arrays['bin_times'], arrays['raster']
+
+
+def _timestamps(series, timestamps):
+    return np.asarray(series.timestamps[:] if timestamps is None else timestamps)
@@ -0,0 +1,58 @@
+import numpy as np
+
+
+def frame_stimulus_index(t, start_times, stop_times):
+    """
+    For every frame time in ``t``, return the index of the stimulus row covering it (-1 if none).
+
+    A frame is covered by row ``i`` when ``start_times[i] <= t <= stop_times[i]``. When several
+    rows cover the same frame the last one in table order wins, which is what assigning the rows
+    one after another with boolean masks produces.
+    """
+    t = np.asarray(t, dtype=float)
+    start_times = np.asarray(start_times, dtype=float)
+    stop_times = np.asarray(stop_times, dtype=float)
+    winner = np.full(t.shape, -1, dtype=np.intp)
+    if t.size == 0 or start_times.size == 0:
+        return winner
+
+    # searchsorted needs monotonic frame times; fall back to a sorted copy if they are not
+    order = None
+    if np.any(t[1:] < t[:-1]):
+        order = np.argsort(t, kind='stable')
+        t = t[order]
+
+    # Frame range [lo, hi) of every interval, from sorted start/stop arrays
+    lo = np.searchsorted(t, start_times, side='left')
+    hi = np.searchsorted(t, stop_times, side='right')
+    lengths = np.clip(hi - lo, 0, None)
+
+    total = int(lengths.sum())
+    if total:
+        rows = np.repeat(np.arange(start_times.size), lengths)
+        # Frame indices of all (row, frame) pairs: lo of each row plus a running offset within it
+        offsets = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        frames = np.repeat(lo, lengths) + offsets
+        np.maximum.at(winner, frames, rows)
+
+    if order is not None:
+        unsorted = np.empty_like(winner)
+        unsorted[order] = winner
+        winner = unsorted
+    return winner
+
+
+def stimulus_feature_matrix(t, start_times, stop_times, values):
+    """
+    Frame-wise stimulus features as a ``(frames, features)`` array.
+
+    ``values`` is ``(rows, features)``; frames outside every stimulus are NaN. All features are
+    filled with one gather through the row index from ``frame_stimulus_index``.
+    """
+    values = np.asarray(values, dtype=float)
+    winner = frame_stimulus_index(t, start_times, stop_times)
+
+    out = np.full((winner.size, values.shape[1]), np.nan)
+    covered = winner >= 0
+    out[covered] = values[winner[covered]]
+    return out
@@ -0,0 +1,190 @@
+"""
+Clock synchronization between Harp device time and the NWB (SLAP2) frame timestamps.
+
+The behavior board starts and stops every SLAP2 trial with pulses on DO0 and DO1 (SLAP-Start and
+SLAP-Stop workflows), so the ``PulseDO0`` messages and the first frames of the NWB trials are the
+same events seen by the two clocks. ``match_events`` pairs such events without assuming that no
+pulse or trial is missing, and ``ClockSync.fit`` fits the clock mapping to the pairs: a line
+(offset and drift) through the pairs that are not outliers (more than ``n_mad`` robust standard
+deviations off the running median of their neighbours), plus the residuals of these pairs
+interpolated between them, which makes the mapping piecewise linear through every pair and
+follows drift changes. Before the first and after the last pair the residual of that pair is
+held, so the mapping continues with the slope of the line from the edge pair. Both directions
+are one ``np.interp`` plus a multiply-add over the input, tens of millions of samples per
+second::
+
+    sync = session_clock(nwb_data, HarpDevice(harp_path))
+    frame_times = sync.nwb_to_harp(t)   # or sync.harp_to_nwb(harp_t), sync(harp_t)
+"""
+
+import numpy as np
+
+# Events further apart than this (seconds) after alignment are not the same event
+DEFAULT_TOLERANCE = 0.05
+# Pairs further off the local trend than this many robust standard deviations are outliers
+DEFAULT_N_MAD = 5.0
+# Floor of the outlier threshold (seconds), so that jitter-free pairs do not reject each other
+_MIN_RESIDUAL = 1e-4
+# Pairs on each side whose residuals make the local trend an outlier is measured from
+_NEIGHBOURS = 4
+_MAX_ITERATIONS = 10
+# Pulse registers of the behavior board and the NWB trial bound they mark
+SYNC_PULSES = {'PulseDO0': 't_first', 'PulseDO1': 't_last'}
+
+
+def _vote_offset(harp_times, nwb_times, tolerance):
+    # Offset shared by the most event pairs: the densest tolerance-wide window of all differences.
+    # There are len(harp) x len(nwb) of them, fine for pulse trains (one pulse per trial).
+    diffs = np.sort((nwb_times[None, :] - harp_times[:, None]).ravel())
+    counts = np.searchsorted(diffs, diffs + tolerance, side='right') - np.arange(len(diffs))
+    start = int(np.argmax(counts))
+    return float(np.median(diffs[start:start + counts[start]]))
+
+
+def match_events(harp_times, nwb_times, tolerance: float = DEFAULT_TOLERANCE, clock=None):
+    """
+    ``(harp_index, nwb_index)`` of the events of two sorted trains that are the same event: the
+    NWB event nearest to ``clock(harp_time)``, if within ``tolerance`` seconds, each NWB event
+    matched at most once. Without ``clock`` the Harp times are shifted by the offset most pairs
+    agree on.
+    """
+    harp_times = np.asarray(harp_times, dtype=np.float64)
+    nwb_times = np.asarray(nwb_times, dtype=np.float64)
+    empty = np.zeros(0, dtype=np.intp)
+    if not len(harp_times) or not len(nwb_times):
+        return empty, empty
+    if clock is None:
+        predicted = harp_times + _vote_offset(harp_times, nwb_times, tolerance)
+    else:
+        predicted = clock(harp_times)
+    right = np.clip(np.searchsorted(nwb_times, predicted), 1, max(len(nwb_times) - 1, 1))
+    left = right - 1
+    nearest = np.where(np.abs(nwb_times[left] - predicted) <= np.abs(nwb_times[right] - predicted), left, right)
+    distance = np.abs(nwb_times[nearest] - predicted)
+    harp_index = np.flatnonzero(distance <= tolerance)
+    # Of the Harp events claiming the same NWB event, the closest keeps it
+    harp_index = harp_index[np.argsort(distance[harp_index], kind='stable')]
+    _, first = np.unique(nearest[harp_index], return_index=True)
+    harp_index = np.sort(harp_index[first])
+    return harp_index, nearest[harp_index]
+
+
+def _line(x, y):
+    if len(x) < 2:
+        return 1.0, float(np.median(y - x))
+    slope, intercept = np.polyfit(x, y, 1)
+    return float(slope), float(intercept)
+
+
+def _local_outliers(residuals, n_mad):
+    # Residuals more than n_mad robust standard deviations off the running median of their
+    # neighbours: the trend they follow may bend where the drift changes
+    padded = np.pad(residuals, _NEIGHBOURS, mode='edge')
+    trend = np.median(np.lib.stride_tricks.sliding_window_view(padded, 2 * _NEIGHBOURS + 1), axis=-1)
+    deviation = np.abs(residuals - trend)
+    return deviation > max(n_mad * 1.4826 * np.median(deviation), _MIN_RESIDUAL)
+
+
+def _fit_pairs(harp_events, nwb_events, n_mad):
+    # Line through the pairs that are not outliers, and which these are
+    slope, intercept = _line(harp_events, nwb_events)
+    inliers = ~_local_outliers(nwb_events - (harp_events * slope + intercept), n_mad)
+    slope, intercept = _line(harp_events[inliers], nwb_events[inliers])
+    return slope, intercept, inliers
+
+
+class ClockSync:
+    """
+    Mapping between Harp seconds and NWB timestamps: ``nwb = slope * harp + intercept`` plus the
+    ``residuals`` of the fit interpolated between the ``harp_events`` they belong to, and held at
+    the first or last one beyond them (none for a purely linear mapping). Call it, or
+    ``harp_to_nwb``, to convert Harp times to NWB times.
+    """
+
+    def __init__(self, slope: float, intercept: float, harp_events=None, residuals=None):
+        self.slope = float(slope)
+        self.intercept = float(intercept)
+        self.harp_events = np.zeros(0) if harp_events is None else np.asarray(harp_events, dtype=np.float64)
+        self.residuals = np.zeros(0) if residuals is None else np.asarray(residuals, dtype=np.float64)
+        self.nwb_events = self.harp_events * self.slope + self.intercept + self.residuals
+        if np.any(np.diff(self.nwb_events) <= 0):
+            raise ValueError("Synchronized events are not in the same order on both clocks")
+
+    @classmethod
+    def fit(cls, harp_times, nwb_times, tolerance: float = DEFAULT_TOLERANCE, n_mad: float = DEFAULT_N_MAD,
+            piecewise: bool = True):
+        """
+        Fit the mapping to two sorted trains of the same events (e.g. pulse times and trial starts);
+        events of either train without a counterpart are ignored. With ``piecewise`` False the
+        mapping is the line only.
+        """
+        return cls.fit_trains([(harp_times, nwb_times)], tolerance, n_mad, piecewise)
+
+    @classmethod
+    def fit_trains(cls, trains, tolerance: float = DEFAULT_TOLERANCE, n_mad: float = DEFAULT_N_MAD,
+                   piecewise: bool = True):
+        """
+        ``fit`` to several ``(harp_times, nwb_times)`` event trains at once, each matched on its
+        own; they should have the same latency between the clocks.
+        """
+        trains = [(np.asarray(h, dtype=np.float64), np.asarray(n, dtype=np.float64)) for h, n in trains]
+        sync = pairs = None
+        # Matching against the last fit reaches the events that drift took out of tolerance
+        for _ in range(_MAX_ITERATIONS):
+            matched = [match_events(h, n, tolerance, sync) for h, n in trains]
+            harp_events = np.concatenate([h[i] for (h, _), (i, _) in zip(trains, matched)])
+            nwb_events = np.concatenate([n[j] for (_, n), (_, j) in zip(trains, matched)])
+            if not len(harp_events):
+                raise ValueError(f"No events matched within {tolerance} s between the Harp and NWB clocks")
+            order = np.argsort(harp_events, kind='stable')
+            if pairs is not None and np.array_equal(harp_events[order], pairs[0]) and np.array_equal(nwb_events[order], pairs[1]):
+                break
+            pairs = harp_events[order], nwb_events[order]
+            slope, intercept, inliers = _fit_pairs(*pairs, n_mad)
+            harp_events, nwb_events = pairs[0][inliers], pairs[1][inliers]
+            sync = cls(slope, intercept, harp_events, nwb_events - (harp_events * slope + intercept))
+
+        return sync if piecewise else cls(sync.slope, sync.intercept)
+
+    def __repr__(self):
+        return (f"ClockSync(drift={self.drift_ppm:.2f} ppm, offset={self.intercept:.6f} s, "
+                f"events={len(self.harp_events)})")
+
+    @property
+    def drift_ppm(self) -> float:
+        """Rate of the NWB clock relative to the Harp clock, in parts per million."""
+        return (self.slope - 1) * 1e6
+
+    def harp_to_nwb(self, t) -> np.ndarray:
+        t = np.asarray(t, dtype=np.float64)
+        out = np.multiply(t, self.slope)
+        out += self.intercept
+        if len(self.harp_events):
+            out += np.interp(t, self.harp_events, self.residuals)
+        return out
+
+    __call__ = harp_to_nwb
+
+    def nwb_to_harp(self, t) -> np.ndarray:
+        # Between events the mapping is linear in both directions, so the residuals interpolate
+        # over NWB times just as well
+        t = np.asarray(t, dtype=np.float64)
+        out = t - self.intercept
+        if len(self.harp_events):
+            out -= np.interp(t, self.nwb_events, self.residuals)
+        out /= self.slope
+        return out
+
+
+def session_clock(nwb_data, device, pulses=('PulseDO0',), **kwargs) -> ClockSync:
+    """
+    ``ClockSync.fit_trains`` of the trial start (``PulseDO0``) and/or stop (``PulseDO1``) pulses of
+    a ``HarpDevice`` to the first/last frame times of the trials of a ``NwbData``.
+    """
+    trials = [nwb_data.index.time_info(trial_id) for trial_id in nwb_data.index.trial_ids()]
+    trains = []
+    for pulse in pulses:
+        bound = SYNC_PULSES[pulse]
+        trial_times = np.sort([getattr(info, bound) for info in trials if getattr(info, bound) is not None])
+        trains.append((device.register(pulse).timestamps(), trial_times))
+    return ClockSync.fit_trains(trains, **kwargs)
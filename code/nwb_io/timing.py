@@ -0,0 +1,96 @@
+import numpy as np
+
+
+def concatenate_segments(arrays):
+    """Concatenate 1-D arrays (or datasets) into one buffer plus ``offsets`` delimiting each segment."""
+    lengths = np.array([len(a) for a in arrays], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    out = np.empty(offsets[-1], dtype=float)
+    for a, start, stop in zip(arrays, offsets[:-1], offsets[1:]):
+        out[start:stop] = a[:]
+    return out, offsets
+
+
+def _segment_median(values, segment_ids, starts, counts):
+    # Sort by (segment, value) once, then pick the middle element(s) of every segment
+    order = np.lexsort((values, segment_ids))
+    sorted_values = values[order]
+    lo = starts + (counts - 1) // 2
+    hi = starts + counts // 2
+    return (sorted_values[lo] + sorted_values[hi]) / 2
+
+
+def segment_timing_stats(t, offsets):
+    """
+    Frame interval statistics for every segment of the concatenated timestamps ``t``.
+
+    Segment ``i`` is ``t[offsets[i]:offsets[i + 1]]`` and must hold at least two timestamps.
+    Returns a dict of per-segment arrays: ``t_first``, ``t_last``, ``n_frames``, ``mean_dt``,
+    ``median_dt`` and ``std_dt``, all computed with segment reductions over one ``np.diff``.
+    """
+    t = np.asarray(t, dtype=float)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    n_frames = np.diff(offsets)
+
+    # Intervals inside each segment; the diffs that straddle two segments are dropped
+    dt = np.diff(t)
+    keep = np.ones(dt.shape, dtype=bool)
+    keep[offsets[1:-1] - 1] = False
+    dt = dt[keep]
+
+    counts = n_frames - 1
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    segment_ids = np.repeat(np.arange(len(counts)), counts)
+
+    mean_dt = np.add.reduceat(dt, starts) / counts
+    deviation = dt - mean_dt[segment_ids]
+    std_dt = np.sqrt(np.add.reduceat(deviation * deviation, starts) / counts)
+
+    return {
+        't_first': t[offsets[:-1]],
+        't_last': t[offsets[1:] - 1],
+        'n_frames': n_frames,
+        'mean_dt': mean_dt,
+        'median_dt': _segment_median(dt, segment_ids, starts, counts),
+        'std_dt': std_dt,
+    }
+
+
+def find_frame_gaps(t, offsets, k: float = 1.5, median_dt=None):
+    """
+    Locate frame intervals longer than ``k`` times their segment's median interval.
+
+    Returns ``(segment, frame, gap, n_missing)`` arrays: the segment index, the index of the frame
+    after the gap (relative to the segment start), the gap length, and the estimated number of
+    dropped frames ``round(gap / median_dt) - 1``.
+    """
+    t = np.asarray(t, dtype=float)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    if median_dt is None:
+        median_dt = segment_timing_stats(t, offsets)['median_dt']
+
+    dt = np.diff(t)
+    segment_of_dt = np.searchsorted(offsets, np.arange(len(dt)), side='right') - 1
+    within = np.ones(dt.shape, dtype=bool)
+    within[offsets[1:-1] - 1] = False
+
+    is_gap = within & (dt > k * median_dt[segment_of_dt])
+    idx = np.flatnonzero(is_gap)
+    segment = segment_of_dt[idx]
+    gap = dt[idx]
+    n_missing = np.maximum(np.rint(gap / median_dt[segment]).astype(np.int64) - 1, 0)
+    return segment, idx + 1 - offsets[segment], gap, n_missing
+
+
+def sampling_stats(t, offsets, gap_threshold: float = 1.5):
+    """
+    ``segment_timing_stats`` plus the frame drops of every segment: ``n_gaps``, the number of
+    intervals longer than ``gap_threshold`` times the segment's median interval, and
+    ``missing_frames``, the number of frames they are estimated to have dropped.
+    """
+    stats = segment_timing_stats(t, offsets)
+    gap_segment, _, _, n_missing = find_frame_gaps(t, offsets, k=gap_threshold, median_dt=stats['median_dt'])
+    n_segments = len(offsets) - 1
+    stats['n_gaps'] = np.bincount(gap_segment, minlength=n_segments)
+    stats['missing_frames'] = np.bincount(gap_segment, weights=n_missing, minlength=n_segments).astype(int)
+    return stats
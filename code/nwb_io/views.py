@@ -0,0 +1,170 @@
+import numpy as np
+from numpy.lib.mixins import NDArrayOperatorsMixin
+
+
+def _normalize_index(key, length):
+    """Split an index into something h5py can read plus a reordering to apply afterwards."""
+    if isinstance(key, (slice, int, np.integer)) or key is Ellipsis:
+        return (slice(None) if key is Ellipsis else key), None
+
+    idx = np.asarray(key)
+    if idx.dtype == bool:
+        if idx.shape != (length,):
+            raise IndexError(f"Boolean index of shape {idx.shape} does not match axis of length {length}")
+        return np.flatnonzero(idx), None
+
+    idx = np.where(idx < 0, idx + length, idx).astype(np.intp)
+    if idx.size and (idx.min() < 0 or idx.max() >= length):
+        raise IndexError(f"Index out of range for axis of length {length}")
+
+    # h5py only accepts strictly increasing coordinate lists
+    unique, inverse = np.unique(idx, return_inverse=True)
+    if unique.size == idx.size and np.array_equal(unique, idx):
+        return unique, None
+    return unique, inverse.reshape(idx.shape)
+
+
+def _read(dataset, frame_key, roi_key):
+    n_frames, n_rois = dataset.shape
+    frame_sel, frame_order = _normalize_index(frame_key, n_frames)
+    roi_sel, roi_order = _normalize_index(roi_key, n_rois)
+
+    # h5py cannot take two coordinate lists at once, so read the frame block first
+    if isinstance(frame_sel, np.ndarray) and isinstance(roi_sel, np.ndarray):
+        out = dataset[frame_sel, :][:, roi_sel]
+    else:
+        out = dataset[frame_sel, roi_sel]
+
+    if frame_order is not None:
+        out = np.take(out, frame_order, axis=0)
+    if roi_order is not None:
+        out = np.take(out, roi_order, axis=-1)
+    return out
+
+
+def _bisect(dataset, value, side='left', lo=0, hi=None):
+    """np.searchsorted on a sorted 1-D dataset, reading O(log n) single elements."""
+    hi = len(dataset) if hi is None else hi
+    while lo < hi:
+        mid = (lo + hi) // 2
+        v = dataset[mid]
+        if v < value or (side == 'right' and v == value):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+class _LazyArray(NDArrayOperatorsMixin):
+    # Arithmetic and ufuncs materialize the view so it can stand in for the eager arrays.
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        inputs = tuple(np.asarray(x) if isinstance(x, _LazyArray) else x for x in inputs)
+        return getattr(ufunc, method)(*inputs, **kwargs)
+
+    def __array__(self, dtype=None, copy=None):
+        arr = self[...]
+        return arr if dtype is None else arr.astype(dtype, copy=False)
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+
+class TimestampView(_LazyArray):
+    """
+    Lazy view of a series' timestamps, shifted by ``offset``.
+
+    Only the elements that are indexed are read from disk; ``searchsorted`` bisects the
+    dataset directly so locating a time window costs a handful of point reads.
+    """
+
+    def __init__(self, dataset, offset=0.0):
+        self.dataset = dataset
+        self.offset = offset
+
+    @property
+    def shape(self):
+        return tuple(self.dataset.shape)
+
+    @property
+    def dtype(self):
+        return np.dtype(self.dataset.dtype)
+
+    def __getitem__(self, key):
+        sel, order = _normalize_index(key, len(self.dataset))
+        out = self.dataset[sel]
+        if order is not None:
+            out = np.take(out, order)
+        return out - self.offset
+
+    def searchsorted(self, t, side='left'):
+        return _bisect(self.dataset, t + self.offset, side=side)
+
+    def __repr__(self):
+        return f"TimestampView(n_frames={len(self)}, offset={self.offset})"
+
+
+class DffView(_LazyArray):
+    """
+    Lazy ``(rois, timepoints)`` view of one RoiResponseSeries.
+
+    Indexing follows the layout returned by ``NwbData.load_dFoverF_data`` (``ts.data[:].T``):
+    ``view[rois, frames]``. Only the HDF5 chunks covering the requested block are read.
+    The view is only valid while the parent ``NwbData`` context is open.
+    """
+
+    def __init__(self, dataset, time: TimestampView):
+        self.dataset = dataset
+        self.time = time
+
+    @property
+    def shape(self):
+        n_frames, n_rois = self.dataset.shape
+        return (n_rois, n_frames)
+
+    @property
+    def dtype(self):
+        return np.dtype(self.dataset.dtype)
+
+    @property
+    def n_rois(self):
+        return self.shape[0]
+
+    @property
+    def n_frames(self):
+        return self.shape[1]
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is Ellipsis for k in key):
+            if len(key) > 1:
+                raise IndexError("Ellipsis is only supported on its own")
+            key = ()
+        if len(key) > 2:
+            raise IndexError(f"Too many indices for a 2-D view: {len(key)}")
+        roi_key = key[0] if len(key) > 0 else slice(None)
+        frame_key = key[1] if len(key) > 1 else slice(None)
+        return _read(self.dataset, frame_key, roi_key).T
+
+    def frame_range(self, t_start=None, t_stop=None):
+        """Frame slice covering ``t_start <= t <= t_stop`` (times relative to the view's anchor)."""
+        start = 0 if t_start is None else self.time.searchsorted(t_start, side='left')
+        stop = self.n_frames if t_stop is None else self.time.searchsorted(t_stop, side='right')
+        return slice(start, max(start, stop))
+
+    def window(self, t_start=None, t_stop=None, rois=None):
+        """Return ``(data, time)`` for the frames inside ``[t_start, t_stop]`` and the selected ROIs."""
+        frames = self.frame_range(t_start, t_stop)
+        roi_key = slice(None) if rois is None else rois
+        return self[roi_key, frames], self.time[frames]
+
+    def __repr__(self):
+        return f"DffView(n_rois={self.n_rois}, n_frames={self.n_frames}, dtype={self.dtype})"
@@ -0,0 +1,163 @@
+"""
+Running speed from the wheel encoder, streamed block by block.
+
+The quadrature counter of the Harp behavior board (``Encoder`` of ``AnalogData``) is a signed
+16-bit value that rolls over. ``WheelSpeed`` unwraps it across blocks, converts the counts of every
+sample to cm/s, low-pass filters the speed with a Butterworth filter and interpolates it at the
+requested sample times, e.g. the imaging frame timestamps, so a whole session is processed in
+memory bounded by the block size and the number of output samples. The filter is causal, with its
+state carried from block to block, or zero-phase, run forward and backward over every block with
+``padding`` seconds of context on both sides so that block boundaries do not show.
+"""
+
+import numpy as np
+
+from .imports import lazy_import
+
+signal = lazy_import('scipy.signal')
+
+# Bits of the encoder counter of the Harp behavior board (int16)
+COUNTER_BITS = 16
+DEFAULT_CUTOFF_HZ = 10.0
+
+
+def cm_per_count(wheel_diameter_cm: float, counts_per_revolution: float) -> float:
+    """Distance run on the wheel surface per encoder count."""
+    return np.pi * wheel_diameter_cm / counts_per_revolution
+
+
+def unwrap_counts(counts, previous: int = None, bits: int = COUNTER_BITS) -> np.ndarray:
+    """
+    Counts moved at every sample of a ``bits``-bit rolling counter, from the sample before (or from
+    ``previous``, the last count of the previous block; 0 for the first sample without it).
+    Steps of more than half the counter range are taken as rollovers.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    if not len(counts):
+        return counts
+    steps = np.diff(counts, prepend=counts[0] if previous is None else previous)
+    half = 1 << (bits - 1)
+    return (steps + half) % (1 << bits) - half
+
+
+class WheelSpeed:
+    """
+    Streaming running speed: feed ``(times, counts)`` blocks in time order to ``update``, then get
+    the speed from ``finish``.
+
+    ``cm_per_count`` scales the counts (see ``cm_per_count``; 1 gives counts/s). With
+    ``sample_times`` (sorted) ``finish`` returns the speed interpolated at each of them, NaN outside
+    the encoder recording; without, ``(times, speed)`` at the encoder rate. ``clock`` maps encoder
+    timestamps to the clock of ``sample_times``. The sampling rate is the mean rate of the first
+    block, leaving out gaps.
+    """
+
+    def __init__(self, cm_per_count: float = 1.0, sample_times=None, cutoff_hz: float = DEFAULT_CUTOFF_HZ,
+                 order: int = 2, zero_phase: bool = True, padding: float = None, clock=None,
+                 counter_bits: int = COUNTER_BITS):
+        self.cm_per_count = cm_per_count
+        self.cutoff_hz = cutoff_hz
+        self.order = order
+        self.zero_phase = zero_phase
+        # A Butterworth impulse response has decayed far below the counter resolution after 10 / cutoff
+        self.padding = 10 / cutoff_hz if padding is None else padding
+        self.clock = clock
+        self.counter_bits = counter_bits
+
+        self.sample_times = None if sample_times is None else np.asarray(sample_times, dtype=np.float64)
+        self._speed = None if sample_times is None else np.full(len(self.sample_times), np.nan)
+        self._next_sample = 0
+        self._outputs = []
+        self._previous = None
+
+        self.rate = None
+        self._last_count = None
+        self._sos = None
+        self._zi = None
+        self._pad = 0
+        # Zero-phase: samples already emitted kept as left context, then the pending samples
+        self._buffer_t = np.zeros(0)
+        self._buffer_v = np.zeros(0)
+        self._n_context = 0
+
+    def _design(self, times):
+        # Mean interval without the gaps: Harp timestamps are 32 us ticks, so the intervals of
+        # a 1 kHz stream are 0.992 or 1.024 ms and their median is off by up to 3%
+        dt = np.diff(times)
+        self.rate = 1 / np.mean(dt[dt < 1.5 * np.median(dt)])
+        self._sos = signal.butter(self.order, self.cutoff_hz, fs=self.rate, output='sos')
+        self._pad = int(np.ceil(self.padding * self.rate))
+
+    def update(self, times, counts):
+        times = np.asarray(times, dtype=np.float64)
+        if not len(times):
+            return
+        if self.clock is not None:
+            times = self.clock(times)
+        steps = unwrap_counts(counts, self._last_count, self.counter_bits)
+        self._last_count = int(np.asarray(counts[-1]))
+        if self._sos is None:
+            if len(times) < 2:
+                raise ValueError("The first encoder block needs at least 2 samples to estimate the sampling rate")
+            self._design(times)
+        speed = steps * (self.cm_per_count * self.rate)
+
+        if not self.zero_phase:
+            if self._zi is None:
+                self._zi = signal.sosfilt_zi(self._sos) * speed[0]
+            filtered, self._zi = signal.sosfilt(self._sos, speed, zi=self._zi)
+            self._emit(times, filtered)
+            return
+
+        self._buffer_t = np.concatenate([self._buffer_t, times])
+        self._buffer_v = np.concatenate([self._buffer_v, speed])
+        # Samples with padding seconds of context on both sides are final
+        end = len(self._buffer_v) - self._pad
+        if end > self._n_context:
+            self._filter_buffer(end)
+
+    def _filter_buffer(self, end):
+        filtered = signal.sosfiltfilt(self._sos, self._buffer_v,
+                                      padlen=min(len(self._buffer_v) - 1, 3 * (2 * len(self._sos) + 1)))
+        self._emit(self._buffer_t[self._n_context:end], filtered[self._n_context:end])
+        keep = max(0, end - self._pad)
+        self._buffer_t = self._buffer_t[keep:]
+        self._buffer_v = self._buffer_v[keep:]
+        self._n_context = end - keep
+
+    def _emit(self, times, speed):
+        if self._speed is None:
+            self._outputs.append((times, speed))
+            return
+
+        # Interpolate the sample times up to the last emitted sample, continuing from the one before
+        if self._previous is not None:
+            times = np.concatenate([[self._previous[0]], times])
+            speed = np.concatenate([[self._previous[1]], speed])
+        stop = np.searchsorted(self.sample_times, times[-1], side='right')
+        self._speed[self._next_sample:stop] = np.interp(self.sample_times[self._next_sample:stop], times, speed,
+                                                        left=np.nan)
+        self._next_sample = stop
+        self._previous = (times[-1], speed[-1])
+
+    def finish(self):
+        """Speed at ``sample_times``, or ``(times, speed)`` at the encoder rate without them."""
+        if self.zero_phase and len(self._buffer_v) > self._n_context:
+            self._filter_buffer(len(self._buffer_v))
+        if self._speed is not None:
+            return self._speed
+        if not self._outputs:
+            return np.zeros(0), np.zeros(0)
+        times, speed = zip(*self._outputs)
+        return np.concatenate(times), np.concatenate(speed)
+
+
+def running_speed(blocks, cm_per_count: float = 1.0, sample_times=None, **kwargs):
+    """
+    Running speed of an iterable of ``(times, counts)`` encoder blocks, e.g.
+    ``((t, ch['Encoder']) for t, ch in analog_data.blocks(['Encoder']))``; see ``WheelSpeed``.
+    """
+    wheel = WheelSpeed(cm_per_count, sample_times, **kwargs)
+    for times, counts in blocks:
+        wheel.update(times, counts)
+    return wheel.finish()
@@ -8,10 +8,15 @@ Simplified version showing only open and closed loop conditions.
 import matplotlib.pyplot as plt
 import numpy as np
 import os
-from matplotlib.patches import Rectangle, Circle, FancyArrowPatch
+import sys
+from pathlib import Path
+from matplotlib.patches import Circle, FancyArrowPatch
 from matplotlib.lines import Line2D
 import matplotlib.patheffects as path_effects
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from nwb_io.overlays import add_events, add_intervals
+
 # Create figure with multiple subplots - now with just 2 rows
 fig = plt.figure(figsize=(12, 7))
 fig.suptitle('Sensory-Motor Closed-Loop Protocol', fontsize=16)
@@ -57,11 +62,9 @@ for i in range(0, 20, 4):
     running_times.extend([(i, i+1.8), (i+2.2, i+3.5)])
 
 # Draw running pattern
-for start, end in running_times:
-    rect = Rectangle((start, 4), end-start, 1, 
-                    color=colors['running'], alpha=0.6)
-    ax1.add_patch(rect)
-    
+running_starts, running_ends = np.transpose(running_times)
+add_intervals(ax1, running_starts, running_ends, colors=colors['running'], ymin=4, ymax=5, ycoords='data', alpha=0.6)
+
 # Add running labels with text outline for better visibility
 text = ax1.text(10, 4.5, "Running", ha='center', va='center', fontsize=10, color='white')
 text.set_path_effects([path_effects.withStroke(linewidth=1.5, foreground='black')])
@@ -72,11 +75,10 @@ ax1.text(3.5, 5.5, "Running Pattern (independent of stimuli)",
          bbox=dict(facecolor='white', alpha=0.7, edgecolor='gray', boxstyle='round,pad=0.5'))
 
 # Draw stimuli
+stim_starts, delay_spans = [], []
 for i, stim_type in enumerate(stim_types):
-    # Draw stimulus block - made taller for better text fitting
-    rect = Rectangle((current_time, 0.8), stim_duration, 2.4, 
-                    color=colors[stim_type], alpha=0.8)
-    ax1.add_patch(rect)
+    # Stimulus block - made taller for better text fitting; drawn after the loop
+    stim_starts.append(current_time)
     
     # Add stimulus type text with outline for better visibility
     text = ax1.text(current_time + stim_duration/2, 2, labels[stim_type], 
@@ -89,16 +91,19 @@ for i, stim_type in enumerate(stim_types):
         ax1.text(current_time + stim_duration + fixed_delay/2, 0.5, f"{fixed_delay}s", 
                 ha='center', va='center', fontsize=8)
         
-        # Draw delay line
-        ax1.plot([current_time + stim_duration, current_time + stim_duration + fixed_delay], 
-                [0.7, 0.7], 'k-', linewidth=1)
-        ax1.plot([current_time + stim_duration, current_time + stim_duration], 
-                [0.5, 0.7], 'k-', linewidth=1)
-        ax1.plot([current_time + stim_duration + fixed_delay, current_time + stim_duration + fixed_delay], 
-                [0.5, 0.7], 'k-', linewidth=1)
+        # Delay line, drawn after the loop
+        delay_spans.append((current_time + stim_duration, current_time + stim_duration + fixed_delay))
     
     current_time += stim_duration + fixed_delay
 
+# Stimulus blocks (one collection per stimulus type) and delay lines with end ticks
+add_intervals(ax1, stim_starts, np.add(stim_starts, stim_duration), values=stim_types, colors=colors,
+              ymin=0.8, ymax=3.2, ycoords='data', alpha=0.8)
+delay_starts, delay_ends = np.transpose(delay_spans)
+ax1.hlines(np.full_like(delay_starts, 0.7), delay_starts, delay_ends, colors='k', linewidth=1, capstyle='projecting')
+add_events(ax1, np.concatenate([delay_starts, delay_ends]), colors='k', ymin=0.5, ymax=0.7, ycoords='data',
+           linewidth=1, capstyle='projecting')
+
 ax1.text(-0.5, 4.5, "Animal\nBehavior", ha='center', va='center', fontsize=10)
 ax1.text(-0.5, 2, "Stimulus\nType", ha='center', va='center', fontsize=10)
 
@@ -116,30 +121,11 @@ ax2.set_ylim(0, 6)
 ax2.set_yticks([])
 ax2.set_xlabel('Time (s)')
 
-# Draw running pattern
-for start, end in running_times:
-    rect = Rectangle((start, 4), end-start, 1, 
-                    color=colors['running'], alpha=0.6)
-    ax2.add_patch(rect)
-
-    # Draw corresponding deviant stimulus during running
-    if end-start > 0.5:  # Only if running period is long enough
-        mid_point = (start + end) / 2
-        if mid_point < 20 - stim_duration:
-            rect = Rectangle((mid_point, 0.8), stim_duration, 2.4, 
-                            color=colors['orientation_deviant'], alpha=0.8)
-            ax2.add_patch(rect)
-            text = ax2.text(mid_point + stim_duration/2, 2, "Deviant\nTrigger", 
-                    ha='center', va='center', fontsize=8, color='white')
-            text.set_path_effects([path_effects.withStroke(linewidth=1.5, foreground='black')])
-            
-            # Draw connection arrow
-            arrow = FancyArrowPatch((mid_point + stim_duration/2, 4), 
-                                   (mid_point + stim_duration/2, 3), 
-                                   arrowstyle='->', mutation_scale=15, color='black')
-            ax2.add_patch(arrow)
-
-# Draw standard stimuli during non-running periods
+# Deviants are triggered in the middle of long enough running periods
+deviant_starts = [(start + end) / 2 for start, end in running_times
+                  if end-start > 0.5 and (start + end) / 2 < 20 - stim_duration]
+
+# Non-running periods between the running ones
 current_time = 0
 non_running = []
 for i in range(len(running_times)):
@@ -152,27 +138,29 @@ for i in range(len(running_times)):
     if i == len(running_times) - 1 and running_times[i][1] < 20:
         non_running.append((running_times[i][1], 20))
 
-# Draw non-running
-for start, end in non_running:
-    rect = Rectangle((start, 4), end-start, 1, 
-                    color=colors['not_running'], alpha=0.4)
-    ax2.add_patch(rect)
+# Standards are triggered in the middle of non-running periods (if long enough)
+standard_starts = [(start + end) / 2 for start, end in non_running if end - start > stim_duration + 0.3]
+
+# Draw running and non-running periods, then the stimuli they trigger, one collection each
+add_intervals(ax2, running_starts, running_ends, colors=colors['running'], ymin=4, ymax=5, ycoords='data', alpha=0.6)
+non_running_starts, non_running_ends = np.transpose(non_running)
+add_intervals(ax2, non_running_starts, non_running_ends, colors=colors['not_running'], ymin=4, ymax=5,
+              ycoords='data', alpha=0.4)
+stim_starts = np.concatenate([deviant_starts, standard_starts])
+add_intervals(ax2, stim_starts, stim_starts + stim_duration,
+              values=['orientation_deviant'] * len(deviant_starts) + ['standard'] * len(standard_starts),
+              colors=colors, ymin=0.8, ymax=3.2, ycoords='data', alpha=0.8)
+
+for mid_point, label in [(t, "Deviant\nTrigger") for t in deviant_starts] + [(t, "Standard") for t in standard_starts]:
+    text = ax2.text(mid_point + stim_duration/2, 2, label, 
+            ha='center', va='center', fontsize=8, color='white')
+    text.set_path_effects([path_effects.withStroke(linewidth=1.5, foreground='black')])
     
-    # Add standard stimulus during non-running (if period is long enough)
-    if end - start > stim_duration + 0.3:
-        mid_point = (start + end) / 2
-        rect = Rectangle((mid_point, 0.8), stim_duration, 2.4, 
-                        color=colors['standard'], alpha=0.8)
-        ax2.add_patch(rect)
-        text = ax2.text(mid_point + stim_duration/2, 2, "Standard", 
-                ha='center', va='center', fontsize=8, color='white')
-        text.set_path_effects([path_effects.withStroke(linewidth=1.5, foreground='black')])
-                
-        # Draw connection arrow
-        arrow = FancyArrowPatch((mid_point + stim_duration/2, 4), 
-                               (mid_point + stim_duration/2, 3), 
-                               arrowstyle='->', mutation_scale=15, color='black')
-        ax2.add_patch(arrow)
+    # Draw connection arrow
+    arrow = FancyArrowPatch((mid_point + stim_duration/2, 4), 
+                           (mid_point + stim_duration/2, 3), 
+                           arrowstyle='->', mutation_scale=15, color='black')
+    ax2.add_patch(arrow)
 
 # Add running labels with text outline for better visibility
 text1 = ax2.text(3, 4.5, "Running", ha='center', va='center', fontsize=9, color='white')
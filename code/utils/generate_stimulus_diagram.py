@@ -7,10 +7,15 @@ This script creates a visualization of the different stimulus blocks and their t
 import matplotlib.pyplot as plt
 import numpy as np
 import os
+import sys
+from pathlib import Path
 from matplotlib.patches import Rectangle, Circle
 from matplotlib.lines import Line2D
 import matplotlib.patheffects as path_effects
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from nwb_io.overlays import add_events, add_intervals
+
 # Create figure with multiple subplots
 fig = plt.figure(figsize=(12, 8))
 fig.suptitle('Standard Oddball with Jittered Intervals Protocol', fontsize=16)
@@ -41,14 +46,13 @@ stim_duration = 0.343
 
 # Plot orientation stimuli with jittered intervals
 current_time = 0
+stim_starts, delay_spans = [], []
 for i in range(12):  # Show a subset of the stimuli
     orientation = np.random.choice(orientations)
     delay = np.random.choice(delays)
     
-    # Draw stimulus block - make it taller for better text fitting
-    rect = Rectangle((current_time, 0.8), stim_duration, 2.4, 
-                     color=colors['standard'], alpha=0.8)
-    ax1.add_patch(rect)
+    # Stimulus block - made taller for better text fitting; drawn after the loop
+    stim_starts.append(current_time)
     
     # Add orientation text with path effect for better visibility
     text = ax1.text(current_time + stim_duration/2, 2, f"{orientation}°", 
@@ -60,16 +64,19 @@ for i in range(12):  # Show a subset of the stimuli
         ax1.text(current_time + stim_duration + delay/2, 0.5, f"{delay}s", 
                  ha='center', va='center', fontsize=8)
         
-        # Draw delay line
-        ax1.plot([current_time + stim_duration, current_time + stim_duration + delay], 
-                 [0.7, 0.7], 'k-', linewidth=1)
-        ax1.plot([current_time + stim_duration, current_time + stim_duration], 
-                 [0.5, 0.7], 'k-', linewidth=1)
-        ax1.plot([current_time + stim_duration + delay, current_time + stim_duration + delay], 
-                 [0.5, 0.7], 'k-', linewidth=1)
+        # Delay line, drawn after the loop
+        delay_spans.append((current_time + stim_duration, current_time + stim_duration + delay))
     
     current_time += stim_duration + delay
 
+# Stimulus blocks and delay lines with end ticks
+add_intervals(ax1, stim_starts, np.add(stim_starts, stim_duration), colors=colors['standard'],
+              ymin=0.8, ymax=3.2, ycoords='data', alpha=0.8)
+delay_starts, delay_ends = np.transpose(delay_spans)
+ax1.hlines(np.full_like(delay_starts, 0.7), delay_starts, delay_ends, colors='k', linewidth=1, capstyle='projecting')
+add_events(ax1, np.concatenate([delay_starts, delay_ends]), colors='k', ymin=0.5, ymax=0.7, ycoords='data',
+           linewidth=1, capstyle='projecting')
+
 ax1.text(-0.5, 2, "Stimulus\nOrientation", ha='center', va='center', fontsize=10)
 
 # 2. Standard-Oddball Paradigm
@@ -93,13 +100,12 @@ labels = {
     'contrast_deviant': '0 contrast (Dev)',
 }
 
+stim_starts, delay_spans = [], []
 for i, stim_type in enumerate(stim_types):
     delay = np.random.choice(delays) if i < len(stim_types)-1 else 0
     
-    # Draw stimulus block - made taller
-    rect = Rectangle((current_time, 0.8), stim_duration, 2.4, 
-                     color=colors[stim_type], alpha=0.8)
-    ax2.add_patch(rect)
+    # Stimulus block - made taller; drawn after the loop
+    stim_starts.append(current_time)
     
     # Add stimulus type text with outline
     text = ax2.text(current_time + stim_duration/2, 2, labels[stim_type], 
@@ -112,16 +118,19 @@ for i, stim_type in enumerate(stim_types):
         ax2.text(current_time + stim_duration + delay/2, 0.5, f"{delay}s", 
                  ha='center', va='center', fontsize=8)
         
-        # Draw delay line
-        ax2.plot([current_time + stim_duration, current_time + stim_duration + delay], 
-                 [0.7, 0.7], 'k-', linewidth=1)
-        ax2.plot([current_time + stim_duration, current_time + stim_duration], 
-                 [0.5, 0.7], 'k-', linewidth=1)
-        ax2.plot([current_time + stim_duration + delay, current_time + stim_duration + delay], 
-                 [0.5, 0.7], 'k-', linewidth=1)
+        # Delay line, drawn after the loop
+        delay_spans.append((current_time + stim_duration, current_time + stim_duration + delay))
     
     current_time += stim_duration + delay
 
+# Stimulus blocks (one collection per stimulus type) and delay lines with end ticks
+add_intervals(ax2, stim_starts, np.add(stim_starts, stim_duration), values=stim_types, colors=colors,
+              ymin=0.8, ymax=3.2, ycoords='data', alpha=0.8)
+delay_starts, delay_ends = np.transpose(delay_spans)
+ax2.hlines(np.full_like(delay_starts, 0.7), delay_starts, delay_ends, colors='k', linewidth=1, capstyle='projecting')
+add_events(ax2, np.concatenate([delay_starts, delay_ends]), colors='k', ymin=0.5, ymax=0.7, ycoords='data',
+           linewidth=1, capstyle='projecting')
+
 ax2.text(-0.5, 2, "Stimulus\nType", ha='center', va='center', fontsize=10)
 
 # Add legend for Standard-Oddball
@@ -172,14 +181,10 @@ for pos in positions:
 current_time = field_size + 6
 stim_duration = 0.25  # 250 ms for RF mapping
 
-# Plot some sample RF mapping stimuli in sequence
-for i in range(6):
-    rect = Rectangle((current_time, 0.8), stim_duration, 2.4, 
-                     color=colors['rf_mapping'], alpha=0.8)
-    ax3.add_patch(rect)
-    
-    # No delay between RF stimuli
-    current_time += stim_duration
+# Plot some sample RF mapping stimuli in sequence (no delay between RF stimuli)
+rf_starts = current_time + stim_duration * np.arange(6)
+add_intervals(ax3, rf_starts, rf_starts + stim_duration, colors=colors['rf_mapping'],
+              ymin=0.8, ymax=3.2, ycoords='data', alpha=0.8)
 
 # Add text explanation with background box
 text_box2 = ax3.text(field_size + 6 + 3*stim_duration, 2, "Rapid sequence\nNo delays between stimuli", 
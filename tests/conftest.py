@@ -0,0 +1,115 @@
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'code'))
+
+# Trials of the synthetic session, written out of order; Trial1 starts at ANCHOR
+TRIALS = (3, 1, 2)
+ANCHOR = 100.0
+FRAME_RATE = 100.0
+N_ROIS = {'DMD1': 7, 'DMD2': 5}
+IMAGE_SHAPE = (40, 50)
+STIMULUS_FEATURES = ('orientation', 'contrast', 'x_position', 'y_position', 'delay',
+                     'diameter', 'spatial_frequency', 'temporal_frequency')
+
+
+def trial_timestamps(trial_id):
+    t = ANCHOR + (trial_id - 1) * 20 + np.arange(300 + 37 * trial_id) / FRAME_RATE
+    if trial_id == 2:
+        t[150:] += 0.05  # dropped frames
+    return t
+
+
+def write_nwb(path, seed=0):
+    """Small SLAP2-like NWB file: image masks, dF/F series per trial and DMD, stimulus table."""
+    from hdmf.backends.hdf5 import H5DataIO
+    from pynwb import NWBHDF5IO, NWBFile
+    from pynwb.epoch import TimeIntervals
+    from pynwb.ophys import DfOverF, ImageSegmentation, OpticalChannel, RoiResponseSeries
+
+    rng = np.random.default_rng(seed)
+    nwbfile = NWBFile(session_description='synthetic', identifier='synthetic',
+                      session_start_time=datetime(2025, 1, 1, tzinfo=timezone.utc))
+    device = nwbfile.create_device('SLAP2')
+    channel = OpticalChannel(name='channel', description='green', emission_lambda=500.)
+    ophys = nwbfile.create_processing_module('ophys', 'ophys')
+    segmentation = ImageSegmentation()
+    ophys.add(segmentation)
+
+    height, width = IMAGE_SHAPE
+    planes = {}
+    for dmd, n_rois in N_ROIS.items():
+        imaging_plane = nwbfile.create_imaging_plane(
+            name=f'{dmd}_plane', optical_channel=channel, description=dmd, device=device,
+            excitation_lambda=900., imaging_rate=FRAME_RATE, indicator='GCaMP', location='V1')
+        plane = segmentation.create_plane_segmentation(dmd, imaging_plane, f'{dmd}_plane_segmentation')
+        for _ in range(n_rois):
+            mask = np.zeros(IMAGE_SHAPE)
+            y, x = rng.integers(3, height - 6), rng.integers(3, width - 6)
+            mask[y:y + 4, x:x + 5] = rng.random((4, 5)) + 0.1
+            plane.add_roi(image_mask=mask)
+        planes[dmd] = plane
+
+    dff = DfOverF(name='DfOverF')
+    ophys.add(dff)
+    for trial_id in TRIALS:
+        t = trial_timestamps(trial_id)
+        for dmd, n_rois in N_ROIS.items():
+            rois = planes[dmd].create_roi_table_region('rois', region=list(range(n_rois)))
+            data = rng.random((len(t), n_rois)).astype(np.float32)
+            dff.add_roi_response_series(RoiResponseSeries(
+                name=f'Trial{trial_id}_{dmd}', data=H5DataIO(data, chunks=(32, n_rois)), rois=rois,
+                unit='a.u.', timestamps=t))
+
+    # Stimulus times are relative to the start of Trial1, like the anchored dF/F time
+    stimuli = TimeIntervals(name='stimulus_presentations', description='gratings')
+    for column in ('trial',) + STIMULUS_FEATURES:
+        stimuli.add_column(column, column)
+    for trial_id in sorted(TRIALS):
+        t = trial_timestamps(trial_id) - ANCHOR
+        start = t[0] + 0.1
+        while start < t[-1] - 0.3:
+            stimuli.add_interval(start_time=start, stop_time=start + 0.25, trial=trial_id,
+                                 orientation=float(rng.choice([0, 45, 90])), contrast=1.0, x_position=0.,
+                                 y_position=0., delay=rng.random(), diameter=20., spatial_frequency=0.08,
+                                 temporal_frequency=4.)
+            start += 0.25 + (0.0 if rng.random() < 0.2 else 0.3)  # some abutting
+    nwbfile.add_time_intervals(stimuli)
+
+    with NWBHDF5IO(str(path), 'w') as io:
+        io.write(nwbfile)
+    return path
+
+
+@pytest.fixture(scope='session')
+def nwb_path(tmp_path_factory):
+    pytest.importorskip('pynwb')
+    return write_nwb(tmp_path_factory.mktemp('nwb') / 'session.nwb')
+
+
+def write_harp_register(path, address, times, payload, dtype):
+    """Harp register file of timestamped messages carrying ``payload`` (n_messages, length) at ``times``."""
+    from nwb_io.harp_bin import SECONDS_PER_TICK, frame_dtype
+
+    dtype = np.dtype(dtype)
+    payload = np.asarray(payload, dtype=dtype).reshape(len(times), -1)
+    type_codes = {'u': 0, 'i': 128, 'f': 64}
+    frames = np.zeros(len(times), dtype=frame_dtype(dtype, payload.shape[1]))
+    frames['type'] = 3  # event
+    frames['length'] = frames.dtype.itemsize - 2
+    frames['address'] = address
+    frames['port'] = 255
+    frames['payload_type'] = 0x10 | type_codes[dtype.kind] | dtype.itemsize
+    ticks = np.round(np.asarray(times) / SECONDS_PER_TICK).astype(np.int64)
+    seconds_ticks = int(round(1 / SECONDS_PER_TICK))
+    frames['seconds'] = ticks // seconds_ticks
+    frames['ticks'] = ticks % seconds_ticks
+    frames['payload'] = payload
+    raw = frames.view(np.uint8).reshape(len(frames), -1)
+    frames['checksum'] = raw[:, :-1].sum(axis=1, dtype=np.uint64) % 256
+    frames.tofile(path)
+    return path
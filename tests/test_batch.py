@@ -0,0 +1,74 @@
+import os
+import shutil
+
+import pytest
+
+from conftest import N_ROIS, TRIALS
+
+from nwb_io.batch import iter_sessions, resolve_paths
+
+N_SERIES = len(TRIALS) * len(N_ROIS)
+
+
+def n_series(nwb):
+    return len(nwb.index.series)
+
+
+def crash_or_count(nwb):
+    # Takes the worker process down, as the OOM killer would
+    if 'crash' in nwb.data_path.name:
+        os._exit(1)
+    return n_series(nwb)
+
+
+def unpicklable(nwb):
+    return lambda: None
+
+
+@pytest.fixture
+def sessions(nwb_path, tmp_path):
+    paths = [tmp_path / f'{name}.nwb' for name in 'abcd']
+    for path in paths:
+        shutil.copy(nwb_path, path)
+    return paths
+
+
+def results_by_name(results):
+    return {result.path.name: result for result in results}
+
+
+@pytest.mark.parametrize('max_workers', [1, 2])
+def test_errors_stay_with_their_session(sessions, tmp_path, max_workers):
+    paths = sessions + [tmp_path / 'missing.nwb']
+    results = results_by_name(iter_sessions(paths, n_series, max_workers=max_workers))
+    assert set(results) == {p.name for p in paths}
+    assert not results['missing.nwb'].ok
+    assert 'missing.nwb' in results['missing.nwb'].error
+    assert all(results[p.name].ok and results[p.name].result == N_SERIES for p in sessions)
+
+
+def test_dead_worker_fails_only_its_session(sessions, tmp_path):
+    crash = tmp_path / 'crash.nwb'
+    shutil.copy(sessions[0], crash)
+    results = results_by_name(iter_sessions(sessions[1:] + [crash] + sessions[:1], crash_or_count,
+                                            max_workers=2, max_open=3))
+    assert len(results) == len(sessions) + 1
+    assert not results['crash.nwb'].ok
+    assert 'BrokenProcessPool' in results['crash.nwb'].error
+    # Sessions running next to the crash were retried
+    assert all(results[p.name].ok and results[p.name].result == N_SERIES for p in sessions)
+
+
+def test_unpicklable_result_is_an_error(sessions):
+    results = list(iter_sessions(sessions[:2], unpicklable, max_workers=2))
+    assert len(results) == 2
+    assert not any(result.ok for result in results)
+
+
+def test_resolve_paths(sessions, tmp_path):
+    assert resolve_paths(tmp_path) == sorted(sessions)
+    assert resolve_paths(str(tmp_path / '[ab].nwb')) == sessions[:2]
+    (tmp_path / 'manifest.csv').write_text('subject,nwb_path\n1,b.nwb\n2,d.nwb\n\n')
+    assert resolve_paths(tmp_path / 'manifest.csv') == [tmp_path / 'b.nwb', tmp_path / 'd.nwb']
+    (tmp_path / 'bare.csv').write_text('a.nwb\nc.nwb\n')
+    assert resolve_paths(tmp_path / 'bare.csv') == [tmp_path / 'a.nwb', tmp_path / 'c.nwb']
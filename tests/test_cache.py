@@ -0,0 +1,136 @@
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from test_load import assert_same_dff
+
+from nwb_io.cache import GroupWriter, SessionCache, frame_from_cache, frame_to_cache, load_group
+from nwb_io.load import NwbData
+
+
+def test_session_served_from_cache(nwb_path, tmp_path):
+    cache = SessionCache(tmp_path / 'cache')
+    with NwbData(nwb_path) as nwb:
+        dff = nwb.load_dFoverF_data()
+        stim_df = nwb.load_stimulus_data()
+        masks = nwb.get_roi_masks_by_dmd('DMD2_plane_segmentation')
+
+    for _ in range(2):  # miss, then hit
+        with NwbData(nwb_path, cache=cache) as nwb:
+            assert_same_dff(nwb.load_dFoverF_data(), dff)
+            pd.testing.assert_frame_equal(nwb.load_stimulus_data(), stim_df)
+            np.testing.assert_array_equal(nwb.get_roi_masks_by_dmd('DMD2_plane_segmentation'), masks)
+            np.testing.assert_array_equal(
+                nwb.get_roi_masks_by_dmd('DMD2_plane_segmentation', sparse=True).to_dense(), masks)
+    # Hits never open the NWB file
+    assert nwb.io is None
+    assert cache.size_bytes() > 0
+
+
+def test_changed_file_is_a_miss(nwb_path, tmp_path):
+    path = shutil.copy(nwb_path, tmp_path / 'session.nwb')
+    cache = SessionCache(tmp_path / 'cache')
+    with NwbData(path, cache=cache) as nwb:
+        nwb.load_stimulus_data()
+    assert cache.load(path, 'stimulus_presentations') is not None
+
+    with open(path, 'ab') as f:
+        f.write(b'\0')
+    assert cache.load(path, 'stimulus_presentations') is None
+
+
+def _fill(cache, path, group, n_bytes):
+    with cache.writer(path, group) as writer:
+        writer.add('data', np.zeros(n_bytes, dtype=np.uint8))
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    paths = []
+    for i in range(3):
+        paths.append(tmp_path / f'{i}.nwb')
+        paths[-1].write_bytes(bytes([i]) * 100)
+    cache = SessionCache(tmp_path / 'cache', max_bytes=2500)
+
+    _fill(cache, paths[0], 'a', 1000)
+    _fill(cache, paths[1], 'a', 1000)
+    os.utime(cache.cache_dir / cache.fingerprint(paths[0]) / 'last_access', (0, 0))
+    os.utime(cache.cache_dir / cache.fingerprint(paths[1]) / 'last_access', (1, 1))
+    # A hit makes paths[0] the most recently used
+    assert cache.load(paths[0], 'a') is not None
+    _fill(cache, paths[2], 'a', 1000)
+
+    assert cache.load(paths[1], 'a') is None
+    assert cache.load(paths[0], 'a') is not None
+    assert cache.load(paths[2], 'a') is not None
+    assert cache.size_bytes() <= cache.max_bytes
+
+
+def test_invalidate(tmp_path):
+    paths = [tmp_path / 'a.nwb', tmp_path / 'b.nwb']
+    for i, path in enumerate(paths):
+        path.write_bytes(bytes([i]) * 100)
+    cache = SessionCache(tmp_path / 'cache')
+    for path in paths:
+        _fill(cache, path, 'x', 10)
+        _fill(cache, path, 'y', 10)
+
+    cache.invalidate(paths[0])
+    assert cache.load(paths[0], 'x') is None and cache.load(paths[0], 'y') is None
+    assert cache.load(paths[1], 'x') is not None
+
+    cache.invalidate()
+    assert cache.load(paths[1], 'x') is None
+    assert cache.size_bytes() == 0
+
+
+def test_concurrent_writers_keep_every_entry(tmp_path):
+    paths = []
+    for i in range(16):
+        paths.append(tmp_path / f'{i}.nwb')
+        paths[-1].write_bytes(bytes([i]) * 100)
+    cache_dir = tmp_path / 'cache'
+
+    def write(path):
+        # One cache object per writer, as every process of a batch has its own
+        _fill(SessionCache(cache_dir), path, 'a', 100)
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(write, paths))
+
+    cache = SessionCache(cache_dir)
+    assert len(cache._read_manifest()['entries']) == len(paths)
+    assert all(cache.load(path, 'a') is not None for path in paths)
+
+
+def test_frame_keeps_its_dtypes(tmp_path):
+    df = pd.DataFrame({'stim_name': pd.Categorical(['a', 'b', 'a']),
+                       'trial': pd.array([1, None, 3], dtype='Int64'),
+                       'contrast': np.array([0.5, 1, 0.25], dtype=np.float32),
+                       'is_change': [True, False, True],
+                       'label': pd.Series(['x', 'y', 'z'], dtype=object)},
+                      index=pd.Index(np.array([4, 5, 6], dtype=np.uint16), name='id'))
+    with GroupWriter(tmp_path / 'frame') as writer:
+        frame_to_cache(writer, df)
+    pd.testing.assert_frame_equal(frame_from_cache(*load_group(tmp_path / 'frame')), df)
+
+
+def test_failed_write_keeps_the_previous_group(tmp_path):
+    path = tmp_path / 'a.nwb'
+    path.write_bytes(b'a' * 100)
+    cache = SessionCache(tmp_path / 'cache')
+    _fill(cache, path, 'a', 10)
+
+    with pytest.raises(RuntimeError):
+        with cache.writer(path, 'a') as writer:
+            writer.add('data', np.ones(20, dtype=np.uint8))
+            # Readers see the complete previous group until the new one is committed
+            assert len(cache.load(path, 'a')[0]['data']) == 10
+            raise RuntimeError
+    assert len(cache.load(path, 'a')[0]['data']) == 10
+    # No temporary folders are left behind
+    assert sorted(p.name for p in cache.cache_dir.iterdir()) == sorted(
+        ['manifest.json', 'manifest.lock', cache.fingerprint(path)])
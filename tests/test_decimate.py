@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from nwb_io.decimate import axis_max_points, decimate_trace
+
+
+@pytest.fixture
+def ax():
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(10, 4), dpi=100)
+    return fig.add_axes([0.1, 0.1, 0.8, 0.8])
+
+
+def test_axis_max_points(ax):
+    # Two points per pixel column of the 8 inch wide axis
+    assert axis_max_points(ax) == 1600
+    assert axis_max_points(ax, dpi=150) == 2400
+    assert axis_max_points(ax, points_per_pixel=1) == 800
+
+
+def test_decimated_to_the_axis_keeps_peaks(ax):
+    rng = np.random.default_rng(0)
+    t = np.arange(10**6) / 1000
+    y = rng.normal(0, 1, len(t))
+    y[[1234, 567890]] = [50, -50]
+    max_points = axis_max_points(ax)
+    t_plot, y_plot = decimate_trace(t, y, max_points)
+    assert len(y_plot) <= max_points
+    assert np.all(np.diff(t_plot) > 0)
+    assert y_plot.max() == 50 and y_plot.min() == -50
+    assert len(decimate_trace(t, y, None)[1]) == len(y)
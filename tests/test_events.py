@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import ANCHOR, FRAME_RATE, trial_timestamps
+
+from nwb_io.events import _interp_windows, _nearest_frame
+from nwb_io.load import NwbData
+
+PRE, POST = 0.2, 0.5
+N_PRE, N_POST = int(PRE * FRAME_RATE), int(POST * FRAME_RATE)
+
+
+def reference_window(trial_data, dmd, onset):
+    # Frames -N_PRE to N_POST around the frame nearest to onset, NaN outside the trial
+    t = trial_data['time']
+    data = np.asarray(trial_data[dmd])
+    frame = int(np.argmin(np.abs(t - onset)))
+    window = np.full((len(data), N_PRE + N_POST), np.nan)
+    for k, f in enumerate(range(frame - N_PRE, frame + N_POST)):
+        if 0 <= f < len(t):
+            window[:, k] = data[:, f]
+    return window
+
+
+@pytest.fixture(scope='module')
+def session(nwb_path):
+    with NwbData(nwb_path) as nwb:
+        dff = nwb.load_dFoverF_data()
+        dff = {trial_id: {key: np.asarray(value) for key, value in trial_data.items()}
+               for trial_id, trial_data in dff.items()}
+        yield nwb, dff
+
+
+@pytest.mark.parametrize('dmd', ['DMD1', 'DMD2'])
+def test_windows_match_reference(session, dmd):
+    nwb, dff = session
+    stim_df = nwb.load_stimulus_data()
+    tensor, sample_times, events = nwb.load_event_tensor(PRE, POST, dmd=dmd)
+    assert tensor.shape == (len(stim_df), dff[1][dmd].shape[0], N_PRE + N_POST)
+    np.testing.assert_allclose(sample_times, np.arange(-N_PRE, N_POST) / FRAME_RATE, atol=1e-12)
+    for i, (trial_id, onset) in enumerate(zip(stim_df['trial'], stim_df['start_time'])):
+        np.testing.assert_array_equal(tensor[i], reference_window(dff[trial_id], dmd, onset))
+    np.testing.assert_array_equal(events['event_trial'], stim_df['trial'])
+    assert np.abs(events['onset_time'] - stim_df['start_time']).max() <= 0.5 / FRAME_RATE
+
+    # Without a trial column events are assigned to the series they fall in
+    by_time, _, events_by_time = nwb.load_event_tensor(PRE, POST, dmd=dmd, stim_df=stim_df.drop(columns='trial'))
+    np.testing.assert_array_equal(by_time, tensor)
+    np.testing.assert_array_equal(events_by_time['event_trial'], stim_df['trial'])
+
+
+def test_window_edges(session):
+    nwb, dff = session
+    t = trial_timestamps(1) - ANCHOR
+    stim_df = pd.DataFrame({'start_time': [t[0], t[5], t[100], t[-10]], 'trial': [1, 1, 1, 1]})
+    tensor, _, events = nwb.load_event_tensor(PRE, POST, stim_df=stim_df)
+    np.testing.assert_array_equal(events['complete'], [False, False, True, False])
+    np.testing.assert_array_equal(events['onset_frame'], [0, 5, 100, len(t) - 10])
+    # Samples before the first and after the last frame are NaN, all others are data
+    np.testing.assert_array_equal(np.isnan(tensor[:, 0]).sum(axis=1), [N_PRE, N_PRE - 5, 0, N_POST - 10])
+    assert np.isnan(tensor[0, :, :N_PRE]).all() and not np.isnan(tensor[0, :, N_PRE:]).any()
+    assert np.isnan(tensor[3, :, N_PRE + 10:]).all() and not np.isnan(tensor[3, :, :N_PRE + 10]).any()
+    for i, onset in enumerate(stim_df['start_time']):
+        np.testing.assert_array_equal(tensor[i], reference_window(dff[1], 'DMD1', onset))
+
+
+def test_missing_trials(session):
+    nwb, dff = session
+    onset = trial_timestamps(1)[100] - ANCHOR
+    for trial in ([1, np.nan, 7], pd.array([1, None, 7], dtype='Int64')):
+        stim_df = pd.DataFrame({'start_time': [onset] * 3, 'trial': trial})
+        tensor, _, events = nwb.load_event_tensor(PRE, POST, stim_df=stim_df)
+        np.testing.assert_array_equal(tensor[0], reference_window(dff[1], 'DMD1', onset))
+        # No trial, or a trial without a series: nothing to align to
+        assert np.isnan(tensor[1:]).all()
+        np.testing.assert_array_equal(events['event_trial'], [1, -1, 7])
+        np.testing.assert_array_equal(events['complete'], [True, False, False])
+
+    # Outside every series when assigned by time
+    _, _, events = nwb.load_event_tensor(PRE, POST, stim_df=pd.DataFrame({'start_time': [-50.0, onset]}))
+    np.testing.assert_array_equal(events['event_trial'], [-1, 1])
+
+
+def test_resampled_windows_interpolate(session):
+    nwb, dff = session
+    t = dff[1]['time']
+    # Half way between two frames
+    stim_df = pd.DataFrame({'start_time': [(t[100] + t[101]) / 2], 'trial': [1]})
+    tensor, sample_times, _ = nwb.load_event_tensor(PRE, POST, stim_df=stim_df, resample_rate=FRAME_RATE)
+    np.testing.assert_allclose(sample_times, np.arange(-N_PRE, N_POST) / FRAME_RATE, atol=1e-12)
+    data = dff[1]['DMD1']
+    expected = (data[:, 100 - N_PRE:100 + N_POST] + data[:, 101 - N_PRE:101 + N_POST]) / 2
+    np.testing.assert_allclose(tensor[0], expected, rtol=1e-6)
+
+
+def test_single_frame_series():
+    t = np.array([5.0])
+    np.testing.assert_array_equal(_nearest_frame(t, np.array([4.0, 5.0, 6.0])), [0, 0, 0])
+    left, right, w, valid = _interp_windows(t, np.array([[4.0, 5.0, 6.0]]))
+    np.testing.assert_array_equal(left, [[0, 0, 0]])
+    np.testing.assert_array_equal(right, [[0, 0, 0]])
+    np.testing.assert_array_equal(w, [[0, 0, 0]])
+    np.testing.assert_array_equal(valid, [[False, True, False]])
@@ -0,0 +1,58 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from test_load import assert_same_dff
+
+from nwb_io.export import ExportedSession, export_session
+from nwb_io.load import NwbData
+from nwb_io.profiling import Profiler
+
+
+@pytest.fixture(scope='module')
+def exported(nwb_path, tmp_path_factory):
+    return export_session(nwb_path, tmp_path_factory.mktemp('export') / 'session.export', verbose=False)
+
+
+def test_round_trip(nwb_path, exported):
+    with NwbData(nwb_path) as nwb, ExportedSession(exported) as session:
+        assert_same_dff(session.load_dFoverF_data(), nwb.load_dFoverF_data())
+        pd.testing.assert_frame_equal(session.load_stimulus_data(), nwb.load_stimulus_data())
+        pd.testing.assert_frame_equal(session.load_sampling_rate_info(), nwb.load_sampling_rate_info())
+        for seg_key, plane_seg in nwb.get_roi_meta_data().items():
+            masks = nwb.get_roi_masks_by_dmd(seg_key)
+            np.testing.assert_array_equal(session.get_roi_masks_by_dmd(seg_key), masks)
+            np.testing.assert_array_equal(session.get_roi_masks_by_dmd(seg_key, sparse=True).to_dense(), masks)
+            np.testing.assert_array_equal(session.get_roi_meta_data()[seg_key].index, plane_seg.id.data[:])
+
+        assert session.session['identifier'] == nwb.nwbfile.identifier
+        with pytest.raises(AttributeError):
+            session.nwbfile
+        with pytest.raises(KeyError):
+            session.get_roi_masks_by_dmd('DMD3_plane_segmentation')
+
+
+def test_lazy_views_read_the_export(nwb_path, exported):
+    with NwbData(nwb_path) as nwb, ExportedSession(exported) as session:
+        expected = nwb.load_dFoverF_data()
+        lazy = session.load_dFoverF_data(lazy=True)
+        for trial_id, trial_data in expected.items():
+            np.testing.assert_array_equal(lazy[trial_id]['DMD1'][:, 10:20], trial_data['DMD1'][:, 10:20])
+
+
+def test_open_is_profiled(exported):
+    profiler = Profiler()
+    with ExportedSession(exported, profiler=profiler) as session:
+        session.load_stimulus_data()
+    assert profiler.stages['open']['calls'] == 1
+    assert profiler.stages['load_stimulus_data']['calls'] == 1
+
+
+def test_newer_format_is_refused(exported, tmp_path):
+    (tmp_path / 'newer').mkdir()
+    session = json.loads((exported / 'session.json').read_text())
+    (tmp_path / 'newer' / 'session.json').write_text(json.dumps({**session, 'format_version': 99}))
+    with pytest.raises(ValueError, match='format version'):
+        ExportedSession(tmp_path / 'newer').__enter__()
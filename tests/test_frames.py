@@ -0,0 +1,63 @@
+import h5py
+import numpy as np
+import pytest
+
+from nwb_io.frames import read_frame
+
+
+class CountingStack:
+    # Image stack recording the frames of every read
+    def __init__(self, data):
+        self.data = data
+        self.shape, self.dtype, self.chunks = data.shape, data.dtype, getattr(data, 'chunks', None)
+        self.reads = []
+
+    def __getitem__(self, index):
+        self.reads.append(index)
+        return self.data[index]
+
+
+@pytest.fixture
+def stack(tmp_path):
+    data = np.random.default_rng(0).integers(0, 4000, (50, 12, 16)).astype(np.uint16)
+    with h5py.File(tmp_path / 'stack.h5', 'w') as f:
+        f.create_dataset('data', data=data, chunks=(4, 12, 16))
+    with h5py.File(tmp_path / 'stack.h5', 'r') as f:
+        yield f['data'], data
+
+
+@pytest.mark.parametrize('n_frames', [None, 1, 7, 50, 500])
+def test_projections(stack, n_frames):
+    dataset, data = stack
+    stop = len(data) if n_frames is None else min(n_frames, len(data))
+    np.testing.assert_array_equal(read_frame(dataset), data[0])
+    np.testing.assert_allclose(read_frame(dataset, 'mean', n_frames), data[:stop].mean(axis=0), rtol=1e-12)
+    maximum = read_frame(dataset, 'max', n_frames)
+    np.testing.assert_array_equal(maximum, data[:stop].max(axis=0))
+    assert maximum.dtype == np.uint16
+
+
+@pytest.mark.parametrize('block_bytes', [1, 3 * 12 * 16 * 2, 10 * 12 * 16 * 2, 1 << 30])
+def test_blocks(stack, block_bytes):
+    dataset, data = stack
+    counting = CountingStack(dataset)
+    np.testing.assert_allclose(read_frame(counting, 'mean', 30, block_bytes=block_bytes),
+                               data[:30].mean(axis=0), rtol=1e-12)
+    # Whole chunks of 4 frames per read, as many as fit in block_bytes, and nothing past frame 30
+    sizes = [index.stop - index.start for index in counting.reads]
+    expected = max(4, min(block_bytes // (12 * 16 * 2), 30) // 4 * 4)
+    assert sizes[:-1] == [expected] * (len(sizes) - 1)
+    assert counting.reads[-1].stop == 30 and sum(sizes) == 30
+
+    # Only frame 0 is read for the first frame
+    counting = CountingStack(dataset)
+    read_frame(counting)
+    assert counting.reads == [0]
+
+
+def test_errors(stack):
+    dataset, _ = stack
+    with pytest.raises(ValueError, match='frame mode'):
+        read_frame(dataset, 'median')
+    with pytest.raises(ValueError, match='no frames'):
+        read_frame(np.zeros((0, 4, 4)), 'mean')
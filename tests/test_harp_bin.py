@@ -0,0 +1,124 @@
+import numpy as np
+import pytest
+
+from conftest import write_harp_register
+
+from nwb_io.harp_bin import SECONDS_PER_TICK, HarpDevice, HarpRegister
+
+DEVICE_YML = b"""device: Behavior
+whoAmI: 1216
+registers:
+  AnalogData:
+    address: 44
+    type: S16
+    length: 3
+    access: Event
+    payloadSpec:
+      AnalogInput0:
+        offset: 0
+      Encoder:
+        offset: 1
+      AnalogInput1:
+        offset: 2
+  OutputSet:
+    address: 34
+    type: U16
+    access: Write
+    payloadSpec:
+      DO0:
+        mask: 0x4
+      Port1:
+        mask: 0x30
+  PulseDO0:
+    address: 50
+    type: U16
+    access: Write
+"""
+
+
+@pytest.fixture
+def session(tmp_path):
+    rng = np.random.default_rng(0)
+    times = np.round((1000 + np.arange(5000) / 1000) / SECONDS_PER_TICK) * SECONDS_PER_TICK
+    analog = rng.integers(-2000, 2000, (len(times), 3)).astype(np.int16)
+    outputs = rng.integers(0, 1 << 16, 50).astype(np.uint16)
+    write_harp_register(tmp_path / 'Behavior_44.bin', 44, times, analog, np.int16)
+    write_harp_register(tmp_path / 'Behavior_34.bin', 34, times[::100], outputs, np.uint16)
+    (tmp_path / 'device.yml').write_bytes(DEVICE_YML)
+    return tmp_path, times, analog, outputs
+
+
+def test_read_register(session):
+    path, times, analog, _ = session
+    register = HarpRegister(path / 'Behavior_44.bin')
+    assert (register.address, register.dtype, register.length, len(register)) == (44, np.int16, 3, len(times))
+    t, payload = register.read()
+    np.testing.assert_allclose(t, times, atol=1e-9)
+    np.testing.assert_array_equal(payload, analog)
+
+
+def test_columns_and_masks(session):
+    path, times, analog, outputs = session
+    device = HarpDevice(path)
+    t, channels = device.register('AnalogData').channels(['Encoder', 'AnalogInput0'])
+    np.testing.assert_array_equal(channels['Encoder'], analog[:, 1])
+    np.testing.assert_array_equal(channels['AnalogInput0'], analog[:, 0])
+
+    _, bits = device.register('OutputSet').channels(['DO0', 'Port1'])
+    np.testing.assert_array_equal(bits['DO0'], (outputs & 0x4) >> 2)
+    np.testing.assert_array_equal(bits['Port1'], (outputs & 0x30) >> 4)
+    # Registers outside device.yml are available by address
+    assert device.register(34).address == 34
+
+
+def test_time_range(session):
+    path, times, analog, _ = session
+    register = HarpRegister(path / 'Behavior_44.bin')
+    t0, t1 = times[1234], times[3456] + 1e-4
+    t, encoder = register.channel('1', t0, t1)
+    inside = (times >= t0) & (times < t1)
+    np.testing.assert_allclose(t, times[inside], atol=1e-9)
+    np.testing.assert_array_equal(encoder, analog[inside, 1])
+    assert len(register.timestamps(t1=times[0])) == 0
+
+
+@pytest.mark.parametrize('block_frames', [1, 7, 1000, 1 << 20])
+def test_blocks_match_whole_read(session, block_frames):
+    path, times, analog, _ = session
+    register = HarpDevice(path).register('AnalogData')
+    blocks = list(register.blocks(['Encoder'], t0=times[10], block_frames=block_frames))
+    assert all(len(t) <= block_frames for t, _ in blocks)
+    t, encoder = register.channel('Encoder', t0=times[10])
+    np.testing.assert_array_equal(np.concatenate([b[0] for b in blocks]), t)
+    np.testing.assert_array_equal(np.concatenate([b[1]['Encoder'] for b in blocks]), encoder)
+
+
+def test_truncated_and_empty_files(session, tmp_path):
+    path, times, analog, _ = session
+    content = (path / 'Behavior_44.bin').read_bytes()
+    (tmp_path / 'truncated.bin').write_bytes(content[:-5])
+    np.testing.assert_array_equal(HarpRegister(tmp_path / 'truncated.bin').read()[1], analog[:-1])
+
+    (tmp_path / 'empty.bin').write_bytes(b'')
+    empty = HarpRegister(tmp_path / 'empty.bin', dtype=np.int16, length=3)
+    t, payload = empty.read()
+    assert t.shape == (0,) and payload.shape == (0, 3) and payload.dtype == np.int16
+    with pytest.raises(ValueError):
+        HarpRegister(tmp_path / 'empty.bin')
+
+
+def test_mismatched_register(session):
+    path, *_ = session
+    with pytest.raises(ValueError, match='address'):
+        HarpRegister(path / 'Behavior_44.bin', address=45)
+    with pytest.raises(ValueError, match='payload type'):
+        HarpRegister(path / 'Behavior_44.bin', dtype=np.uint16)
+
+
+def test_matches_harp_python(session):
+    harp_io = pytest.importorskip('harp.io')
+    path, *_ = session
+    expected = harp_io.read(path / 'Behavior_44.bin')
+    t, payload = HarpRegister(path / 'Behavior_44.bin').read()
+    np.testing.assert_allclose(t, expected.index.to_numpy(), atol=1e-9)
+    np.testing.assert_array_equal(payload, expected.to_numpy())
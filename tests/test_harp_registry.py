@@ -0,0 +1,97 @@
+import pytest
+
+from test_harp_bin import DEVICE_YML
+
+from nwb_io.harp_registry import WHOAMI_URL, DeviceRegistry, directory_fetcher
+
+WHOAMI_YML = b"""devices:
+  1216:
+    name: Behavior
+    repositoryUrl: https://github.com/harp-tech/device.behavior
+  1280:
+    name: SoundCard
+"""
+BEHAVIOR_URL = "https://raw.githubusercontent.com/harp-tech/device.behavior/main/software/bonsai/device.yml"
+
+
+class Fetcher:
+    # {url: content} stand-in for GitHub that counts its requests, or fails like a machine offline
+    def __init__(self, files, error=None):
+        self.files = files
+        self.error = error
+        self.urls = []
+
+    def __call__(self, url):
+        self.urls.append(url)
+        if self.error is not None:
+            raise self.error
+        return self.files.get(url)
+
+
+@pytest.fixture
+def github():
+    return Fetcher({WHOAMI_URL: WHOAMI_YML, BEHAVIOR_URL: DEVICE_YML})
+
+
+def snapshot(root, who_am_i=1216, content=DEVICE_YML):
+    (root / 'devices' / str(who_am_i) / 'main').mkdir(parents=True)
+    (root / 'devices' / str(who_am_i) / 'main' / 'device.yml').write_bytes(content)
+    (root / 'whoami.yml').write_bytes(WHOAMI_YML)
+    return root
+
+
+def test_fetched_once_then_cached(tmp_path, github):
+    registry = DeviceRegistry(tmp_path / 'cache', github, snapshot_dir=None)
+    assert registry.device_yml(1216) == DEVICE_YML
+    # whoami.yml, then the two places of device.yml in the repository
+    assert github.urls == [WHOAMI_URL, BEHAVIOR_URL.replace('software/bonsai/', ''), BEHAVIOR_URL]
+    assert registry.device_yml(1216) == DEVICE_YML
+    assert len(github.urls) == 3
+
+    # Another process finds both on disk
+    other = DeviceRegistry(tmp_path / 'cache', Fetcher({}), snapshot_dir=None)
+    assert other.device_yml(1216) == DEVICE_YML
+    assert other.whoami()[1216]['name'] == 'Behavior'
+    assert other.fetcher.urls == []
+
+
+def test_offline_after_the_first_failure(tmp_path):
+    fetcher = Fetcher({}, error=ConnectionError('no network'))
+    registry = DeviceRegistry(tmp_path / 'cache', fetcher, snapshot_dir=snapshot(tmp_path / 'snapshot'))
+    with pytest.warns(UserWarning, match='Could not fetch'):
+        assert registry.device_yml(1216) == DEVICE_YML
+    assert registry.offline and len(fetcher.urls) == 1
+    # The snapshot is read, never copied to the cache
+    assert not (tmp_path / 'cache' / 'devices').exists()
+    with pytest.raises(FileNotFoundError, match='WhoAmI 1280'):
+        registry.device_yml(1280)
+
+
+def test_snapshot_fallback(tmp_path, github):
+    registry = DeviceRegistry(tmp_path / 'cache', github, snapshot_dir=snapshot(tmp_path / 'snapshot', 1280, b'sound'))
+    # Fetched when the fetcher has it, else from the snapshot
+    assert registry.device_yml(1216) == DEVICE_YML
+    assert registry.device_yml(1280) == b'sound'
+    with pytest.raises(KeyError, match='WhoAmI 9999'):
+        registry.device_yml(9999)
+
+    registry = DeviceRegistry(None, None, snapshot_dir=tmp_path / 'missing')
+    with pytest.raises(FileNotFoundError, match='whoami.yml'):
+        registry.whoami()
+
+
+def test_fetch_device_and_mirror(tmp_path, github):
+    mirror = tmp_path / 'mirror' / 'raw.githubusercontent.com'
+    for url, content in github.files.items():
+        path = mirror / url.split('raw.githubusercontent.com/')[1]
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+    registry = DeviceRegistry(None, directory_fetcher(tmp_path / 'mirror'), snapshot_dir=None)
+    assert registry.fetch_device(1216) == DEVICE_YML
+    with pytest.raises(FileNotFoundError, match='device.behavior'):
+        registry.fetch_device(1216, 'v2')
+    with pytest.raises(ValueError, match='repositoryUrl'):
+        registry.fetch_device(1280)
+
+    registry.add(1280, b'sound')
+    assert registry.device_yml(1280) == b'sound'
@@ -0,0 +1,43 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+CODE_DIR = Path(__file__).resolve().parents[1] / 'code'
+HEAVY_MODULES = ('numpy', 'pandas', 'h5py', 'pynwb', 'matplotlib', 'scipy')
+
+
+def imported_modules(statement):
+    # Heavy modules in sys.modules after running statement in a fresh interpreter
+    report = f"\nimport sys; print('imported:' + ','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    out = subprocess.run([sys.executable, '-c', statement + report], cwd=CODE_DIR, check=True,
+                         capture_output=True, text=True).stdout
+    return set(filter(None, out.rpartition('imported:')[2].strip().split(',')))
+
+
+@pytest.mark.parametrize('statement, expected', [
+    ('import nwb_io', set()),
+    ('from nwb_io import NwbData, SessionCache, Profiler', {'numpy'}),
+    ('from nwb_io.export import ExportedSession', {'numpy'}),
+])
+def test_heavy_imports_are_deferred(statement, expected):
+    assert imported_modules(statement) == expected
+
+
+def test_lazy_module_imports_on_first_use():
+    assert imported_modules('from nwb_io.imports import lazy_import; pd = lazy_import("pandas")') == set()
+    assert 'pandas' in imported_modules('from nwb_io.imports import lazy_import; pd = lazy_import("pandas"); pd.DataFrame')
+
+
+def test_public_names_resolve():
+    import nwb_io
+    for name in nwb_io.__all__:
+        assert getattr(nwb_io, name).__name__ == name
+
+
+def test_cli_help_skips_heavy_imports():
+    script = CODE_DIR / 'data-access' / 'validate_nwb_slap2.py'
+    statement = (f"import sys, runpy; sys.argv = [{str(script)!r}, '--help']\n"
+                 f"try:\n    runpy.run_path({str(script)!r}, run_name='__main__')\nexcept SystemExit:\n    pass")
+    assert imported_modules(statement) <= {'numpy'}
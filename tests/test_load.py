@@ -0,0 +1,71 @@
+from collections import defaultdict
+
+import numpy as np
+import pytest
+
+from conftest import TRIALS
+
+from nwb_io.load import NwbData
+
+
+def baseline_load_dFoverF_data(nwbfile):
+    # load_dFoverF_data before the session index and lazy views
+    dff_obj = nwbfile.processing['ophys'].data_interfaces['DfOverF']
+    trial1_time0 = dff_obj.roi_response_series[next(k for k in dff_obj.roi_response_series
+                                                     if k.split('_')[0] == 'Trial1')].timestamps[0]
+    data_dict = defaultdict(dict)
+    for key in dff_obj.roi_response_series.keys():
+        ts = dff_obj.roi_response_series[key]
+        trial_id = int(key.split('_')[0].replace('Trial', ''))
+        dmd_id = 'DMD1' if 'DMD1' in key else 'DMD2'
+        data_dict[trial_id][dmd_id] = ts.data[:].T
+        data_dict[trial_id]['time'] = ts.timestamps[:] - trial1_time0
+    return data_dict
+
+
+def assert_same_dff(actual, expected):
+    assert sorted(actual) == sorted(expected)
+    for trial_id, trial_data in expected.items():
+        assert sorted(actual[trial_id]) == sorted(trial_data)
+        for key, value in trial_data.items():
+            np.testing.assert_array_equal(np.asarray(actual[trial_id][key]), value)
+
+
+def test_load_dFoverF_data_matches_baseline(nwb_path):
+    with NwbData(nwb_path) as nwb:
+        expected = baseline_load_dFoverF_data(nwb.nwbfile)
+        assert sorted(expected) == sorted(TRIALS)
+        assert_same_dff(nwb.load_dFoverF_data(), expected)
+
+
+def test_lazy_views_match_eager_data(nwb_path):
+    with NwbData(nwb_path) as nwb:
+        eager = nwb.load_dFoverF_data()
+        lazy = nwb.load_dFoverF_data(lazy=True)
+        assert_same_dff(lazy, eager)
+
+        view, data = lazy[2]['DMD1'], eager[2]['DMD1']
+        np.testing.assert_array_equal(view[1:4, 10:200:7], data[1:4, 10:200:7])
+        np.testing.assert_array_equal(view[:, -5:], data[:, -5:])
+        window, t = view.window(0.3, 0.9)
+        inside = (eager[2]['time'] >= 0.3) & (eager[2]['time'] <= 0.9)
+        np.testing.assert_array_equal(t, eager[2]['time'][inside])
+        np.testing.assert_array_equal(window, data[:, inside])
+
+
+def test_lazy_views_need_an_open_file(nwb_path):
+    with NwbData(nwb_path) as nwb:
+        view = nwb.load_dFoverF_data(lazy=True)[1]['DMD1']
+    with pytest.raises(Exception):
+        view[:, :10]
+
+
+def test_sampling_rate_skips_single_frame_trials(nwb_path):
+    with NwbData(nwb_path) as nwb:
+        dff = nwb.load_dFoverF_data()
+        short = next(iter(dff))
+        dff[short] = {**dff[short], 'time': dff[short]['time'][:1]}
+        with pytest.warns(UserWarning, match='Not enough data'):
+            rate_df = nwb.load_sampling_rate_info(dff)
+    assert short not in set(rate_df['Trial'])
+    assert len(rate_df) == len(dff) - 1
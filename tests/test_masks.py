@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from conftest import N_ROIS
+
+from nwb_io.load import NwbData
+from nwb_io.masks import SparseRoiMasks
+
+
+def random_masks(n_rois=6, shape=(20, 30), seed=0):
+    # Overlapping rectangles, with an empty ROI and NaN background
+    rng = np.random.default_rng(seed)
+    masks = np.full((n_rois,) + shape, np.nan)
+    for roi in range(n_rois - 1):
+        y, x = rng.integers(0, shape[0] - 5), rng.integers(0, shape[1] - 5)
+        masks[roi, y:y + 5, x:x + 6] = rng.random((5, 6)) + 0.1
+    return masks
+
+
+@pytest.mark.parametrize('segmentation_key', [f'{dmd}_plane_segmentation' for dmd in N_ROIS])
+def test_sparse_masks_match_dense(nwb_path, segmentation_key):
+    with NwbData(nwb_path) as nwb:
+        dense = nwb.get_roi_masks_by_dmd(segmentation_key)
+        sparse = nwb.get_roi_masks_by_dmd(segmentation_key, sparse=True)
+    assert sparse.n_rois == len(dense)
+    assert sparse.image_shape == dense.shape[1:]
+    np.testing.assert_array_equal(sparse.to_dense(), dense)
+    np.testing.assert_array_equal(sparse.areas(), (dense != 0).sum(axis=(1, 2)))
+
+
+def test_from_dense_in_blocks():
+    masks = random_masks()
+    dense = np.nan_to_num(masks)
+    for block_size in (1, 4, 256):
+        sparse = SparseRoiMasks.from_dense(masks, block_size=block_size)
+        np.testing.assert_array_equal(sparse.to_dense(), dense)
+    np.testing.assert_array_equal(sparse.to_dense([3, 1]), dense[[3, 1]])
+    assert sparse.areas()[-1] == 0
+
+
+def test_pixel_masks_round_trip():
+    sparse = SparseRoiMasks.from_dense(random_masks())
+    rebuilt = SparseRoiMasks.from_pixel_masks([sparse.pixel_mask(roi) for roi in range(sparse.n_rois)],
+                                              sparse.image_shape)
+    np.testing.assert_array_equal(rebuilt.to_dense(), sparse.to_dense())
+
+
+def test_from_pixel_table():
+    # The flat table and end offsets of a ragged NWB pixel_mask column, as a compound dtype
+    sparse = SparseRoiMasks.from_dense(random_masks())
+    rows = np.concatenate([sparse.pixel_mask(roi) for roi in range(sparse.n_rois)])
+    table = np.zeros(len(rows), dtype=[('x', '<u4'), ('y', '<u4'), ('weight', '<f4')])
+    table['x'], table['y'], table['weight'] = rows[:, 0], rows[:, 1], rows[:, 2]
+    ends = sparse.indptr[1:]
+
+    rebuilt = SparseRoiMasks.from_pixel_table(table, ends, sparse.image_shape)
+    np.testing.assert_array_equal(rebuilt.to_dense(), sparse.to_dense().astype(np.float32))
+    np.testing.assert_array_equal(SparseRoiMasks.from_pixel_table(rows, ends, sparse.image_shape).to_dense(),
+                                  sparse.to_dense())
+    # Without a shape, the extent of the coordinates
+    inferred = SparseRoiMasks.from_pixel_table(table, ends)
+    assert inferred.image_shape == (rows[:, 1].max() + 1, rows[:, 0].max() + 1)
+    np.testing.assert_array_equal(inferred.to_dense(), rebuilt.to_dense()[:, :inferred.image_shape[0], :inferred.image_shape[1]])
+
+
+def test_derived_quantities_match_dense():
+    dense = np.nan_to_num(random_masks())
+    sparse = SparseRoiMasks.from_dense(dense)
+
+    labels = np.zeros(dense.shape[1:], dtype=np.int32)
+    for roi in range(len(dense)):
+        labels[dense[roi] != 0] = roi + 1
+    np.testing.assert_array_equal(sparse.label_image(), labels)
+
+    y, x = np.mgrid[:dense.shape[1], :dense.shape[2]]
+    with np.errstate(invalid='ignore'):
+        centroids = np.column_stack([(dense * y).sum(axis=(1, 2)), (dense * x).sum(axis=(1, 2))]) / \
+            dense.sum(axis=(1, 2))[:, None]
+    np.testing.assert_allclose(sparse.centroids(), centroids)
+
+    frames = np.random.default_rng(1).random((7,) + dense.shape[1:])
+    with np.errstate(invalid='ignore'):
+        projection = np.einsum('thw,rhw->tr', frames, dense) / dense.sum(axis=(1, 2))
+    np.testing.assert_allclose(sparse.project(frames, block_size=3), projection)
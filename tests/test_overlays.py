@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from nwb_io.overlays import add_events, add_intervals
+
+
+@pytest.fixture
+def ax():
+    from matplotlib.figure import Figure
+
+    return Figure().subplots()
+
+
+def test_intervals_grouped_by_value(ax):
+    starts = np.array([0.0, 1.0, 2.0, 3.0, 4.0])
+    values = [90, 0, 90, 45, 0]
+    collections = add_intervals(ax, starts, starts + 0.5, values, alpha=0.3)
+    # One collection per value, in order of first appearance, labelled and colored by value
+    assert list(collections) == [90, 0, 45]
+    assert len(ax.collections) == 3
+    np.testing.assert_allclose([path.vertices[0, 0] for path in collections[0].get_paths()], [1.0, 4.0])
+    np.testing.assert_allclose(collections[90].get_paths()[1].vertices[:4],
+                               [[2.0, 0.0], [2.5, 0.0], [2.5, 1.0], [2.0, 1.0]])
+    assert [c.get_label() for c in collections.values()] == ['90', '0', '45']
+    assert collections[0].get_alpha() == 0.3
+    assert len({tuple(c.get_facecolor()[0]) for c in collections.values()}) == 3
+    # x autoscaled like axvspan, y left to the data
+    assert ax.get_xlim()[0] <= 0.0 and ax.get_xlim()[1] >= 4.5
+
+
+def test_mixed_and_missing_values(ax):
+    values = ['grating', 1, 'grating', None, 1, np.nan, (1, 2)]
+    collections = add_events(ax, np.arange(7.0), values)
+    keys = list(collections)
+    assert keys[:2] == ['grating', 1] and keys[3] == (1, 2)
+    assert pd.isna(keys[2])
+    segments = [[s[0, 0] for s in c.get_segments()] for c in collections.values()]
+    assert segments == [[0.0, 2.0], [1.0, 4.0], [3.0, 5.0], [6.0]]
+    colors = add_events(ax, np.arange(3.0), ['grating', 1, (1, 2)], colors={'grating': 'r', 1: 'g', (1, 2): 'k'})
+    assert [tuple(c.get_color()[0]) for c in colors.values()] == [(1, 0, 0, 1), (0, 0.5, 0, 1), (0, 0, 0, 1)]
+
+    # Arrays and Series are grouped without sorting, categorical ones too
+    series = pd.Series(['b', 'a', 'b'], dtype='category')
+    assert list(add_events(ax, [0.0, 1.0, 2.0], series)) == ['b', 'a']
+    assert list(add_events(ax, [0.0, 1.0, 2.0], np.array([2.5, np.nan, 1.0])))[::2] == [2.5, 1.0]
+
+
+def test_single_color_and_errors(ax):
+    collections = add_events(ax, [1.0, 2.0], colors='r', ymin=-1, ymax=1, ycoords='data')
+    assert list(collections) == [None]
+    assert ax.get_ylim()[0] <= -1 and ax.get_ylim()[1] >= 1
+    with pytest.raises(ValueError, match='3 values for 2'):
+        add_events(ax, [1.0, 2.0], ['a', 'b', 'c'])
+    with pytest.raises(ValueError, match='ycoords'):
+        add_intervals(ax, [1.0], [2.0], ycoords='figure')
@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from nwb_io.photodiode import (FlipDetector, debounce, detect_flips, display_latencies, flip_thresholds,
+                               hysteresis_state, match_onsets)
+
+RATE = 1000.0
+PERIOD = 0.5
+
+
+def photodiode_trace(n_periods=20, seed=0):
+    """
+    Noisy square wave flipping every PERIOD seconds, starting dark, with a 3-sample glitch in
+    the middle of a dark period and a bouncing second transition. Returns the trace, its sample
+    times and the times and directions of its real flips.
+    """
+    rng = np.random.default_rng(seed)
+    n = int(n_periods * PERIOD * RATE)
+    times = 5.0 + np.arange(n) / RATE
+    period = np.arange(n) // int(PERIOD * RATE)
+    values = 3000.0 * (period % 2) + rng.normal(0, 50, n)
+    # Glitch: three bright samples in the third (dark) period
+    glitch = int(2.5 * PERIOD * RATE)
+    values[glitch:glitch + 3] = 3000
+    # Bounce: the transition to the third period goes dark 3 samples early, then bright for 1
+    bounce = int(2 * PERIOD * RATE)
+    values[bounce - 3:bounce - 1] = 0
+    flip_samples = np.arange(1, n_periods) * int(PERIOD * RATE)
+    flip_samples[1] -= 3
+    return values, times, times[flip_samples], (np.arange(1, n_periods) % 2).astype(bool)
+
+
+def reference_hysteresis(x, low, high, initial=-1):
+    state, out = initial, []
+    for value in x:
+        if value <= low:
+            state = 0
+        elif value >= high:
+            state = 1
+        out.append(state)
+    return np.array(out)
+
+
+def test_hysteresis_state_matches_loop():
+    x = np.random.default_rng(2).normal(0, 1, 2000)
+    x[::17] = np.nan
+    for initial in (-1, 0, 1):
+        np.testing.assert_array_equal(hysteresis_state(x, -0.5, 0.5, initial), reference_hysteresis(x, -0.5, 0.5, initial))
+
+
+def test_flips_of_a_noisy_trace_with_glitch_and_bounce():
+    values, times, flip_times, rising = photodiode_trace()
+    low, high = flip_thresholds(values)
+    assert 500 < low < high < 2500
+
+    t, r = detect_flips(values, times)
+    np.testing.assert_allclose(t, flip_times)
+    np.testing.assert_array_equal(r, rising)
+
+    # Without debouncing the glitch and the bounce show
+    raw_times, _ = detect_flips(values, times, min_duration=0)
+    assert len(raw_times) == len(flip_times) + 4
+
+
+@pytest.mark.parametrize('block_size', [3, 997, 4096, 10**6])
+def test_flips_are_independent_of_the_block_size(block_size):
+    values, times, flip_times, rising = photodiode_trace()
+    low, high = flip_thresholds(values)
+    detector = FlipDetector(low, high)
+    for start in range(0, len(values), block_size):
+        detector.update(values[start:start + block_size], times[start:start + block_size])
+    t, r = detector.flips()
+    np.testing.assert_allclose(t, flip_times)
+    np.testing.assert_array_equal(r, rising)
+
+
+def test_debounce():
+    # A glitch (two flips 2 ms apart) disappears; a bounce (up, down, up) keeps its first flip
+    times = np.array([1.0, 2.0, 2.002, 3.0, 3.001, 3.003, 4.0])
+    rising = np.array([True, False, True, False, True, False, True])
+    t, r = debounce(times, rising, min_duration=0.01)
+    np.testing.assert_array_equal(t, [1.0, 3.0, 4.0])
+    np.testing.assert_array_equal(r, [True, False, True])
+
+    t, r = debounce(times[:0], rising[:0])
+    assert len(t) == len(r) == 0
+
+
+def test_initial_state():
+    values = np.array([0.0, 0, 10, 10, 0, 0])
+    times = np.arange(6.0)
+    # The first crossing sets the state unless the state is known
+    detector = FlipDetector(2, 8, min_duration=0)
+    detector.update(values, times)
+    np.testing.assert_array_equal(detector.flips()[0], [2, 4])
+    detector = FlipDetector(2, 8, min_duration=0, initial_state=1)
+    detector.update(values, times)
+    np.testing.assert_array_equal(detector.flips()[0], [0, 2, 4])
+    with pytest.raises(ValueError):
+        FlipDetector(8, 2)
+
+
+def test_match_onsets():
+    flips = np.array([1.02, 2.03, 3.5, 4.01, 5.2])
+    # 2.0 and 2.01 share a flip (the earlier one missed its frame); 3.0 is too early for 3.5;
+    # onsets may come unsorted
+    onsets = np.array([4.0, 1.0, 2.0, 2.01, 3.0])
+    index, latency = match_onsets(flips, onsets, max_latency=0.1)
+    np.testing.assert_array_equal(index, [3, 0, -1, 1, -1])
+    np.testing.assert_allclose(latency, [0.01, 0.02, np.nan, 0.02, np.nan])
+
+    index, _ = match_onsets(flips, [1.0, 4.0], max_latency=0.1, min_latency=0.015)
+    np.testing.assert_array_equal(index, [0, -1])
+
+
+def test_display_latencies():
+    stim_df = pd.DataFrame({'start_time': [0.0, 1.0, 2.0]})
+    out = display_latencies(stim_df, [10.03, 11.05, 13.0], max_latency=0.1, offset=10.0)
+    np.testing.assert_allclose(out['flip_time'], [10.03, 11.05, np.nan])
+    np.testing.assert_allclose(out['latency'], [0.03, 0.05, np.nan])
+    assert 'latency' not in stim_df
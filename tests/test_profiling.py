@@ -0,0 +1,138 @@
+import io
+import json
+import pstats
+import time
+
+import numpy as np
+import pytest
+
+from nwb_io.profiling import Profiler, function_profile, profiled
+
+
+def test_stage_calls_and_nesting(tmp_path):
+    profiler = Profiler()
+    for _ in range(3):
+        with profiler.stage('outer'):
+            time.sleep(0.01)
+            with profiler.stage('inner'):
+                time.sleep(0.02)
+    with pytest.raises(RuntimeError):
+        with profiler.stage('failing'):
+            raise RuntimeError
+
+    stages = profiler.stages
+    assert list(stages) == ['outer/inner', 'outer', 'failing']
+    assert (stages['outer']['calls'], stages['outer/inner']['calls'], stages['failing']['calls']) == (3, 3, 1)
+    # The outer stage includes the time of the inner one
+    assert stages['outer/inner']['wall_s'] >= 0.06
+    assert stages['outer']['wall_s'] >= stages['outer/inner']['wall_s'] + 0.03
+    assert profiler._stack == []
+
+
+def test_bytes_read(tmp_path):
+    (tmp_path / 'data.bin').write_bytes(b'x' * (1 << 20))
+    profiler = Profiler()
+    with profiler.stage('read'):
+        (tmp_path / 'data.bin').read_bytes()
+    read = profiler.stages['read']['read_bytes']
+    if read is None:
+        pytest.skip('/proc/self/io is not available')
+    assert (1 << 20) <= read < (1 << 20) + (1 << 16)
+    with profiler.stage('rss'):
+        block = np.ones(64 << 20, dtype=np.uint8)
+    assert profiler.stages['rss']['peak_rss_bytes'] >= block.nbytes
+
+
+def test_iterate_wrap_and_add():
+    profiler = Profiler()
+
+    def slow_items():
+        for i in range(3):
+            time.sleep(0.01)
+            yield i
+
+    consumed = []
+    for item in profiler.iterate('produce', slow_items()):
+        time.sleep(0.02)  # the consumer's work is not accounted to the stage
+        consumed.append(item)
+    assert consumed == [0, 1, 2]
+    # One call per item and one for the exhausted generator
+    assert profiler.stages['produce']['calls'] == 4
+    assert 0.03 <= profiler.stages['produce']['wall_s'] < 0.08
+
+    load = profiler.wrap('load', lambda x: x * 2)
+    assert load(4) == 8 and load(5) == 10
+    assert profiler.stages['load']['calls'] == 2
+
+    profiler.add('render/traces', 1.5)
+    profiler.add('render/traces', 0.5)
+    assert profiler.stages['render/traces']['calls'] == 2
+    assert profiler.stages['render/traces']['wall_s'] == 2.0
+    assert list(profiler.summary())[0] == 'render/traces'
+
+
+def test_disabled_profiler_records_nothing():
+    profiler = Profiler(enabled=False)
+    with profiler.stage('stage'):
+        pass
+    func = len
+    assert profiler.wrap('load', func) is func
+    assert list(profiler.iterate('produce', range(3))) == [0, 1, 2]
+    profiler.add('render', 1.0)
+    assert profiler.stages == {} and profiler.events == []
+
+
+def test_write_summary_and_trace(tmp_path):
+    profiler = Profiler()
+    with profiler.stage('open'):
+        with profiler.stage('read'):
+            pass
+    path = profiler.write(tmp_path / 'profile.json', nwb_path='session.nwb')
+    with open(path) as f:
+        trace = json.load(f)
+    assert trace['nwb_path'] == 'session.nwb'
+    assert set(trace['stages']) == {'open', 'open/read'}
+    assert set(trace['stages']['open']) == {'calls', 'wall_s', 'read_mb', 'peak_rss_mb', 'rss_growth_mb'}
+    # Complete events, the inner one within the outer one
+    inner, outer = trace['traceEvents']
+    assert (inner['name'], inner['cat'], outer['cat']) == ('read', 'open/read', 'open')
+    assert inner['ph'] == outer['ph'] == 'X'
+    assert outer['ts'] <= inner['ts'] and inner['ts'] + inner['dur'] <= outer['ts'] + outer['dur'] + 0.2
+
+    out = io.StringIO()
+    profiler.print_summary(file=out)
+    lines = out.getvalue().splitlines()
+    assert lines[0].startswith('stage') and len(lines) == 3
+
+
+class Reader:
+    def __init__(self, profiler=None):
+        self.profiler = profiler
+
+    @profiled()
+    def load(self, x):
+        return x + 1
+
+    @profiled('open')
+    def _open(self):
+        return self.load(1)
+
+
+def test_profiled_methods():
+    profiler = Profiler()
+    reader = Reader(profiler)
+    assert reader._open() == 2 and reader.load(2) == 3
+    assert {path: entry['calls'] for path, entry in profiler.stages.items()} == {'open/load': 1, 'open': 1, 'load': 1}
+    assert Reader.load.__name__ == 'load'
+    # Without a profiler, or with a disabled one, methods run untouched
+    assert Reader()._open() == 2
+    assert Reader(Profiler(enabled=False))._open() == 2
+
+
+def test_function_profile(tmp_path):
+    with function_profile(tmp_path / 'profile.prof'):
+        sorted(range(1000), key=lambda i: -i)
+    assert any('sorted' in str(key) for key in pstats.Stats(str(tmp_path / 'profile.prof')).stats)
+    with pytest.raises(ValueError, match='Unknown profiling tool'):
+        with function_profile(tmp_path / 'profile.out', 'perf'):
+            pass
@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from nwb_io.masks import SparseRoiMasks
+from nwb_io.qc import TraceStats, roi_areas, stimulus_counts, summarize, timing_summary
+
+
+def traces(n_frames=5000, seed=0):
+    # (frames, rois) traces far from zero, with NaN runs, an all-NaN ROI and a constant ROI
+    rng = np.random.default_rng(seed)
+    data = 1e4 + rng.normal(0, 1, (n_frames, 5)).cumsum(axis=0) * 0.1 + rng.normal(0, 0.5, (n_frames, 5))
+    data[1000:1100, 1] = np.nan
+    data[::7, 2] = np.nan
+    data[:, 3] = np.nan
+    data[:, 4] = 2.0
+    return data
+
+
+def reference_stats(data):
+    with np.errstate(invalid='ignore'), pytest.warns(RuntimeWarning):
+        mean = np.nanmean(data, axis=0)
+        diff = np.diff(data, axis=0)
+        noise = np.sqrt(np.nanmean(np.square(diff), axis=0) / 2)
+        maximum = np.nanmax(data, axis=0)
+        return {'mean': mean, 'std': np.nanstd(data, axis=0), 'max': maximum, 'noise': noise,
+                'snr': np.where(noise > 0, (maximum - mean) / noise, np.nan),
+                'nan_fraction': np.isnan(data).mean(axis=0)}
+
+
+@pytest.mark.parametrize('block_size', [1, 333, 5000])
+def test_trace_stats_match_numpy(block_size):
+    data = traces()
+    stats = TraceStats()
+    for start in range(0, len(data), block_size):
+        stats.update(data[start:start + block_size])
+    result = stats.result()
+    assert result['n_frames'] == len(data)
+    for name, expected in reference_stats(data).items():
+        np.testing.assert_allclose(result[name], expected, rtol=1e-7, atol=1e-9, err_msg=name)
+    assert np.isnan(result['snr'][[3, 4]]).all()
+
+
+def test_trace_stats_restore_and_empty():
+    stats = TraceStats()
+    assert stats.result()['n_frames'] == 0 and len(stats.result()['snr']) == 0
+    stats.update(traces()[:100])
+    restored = TraceStats()
+    restored.restore({name: np.asarray(value).tolist() for name, value in stats.result().items()})
+    assert restored.n_frames == 100
+    np.testing.assert_array_equal(restored.result()['snr'], stats.result()['snr'])
+
+
+def test_timing_summary():
+    t = 10 + np.arange(1000) / 100
+    t[500:] += 0.03  # 3 missing frames
+    summary = timing_summary(t)
+    assert summary['n_frames'] == 1000
+    assert summary['duration'] == pytest.approx(t[-1] - t[0])
+    assert summary['median_rate_hz'] == pytest.approx(100)
+    assert summary['mean_dt_ms'] == pytest.approx(np.diff(t).mean() * 1000)
+    assert summary['dt_std_ms'] == pytest.approx(np.diff(t).std() * 1000)
+    assert (summary['n_gaps'], summary['missing_frames']) == (1, 3)
+    assert timing_summary([5.0]) == {'n_frames': 1}
+
+
+def test_roi_areas():
+    masks = np.zeros((3, 6, 8))
+    masks[0, :2, :3] = 0.5
+    masks[1, 4, 4] = 1.0
+    masks[1, 5, 5] = -1.0
+    sparse = SparseRoiMasks.from_dense(masks)
+    np.testing.assert_array_equal(roi_areas(masks), [6, 1, 0])
+    np.testing.assert_array_equal(roi_areas(sparse), [6, 1, 0])
+
+
+def test_stimulus_counts():
+    stim_df = pd.DataFrame({'orientation': [0.0, 90.0, 0.0, 0.0, np.nan],
+                            'contrast': [1.0, 1.0, 0.5, 1.0, 1.0],
+                            'start_time': np.arange(5.0)})
+    counts = stimulus_counts(stim_df, ['orientation', 'contrast'])
+    assert counts['n_presentations'] == 5
+    assert counts['per_parameter'] == {'orientation': {'0': 3, '90': 1}, 'contrast': {'0.5': 1, '1': 4}}
+    per_type = {(t['orientation'], t['contrast']): t['count'] for t in counts['per_type']}
+    assert per_type == {('0', '1'): 2, ('90', '1'): 1, ('0', '0.5'): 1, ('nan', '1'): 1}
+    assert counts['n_types'] == 4
+    assert stimulus_counts(stim_df, [])['n_types'] == 0
+
+
+def test_summarize():
+    values = np.array([[4.0, 1.0, np.nan], [3.0, np.inf, 2.0]])
+    assert summarize(values) == {'n': 6, 'n_nan': 2, 'mean': 2.5, 'min': 1.0, 'p25': 1.75, 'median': 2.5,
+                                 'p75': 3.25, 'max': 4.0}
+    assert summarize([]) == {'n': 0, 'n_nan': 0}
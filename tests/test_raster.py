@@ -0,0 +1,85 @@
+import shutil
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from nwb_io.cache import SessionCache
+from nwb_io.load import NwbData
+from nwb_io.qc import TraceStats
+from nwb_io.raster import cached_trace_raster, trace_raster
+
+
+def reference_raster(data, n_bins, zscore):
+    data = np.asarray(data, dtype=np.float64)
+    if zscore:
+        data = (data - np.nanmean(data, axis=0)) / np.nanstd(data, axis=0)
+    bounds = np.linspace(0, len(data), n_bins + 1).astype(int)
+    return np.stack([np.nanmean(data[a:b], axis=0) for a, b in zip(bounds[:-1], bounds[1:])], axis=1)
+
+
+@pytest.mark.parametrize('zscore', [False, True])
+def test_raster_is_independent_of_the_block_size(zscore):
+    data = np.random.default_rng(0).normal(5, 2, (1000, 6))
+    data[10:30, 2] = np.nan
+    expected = reference_raster(data, 37, zscore)
+    for block_bytes in (8 * 6, 8 * 6 * 50, 1 << 26):
+        starts, raster = trace_raster(data, 37, zscore, block_bytes=block_bytes)
+        np.testing.assert_array_equal(starts, np.linspace(0, 1000, 38).astype(int)[:-1])
+        np.testing.assert_allclose(raster, expected, rtol=1e-5, atol=1e-5)
+
+
+def test_raster_keeps_every_frame_without_bins():
+    data = np.arange(12.0).reshape(6, 2)
+    starts, raster = trace_raster(data, None, zscore=False)
+    np.testing.assert_array_equal(starts, np.arange(6))
+    np.testing.assert_array_equal(raster, data.T)
+
+
+def _series(nwb, reads, key='Trial2_DMD1'):
+    # The series with every read of its data recorded
+    series = nwb.index.series[key].series
+    return SimpleNamespace(name=series.name, data=_CountingDataset(series.data, reads), timestamps=series.timestamps)
+
+
+def test_cached_raster_hit_and_invalidation(nwb_path, tmp_path):
+    path = shutil.copy(nwb_path, tmp_path / 'session.nwb')
+    cache = SessionCache(tmp_path / 'cache')
+    with NwbData(path) as nwb:
+        reads = []
+        series = _series(nwb, reads)
+        expected_times, expected = cached_trace_raster(None, path, series, n_bins=50)
+        stats = TraceStats()
+        times, raster = cached_trace_raster(cache, path, series, n_bins=50, stats=stats)
+        np.testing.assert_array_equal(times, expected_times)
+        np.testing.assert_array_equal(raster, expected)
+
+        # A hit reads nothing from the series and restores the statistics
+        reads.clear()
+        restored = TraceStats()
+        times, raster = cached_trace_raster(cache, path, series, n_bins=50, stats=restored)
+        np.testing.assert_array_equal(raster, expected)
+        assert not reads
+        for name, value in stats.result().items():
+            np.testing.assert_array_equal(restored.result()[name], value)
+
+        # Other bins or scaling are other rasters
+        cached_trace_raster(cache, path, series, n_bins=50, zscore=False)
+        assert reads
+
+    with open(path, 'ab') as f:
+        f.write(b'\0')
+    assert cache.load(path, 'raster/Trial2_DMD1/50_z') is None
+
+
+class _CountingDataset:
+    # Dataset wrapper recording every read
+    def __init__(self, dataset, reads):
+        self.dataset = dataset
+        self.reads = reads
+        self.shape = dataset.shape
+        self.dtype = dataset.dtype
+
+    def __getitem__(self, key):
+        self.reads.append(key)
+        return self.dataset[key]
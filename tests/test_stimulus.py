@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+from conftest import STIMULUS_FEATURES
+
+from nwb_io.load import NwbData
+from nwb_io.stimulus import frame_stimulus_index, stimulus_feature_matrix
+
+
+def baseline_stimulus_ts(t, trial_stimuli, features):
+    # add_stimulus_timeseries before the interval search: one boolean mask per stimulus row
+    stim_ts = {feat: np.full_like(t, np.nan, dtype=float) for feat in features}
+    for _, row in trial_stimuli.iterrows():
+        stim_mask = (t >= row['start_time']) & (t <= row['stop_time'])
+        for feat in features:
+            stim_ts[feat][stim_mask] = row[feat]
+    return stim_ts
+
+
+def test_add_stimulus_timeseries_matches_baseline(nwb_path):
+    with NwbData(nwb_path) as nwb:
+        stim_df = nwb.load_stimulus_data()
+        dff = nwb.add_stimulus_timeseries(nwb.load_dFoverF_data(), stim_df)
+
+    stim_df['trial'] = stim_df['trial'].astype(int)
+    for trial_id, trial_data in dff.items():
+        expected = baseline_stimulus_ts(trial_data['time'], stim_df[stim_df['trial'] == trial_id], STIMULUS_FEATURES)
+        assert list(trial_data['stim_ts']) == list(STIMULUS_FEATURES)
+        assert np.isfinite(expected['orientation']).any()
+        for feat in STIMULUS_FEATURES:
+            np.testing.assert_array_equal(trial_data['stim_ts'][feat], expected[feat])
+
+
+def test_overlapping_stimuli_and_unsorted_frames():
+    rng = np.random.default_rng(1)
+    t = np.round(rng.random(500) * 10, 2)  # unsorted, with repeated times
+    start = np.round(rng.random(40) * 10, 2)
+    stimuli = pd.DataFrame({'start_time': start, 'stop_time': start + np.round(rng.random(40), 2),
+                            'value': np.arange(40.0)})
+    expected = baseline_stimulus_ts(t, stimuli, ['value'])['value']
+
+    np.testing.assert_array_equal(
+        stimulus_feature_matrix(t, stimuli['start_time'], stimuli['stop_time'], stimuli[['value']])[:, 0], expected)
+    index = frame_stimulus_index(t, stimuli['start_time'], stimuli['stop_time'])
+    np.testing.assert_array_equal(index >= 0, np.isfinite(expected))
+
+
+def test_no_stimuli():
+    t = np.arange(10.0)
+    assert (frame_stimulus_index(t, [], []) == -1).all()
+    assert np.isnan(stimulus_feature_matrix(t, [], [], np.zeros((0, 2)))).all()
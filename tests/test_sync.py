@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+
+from conftest import TRIALS, trial_timestamps, write_harp_register
+from test_harp_bin import DEVICE_YML
+
+from nwb_io.harp_bin import HarpDevice
+from nwb_io.load import NwbData
+from nwb_io.sync import ClockSync, match_events
+
+DRIFT = 40e-6
+OFFSET = -987.654
+
+
+def pulse_trains(n=200, seed=0):
+    """
+    Trial start pulses on the Harp clock and the matching trial starts on the NWB clock (drift,
+    offset and up to 0.2 ms of jitter), with missing pulses, missing trials, spurious pulses and
+    30 ms outliers. Returns both trains and the times of the true pairs on both clocks.
+    """
+    rng = np.random.default_rng(seed)
+    harp = 2000 + np.cumsum(rng.uniform(8, 12, n))
+    nwb = harp * (1 + DRIFT) + OFFSET + rng.uniform(-2e-4, 2e-4, n)
+    outliers = np.array([20, 120])
+    nwb[outliers] += 0.03
+    missing_pulses = np.array([5, 6, 50, 199])
+    missing_trials = np.array([0, 77, 150])
+    keep_harp = np.setdiff1d(np.arange(n), missing_pulses)
+    keep_nwb = np.setdiff1d(np.arange(n), missing_trials)
+    spurious = harp[[30, 90]] + 3.7
+    harp_train = np.sort(np.concatenate([harp[keep_harp], spurious]))
+    pairs = np.setdiff1d(np.intersect1d(keep_harp, keep_nwb), outliers)
+    return harp_train, nwb[keep_nwb], harp[pairs], nwb[pairs]
+
+
+def test_match_events_with_missing_and_spurious_events():
+    harp, nwb, harp_pairs, nwb_pairs = pulse_trains()
+    h, m = match_events(harp, nwb, clock=ClockSync(1 + DRIFT, OFFSET))
+    matched = dict(zip(harp[h], nwb[m]))
+    # Every true pair is found, and nothing else but the outliers (still within tolerance)
+    assert set(harp_pairs) <= set(matched)
+    assert len(matched) == len(harp_pairs) + 2
+    np.testing.assert_array_equal([matched[t] for t in harp_pairs], nwb_pairs)
+    assert len(np.unique(m)) == len(m)
+
+    # Without a clock the offset most pairs agree on is used: drift moves the pairs of a long
+    # session out of tolerance, not those of a few minutes
+    h, m = match_events(harp[:20], nwb)
+    found = dict(zip(harp[h], nwb[m]))
+    assert set(harp[:20]) & set(harp_pairs) <= set(found) <= set(matched)
+    assert all(found[t] == matched[t] for t in found)
+
+    empty = match_events([], nwb)
+    assert len(empty[0]) == len(empty[1]) == 0
+
+
+@pytest.mark.parametrize('piecewise', [True, False])
+def test_fit_recovers_drift_and_offset(piecewise):
+    harp, nwb, harp_pairs, nwb_pairs = pulse_trains()
+    sync = ClockSync.fit(harp, nwb, piecewise=piecewise)
+    assert sync.drift_ppm == pytest.approx(DRIFT * 1e6, abs=0.5)
+    assert sync.intercept == pytest.approx(OFFSET, abs=5e-3)
+    # Jitter-level error at the true pairs, far below the 30 ms outliers
+    assert np.abs(sync(harp_pairs) - nwb_pairs).max() < 1.5e-3
+    if piecewise:
+        assert len(sync.harp_events) == len(harp_pairs)
+        np.testing.assert_allclose(sync(harp_pairs), nwb_pairs, atol=1e-9)
+    t = np.linspace(harp[0] - 100, harp[-1] + 100, 1001)
+    np.testing.assert_allclose(sync.nwb_to_harp(sync.harp_to_nwb(t)), t, atol=1e-9)
+
+
+def test_fit_follows_a_drift_change():
+    harp = 1000 + np.arange(300) * 10.0
+    # Drift going from 20 to -30 ppm over 500 s half way, e.g. as the rig warms up
+    drift = 20e-6 - 50e-6 / (1 + np.exp(-(harp - harp[150]) / 100))
+    nwb = 5.0 + harp[0] + np.concatenate([[0], np.cumsum(np.diff(harp) * (1 + drift[1:]))])
+    sync = ClockSync.fit(harp, nwb)
+    assert len(sync.harp_events) == len(harp)
+    np.testing.assert_allclose(sync(harp), nwb, atol=1e-9)
+    # Between pulses the mapping is off by the curvature of the drift only
+    midpoints = (harp[:-1] + harp[1:]) / 2
+    truth = nwb[:-1] + (midpoints - harp[:-1]) * (1 + drift[1:])
+    assert np.abs(sync(midpoints) - truth).max() < 1e-5
+    assert np.abs(ClockSync.fit(harp, nwb, piecewise=False)(midpoints) - truth).max() > 1e-3
+
+
+def test_mapping_outside_the_pairs():
+    sync = ClockSync(1 + DRIFT, OFFSET, [100.0, 200.0, 300.0], [0.002, -0.001, 0.003])
+    np.testing.assert_allclose(sync([100.0, 150.0, 300.0]),
+                               np.array([100.0, 150.0, 300.0]) * (1 + DRIFT) + OFFSET + [0.002, 0.0005, 0.003])
+    # Beyond the edge pairs their residuals are held: the line's slope, through the edge pair
+    outside = np.array([-1000.0, 50.0, 350.0, 5000.0])
+    expected = outside * (1 + DRIFT) + OFFSET + [0.002, 0.002, 0.003, 0.003]
+    np.testing.assert_allclose(sync(outside), expected, rtol=0, atol=1e-9)
+    np.testing.assert_allclose(sync.nwb_to_harp(expected), outside, rtol=0, atol=1e-9)
+
+
+def test_fit_trains_and_errors():
+    harp, nwb, harp_pairs, nwb_pairs = pulse_trains()
+    # Stop pulses 2 s after the starts
+    sync = ClockSync.fit_trains([(harp, nwb), (harp + 2, nwb + 2 * (1 + DRIFT))])
+    assert sync.drift_ppm == pytest.approx(DRIFT * 1e6, abs=0.5)
+    assert len(sync.harp_events) == 2 * len(harp_pairs)
+
+    with pytest.raises(ValueError, match='No events matched'):
+        ClockSync.fit([1.0, 2.0], [])
+    with pytest.raises(ValueError, match='order'):
+        ClockSync(1.0, 0.0, [1.0, 2.0], [0.0, -1.5])
+
+
+def test_session_clock(nwb_path, tmp_path):
+    nwb_starts = np.array([trial_timestamps(trial_id)[0] for trial_id in sorted(TRIALS)])
+    pulses = (nwb_starts - OFFSET) / (1 + DRIFT)
+    # A spurious pulse before the session
+    pulses = np.concatenate([[pulses[0] - 15], pulses])
+    write_harp_register(tmp_path / 'Behavior_50.bin', 50, pulses, np.ones(len(pulses)), np.uint16)
+    (tmp_path / 'device.yml').write_bytes(DEVICE_YML)
+
+    with NwbData(nwb_path) as nwb:
+        sync = nwb.harp_clock(HarpDevice(tmp_path))
+    np.testing.assert_allclose(sync(pulses[1:]), nwb_starts, atol=1e-4)
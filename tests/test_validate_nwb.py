@@ -0,0 +1,266 @@
+import csv
+import importlib.util
+import json
+import multiprocessing
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from nwb_io.masks import SparseRoiMasks
+
+SCRIPT = Path(__file__).resolve().parents[1] / 'code' / 'data-access' / 'validate_nwb_slap2.py'
+
+
+@pytest.fixture(scope='module')
+def validate():
+    spec = importlib.util.spec_from_file_location('validate_nwb_slap2', SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    # Registered so that its FigureJobs can be pickled to the render pool
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    yield module
+    del sys.modules[spec.name]
+
+
+def render_square(size, color='k'):
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(size, size))
+    fig.subplots().plot([0, 1], [0, 1], color=color)
+    return fig
+
+
+def render_error(size):
+    raise ValueError(f"Cannot draw {size}")
+
+
+def square_jobs(validate, output_dir, n=6, failing=()):
+    return [validate.FigureJob(os.path.join(output_dir, f'square{i}.png'),
+                               render_error if i in failing else render_square, [f'input{i}'], size=1 + i % 2)
+            for i in range(n)]
+
+
+def overlapping_masks(n_rois=8, shape=(30, 40), seed=0):
+    # Overlapping ROIs touching the image border, with holes, weights above 1 and negative weights
+    rng = np.random.default_rng(seed)
+    masks = np.zeros((n_rois,) + shape)
+    for roi in range(n_rois - 1):
+        y, x = rng.integers(0, shape[0] - 4), rng.integers(0, shape[1] - 4)
+        region = masks[roi, y:y + 8, x:x + 9]
+        region[:] = rng.random(region.shape) * 1.6 + 0.05
+        region[3, 3] = 0
+        region[2, 1] = -0.5
+    return masks
+
+
+def reference_outlines(masks):
+    # mask - binary_erosion(mask) > 0 for every ROI on its own
+    y, x, roi = [], [], []
+    for i, mask in enumerate(masks):
+        nonzero = np.pad(mask != 0, 1)
+        eroded = (nonzero[1:-1, 1:-1] & nonzero[:-2, 1:-1] & nonzero[2:, 1:-1] &
+                  nonzero[1:-1, :-2] & nonzero[1:-1, 2:])
+        yy, xx = np.nonzero(mask - eroded > 0)
+        y.append(yy), x.append(xx), roi.append(np.full(len(yy), i))
+    return np.concatenate(y), np.concatenate(x), np.concatenate(roi)
+
+
+def test_outlines_match_per_roi_erosion(validate):
+    masks = overlapping_masks()
+    sparse = SparseRoiMasks.from_dense(masks)
+    for actual, expected in zip(validate._roi_outlines(sparse), reference_outlines(masks)):
+        np.testing.assert_array_equal(actual, expected)
+
+    # Pixel masks in any order, with a repeated pixel whose last weight counts
+    rows = [sparse.pixel_mask(roi)[::-1] for roi in range(sparse.n_rois)]
+    rows[0] = np.vstack([rows[0][:1] * [1, 1, 0], rows[0]])
+    shuffled = SparseRoiMasks.from_pixel_masks(rows, sparse.image_shape)
+    for actual, expected in zip(validate._roi_outlines(shuffled), reference_outlines(masks)):
+        np.testing.assert_array_equal(actual, expected)
+
+
+def test_label_images(validate):
+    masks = overlapping_masks()
+    sparse = SparseRoiMasks.from_dense(masks)
+    positive = np.zeros(masks.shape[1:], dtype=np.int32)
+    listed = np.zeros(masks.shape[1:], dtype=np.int32)
+    for roi, mask in enumerate(masks):
+        positive[mask > 0] = roi + 1
+        listed[mask != 0] = roi + 1
+    np.testing.assert_array_equal(validate._label_image(sparse, positive=True), positive)
+    np.testing.assert_array_equal(validate._label_image(sparse), listed)
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_render_figures(validate, tmp_path, workers):
+    jobs = square_jobs(validate, tmp_path, failing={3})
+    results = list(validate.render_figures(iter(jobs), workers=workers))
+    assert sorted(str(r.path) for r in results) == sorted(str(job.path) for job in jobs)
+    failed = [r for r in results if not r.ok]
+    assert [r.path for r in failed] == [jobs[3].path]
+    assert 'Cannot draw 2' in failed[0].error
+    assert all(os.path.getsize(job.path) > 0 for i, job in enumerate(jobs) if i != 3)
+    assert not os.path.exists(jobs[3].path)
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_render_figures_loads_jobs_lazily(validate, tmp_path, workers):
+    # The pool takes jobs as it frees up: at most two per worker are loaded ahead of the saves
+    loaded = []
+
+    def jobs():
+        for i, job in enumerate(square_jobs(validate, tmp_path, n=12)):
+            job.load = lambda i=i: loaded.append(i) or {'color': 'r'}
+            yield job
+
+    for n_done, result in enumerate(validate.render_figures(jobs(), workers=workers), 1):
+        assert result.ok
+        assert len(loaded) <= n_done + 2 * workers - 1
+    assert sorted(loaded) == list(range(12))
+
+
+def test_render_all_skips_current_figures(validate, tmp_path, capsys):
+    (tmp_path / 'session.nwb').write_bytes(b'nwb')
+    fingerprint = validate.file_fingerprint(tmp_path / 'session.nwb')
+    manifest = validate.ValidationManifest(tmp_path, fingerprint, 'v1')
+    results = validate._render_all(square_jobs(validate, tmp_path, failing={1}), manifest=manifest)
+    assert [r.ok for r in results] == [True, False, True, True, True, True]
+    assert 'Could not render' in capsys.readouterr().out
+
+    # Only the failed figure and the one whose inputs changed are rendered again, without loading the others
+    manifest = validate.ValidationManifest(tmp_path, fingerprint, 'v1')
+    jobs = square_jobs(validate, tmp_path)
+    jobs[4].inputs = ['other']
+    for job in jobs:
+        job.load = lambda path=job.path: {} if path in (jobs[1].path, jobs[4].path) else pytest.fail(path)
+    results = validate._render_all(jobs, manifest=manifest)
+    assert [r.path for r in results] == [jobs[1].path, jobs[4].path]
+    assert manifest.skipped == 4
+
+    # A new render version renders everything
+    manifest = validate.ValidationManifest(tmp_path, fingerprint, 'v2')
+    assert len(validate._render_all(square_jobs(validate, tmp_path), manifest=manifest)) == 6
+
+
+def test_up_to_date_stages_are_not_built(validate, nwb_path, tmp_path, monkeypatch):
+    validate.validate_nwb(nwb_path, tmp_path, workers=1)
+    manifest = validate.ValidationManifest.read(tmp_path)
+    assert manifest['complete']
+    assert sorted(manifest['stages']) == ['masks', 'metadata', 'stimulus', 'summary_images', 'traces']
+    figures = sorted(manifest['figures'])
+    assert sorted(sum(manifest['stages'].values(), [])) == figures
+
+    # With a trace figure gone, only the trace jobs are built: no summary image or mask is read
+    def not_built(*args, **kwargs):
+        raise AssertionError('built the jobs of an up-to-date stage')
+
+    for builder in ('metadata_jobs', 'stimulus_info_jobs', 'summary_frames', 'summary_image_jobs',
+                    'segmentation_mask_jobs'):
+        monkeypatch.setattr(validate, builder, not_built)
+    os.remove(tmp_path / 'trial_2_traces.png')
+    validate.validate_nwb(nwb_path, tmp_path, workers=1)
+    assert os.path.exists(tmp_path / 'trial_2_traces.png')
+    manifest = validate.ValidationManifest.read(tmp_path)
+    assert manifest['complete'] and sorted(manifest['figures']) == figures
+
+
+def fake_validation(nwb_path, output_dir, **options):
+    # Stands in for validate_nwb in batch workers (forked, so the patch reaches them): the file
+    # name says how the validation goes
+    name = os.path.basename(nwb_path)
+    if 'error' in name:
+        raise RuntimeError(f"Cannot read {name}")
+    if 'crash' in name:
+        os._exit(3)
+    if 'hang' in name:
+        time.sleep(60)
+    with open(os.path.join(output_dir, 'validation_manifest.json'), 'w') as f:
+        json.dump({'complete': 'incomplete' not in name, 'figures': {'metadata.png': {}},
+                   'session': {'n_trials': 3, 'n_series': 6, 'n_rois': {'DMD1': 7, 'DMD2': 5}, 'n_stimuli': 40}}, f)
+    with open(os.path.join(output_dir, 'qc_metrics.json'), 'w') as f:
+        json.dump({'headline': {'median_snr': 2.5, 'workers': options['workers']}}, f)
+    print(f"validated {name}")
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork', reason='patches the forked batch workers')
+def test_batch_isolates_failures(validate, tmp_path, monkeypatch):
+    monkeypatch.setattr(validate, 'validate_nwb', fake_validation)
+    names = ['a_ok', 'b_error', 'c_crash', 'd_hang', 'e_incomplete', 'f_ok']
+    for name in names:
+        (tmp_path / f'{name}.nwb').touch()
+
+    tic = time.perf_counter()
+    records = validate.validate_batch(tmp_path, output_root=tmp_path / 'out', jobs=3, timeout=3, workers=2)
+    # The hanging file is killed at the timeout while the others go on
+    assert time.perf_counter() - tic < 30
+    assert [r['nwb_path'] for r in records] == [str(tmp_path / f'{name}.nwb') for name in names]
+    assert [r['status'] for r in records] == ['ok', 'error', 'error', 'timeout', 'incomplete', 'ok']
+    assert records[1]['error'] == 'RuntimeError: Cannot read b_error.nwb'
+    assert records[2]['error'] == 'Process exited with code 3'
+    assert records[3]['error'] == 'Killed after 3s' and records[3]['elapsed'] >= 3
+
+    ok = records[0]
+    assert ok['output_dir'] == str(tmp_path / 'out' / 'a_ok')
+    assert (ok['n_trials'], ok['n_series'], ok['n_rois'], ok['n_stimuli'], ok['n_figures']) == (3, 6, 12, 40, 1)
+    assert ok['median_snr'] == 2.5 and ok['error'] is None
+    assert records[1]['n_trials'] is None and records[1]['median_snr'] is None
+    # Output and tracebacks of every worker go to its log
+    assert (tmp_path / 'out' / 'a_ok' / 'validation.log').read_text() == 'validated a_ok.nwb\n'
+    assert 'Traceback' in (tmp_path / 'out' / 'b_error' / 'validation.log').read_text()
+
+    with open(validate.write_batch_summary(records, tmp_path / 'summary.csv'), newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert [row['status'] for row in rows] == [r['status'] for r in records]
+    assert list(rows[0]) == list(records[0])
+    with open(validate.write_batch_summary(records, tmp_path / 'summary.json')) as f:
+        summary = json.load(f)
+    assert (summary['n_files'], summary['n_ok']) == (6, 2)
+    assert summary['files'] == records
+
+
+def test_batch_output_dirs(validate, tmp_path):
+    paths = [tmp_path / 'a' / 'session.nwb', tmp_path / 'b' / 'other.nwb']
+    assert validate._batch_output_dirs(paths, None) == [str(tmp_path / 'a' / 'validation' / 'session'),
+                                                        str(tmp_path / 'b' / 'validation' / 'other')]
+    # Stems that are not unique are prefixed with their folder
+    paths[1] = tmp_path / 'b' / 'session.nwb'
+    assert validate._batch_output_dirs(paths, 'out') == [os.path.join('out', 'a_session'), os.path.join('out', 'b_session')]
+
+
+def test_session_qc_headline(validate, tmp_path):
+    qc = validate.SessionQC('abc')
+    for name, n_frames, rois, dt in [('Trial1_DMD1', 100, [[1.0, 2.0], [3.0, 5.0]], 0.01), ('Trial1_DMD2', 300, [[4.0]], 0.02)]:
+        stats = validate.TraceStats()
+        data = np.random.default_rng(0).normal(0, 1, (n_frames, len(rois[0])))
+        data[:len(rois) * 10, 0] = np.nan
+        stats.update(data)
+        t = np.arange(n_frames) * dt
+        t[50:] += 2 * dt
+        qc.add_series(name, stats, t)
+    qc.add_plane('DMD1', [10, 20, 40])
+    qc.add_plane('DMD2', [30])
+    qc.set_stimuli({'n_presentations': 12})
+
+    path = qc.write(tmp_path, {'identifier': 'session'})
+    with open(path) as f:
+        record = json.load(f)
+    snr = np.concatenate([qc.entries['series'][name]['snr'] for name in ('Trial1_DMD1', 'Trial1_DMD2')])
+    headline = record['headline']
+    assert headline['median_snr'] == pytest.approx(np.median(snr))
+    # 20 NaN frames of 200 values in DMD1, 10 of 300 in DMD2; fractions are stored to 6 decimals
+    assert headline['nan_fraction'] == pytest.approx(30 / 500, rel=1e-5)
+    assert headline['median_dt_ms'] == pytest.approx(15)
+    assert headline['max_dt_std_ms'] == pytest.approx(np.diff(np.r_[np.arange(50), np.arange(50, 300) + 2]).std() * 20)
+    assert headline['missing_frames'] == 4
+    assert headline['median_roi_area'] == 25
+    assert (record['identifier'], record['n_series'], record['n_rois']) == ('session', 2, 3)
+    assert record['stimuli'] == {'n_presentations': 12}
+    assert record['planes']['DMD1']['area']['max'] == 40
+
+    # Entries of another file are not reused
+    assert validate.SessionQC('abc', qc.entries).entries is qc.entries
+    assert validate.SessionQC('other', qc.entries).entries['series'] == {}
@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+
+from conftest import ANCHOR, write_harp_register
+from test_harp_bin import DEVICE_YML
+
+from nwb_io.harp_bin import HarpDevice
+from nwb_io.load import NwbData
+from nwb_io.sync import ClockSync
+from nwb_io.wheel import WheelSpeed, cm_per_count, running_speed, unwrap_counts
+
+signal = pytest.importorskip('scipy.signal')
+
+RATE = 1000.0
+
+
+def encoder(duration=20.0, seed=0):
+    # Harp times and int16 counter of a wheel turning back and forth fast enough to roll over
+    rng = np.random.default_rng(seed)
+    times = 1000 + np.arange(int(duration * RATE)) / RATE
+    velocity = 40 * np.sin(2 * np.pi * 0.2 * (times - times[0])) + rng.normal(0, 2, len(times))
+    position = np.cumsum(np.round(velocity)).astype(np.int64)
+    return times, ((position + (1 << 15)) % (1 << 16) - (1 << 15)).astype(np.int16), position
+
+
+def blocks_of(times, counts, size):
+    return [(times[i:i + size], counts[i:i + size]) for i in range(0, len(times), size)]
+
+
+def test_unwrap_rollover():
+    _, counts, position = encoder()
+    assert counts.min() < -30000 and counts.max() > 30000
+    steps = unwrap_counts(counts)
+    np.testing.assert_array_equal(np.cumsum(steps), position - position[0])
+
+    # Across blocks, from the last count of the previous block
+    np.testing.assert_array_equal(unwrap_counts([-32767, -32760], previous=32760), [9, 7])
+    np.testing.assert_array_equal(unwrap_counts([32760], previous=-32767), [-9])
+    np.testing.assert_array_equal(unwrap_counts([250, 3], previous=5, bits=8), [-11, 9])
+
+
+def test_speed_matches_reference_filter():
+    times, counts, position = encoder()
+    sos = signal.butter(2, 10.0, fs=RATE, output='sos')
+    raw = np.diff(position, prepend=position[0]) * 0.5 * RATE
+
+    t, speed = running_speed([(times, counts)], 0.5)
+    np.testing.assert_array_equal(t, times)
+    np.testing.assert_allclose(speed, signal.sosfiltfilt(sos, raw, padlen=9), atol=1e-9)
+
+    t, speed = running_speed([(times, counts)], 0.5, zero_phase=False)
+    np.testing.assert_allclose(speed, signal.sosfilt(sos, raw, zi=signal.sosfilt_zi(sos) * raw[0])[0], atol=1e-9)
+
+
+@pytest.mark.parametrize('zero_phase', [True, False])
+@pytest.mark.parametrize('block_size', [7, 333, 5000])
+def test_speed_is_independent_of_the_block_size(zero_phase, block_size):
+    times, counts, _ = encoder()
+    _, whole = running_speed([(times, counts)], zero_phase=zero_phase)
+    t, speed = running_speed(blocks_of(times, counts, block_size), zero_phase=zero_phase)
+    np.testing.assert_array_equal(t, times)
+    # Zero-phase blocks are filtered with padding seconds of context: the filter has decayed
+    # far below the counter resolution there
+    np.testing.assert_allclose(speed, whole, atol=1e-6 * np.abs(whole).max() if zero_phase else 1e-9)
+
+
+def test_speed_at_sample_times():
+    times, counts, _ = encoder()
+    t, speed = running_speed([(times, counts)], 0.5)
+    sample_times = np.concatenate([[times[0] - 1], np.linspace(times[10], times[-10], 777), [times[-1] + 1]])
+    at_samples = running_speed(blocks_of(times, counts, 1000), 0.5, sample_times)
+    assert np.isnan(at_samples[[0, -1]]).all()
+    np.testing.assert_allclose(at_samples[1:-1], np.interp(sample_times[1:-1], t, speed), atol=1e-6 * np.abs(speed).max())
+
+
+def test_clock_maps_encoder_times():
+    times, counts, _ = encoder()
+    clock = ClockSync(1.0001, -900.0)
+    wheel = WheelSpeed(sample_times=clock(times[100:200]), clock=clock)
+    for t, c in blocks_of(times, counts, 1000):
+        wheel.update(t, c)
+    _, speed = running_speed([(clock(times), counts)])
+    np.testing.assert_allclose(wheel.finish(), speed[100:200], atol=1e-6 * np.abs(speed).max())
+
+
+def test_first_block_needs_two_samples():
+    with pytest.raises(ValueError):
+        WheelSpeed().update([1.0], [0])
+
+
+def test_cm_per_count():
+    assert cm_per_count(20.0, 1000) == pytest.approx(np.pi * 20 / 1000)
+
+
+def test_add_running_speed(nwb_path, tmp_path):
+    # Harp clock: NWB time plus 900 s, encoder turning at a constant 300 counts/s
+    times = ANCHOR + 900 - 1 + np.arange(int(80 * RATE)) / RATE
+    counts = ((np.arange(len(times)) * 300 // int(RATE)) % (1 << 16) - (1 << 15)).astype(np.int16)
+    analog = np.zeros((len(times), 3), dtype=np.int16)
+    analog[:, 1] = counts
+    write_harp_register(tmp_path / 'Behavior_44.bin', 44, times, analog, np.int16)
+    (tmp_path / 'device.yml').write_bytes(DEVICE_YML)
+    register = HarpDevice(tmp_path).register('AnalogData')
+    encoder_blocks = ((t, ch['Encoder']) for t, ch in register.blocks(['Encoder'], block_frames=4096))
+
+    with NwbData(nwb_path) as nwb:
+        dff = nwb.add_running_speed(nwb.load_dFoverF_data(), encoder_blocks, 0.1, ClockSync(1.0, -900.0))
+        for trial_data in dff.values():
+            assert trial_data['running_speed'].shape == trial_data['time'].shape
+            np.testing.assert_allclose(trial_data['running_speed'], 30.0, rtol=1e-3)
+
+        encoder_blocks = ((t, ch['Encoder']) for t, ch in register.blocks(['Encoder']))
+        with pytest.raises(ValueError, match='overlap'):
+            nwb.add_running_speed(dff, encoder_blocks, 0.1, ClockSync(1.0, 0.0))